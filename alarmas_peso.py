@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import threading
+import urllib.request
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema
+from ingesta_peso import registrar_consumidor, fecha_local
+
+logger = logging.getLogger(__name__)
+
+# Objetivos de peso sauciso por código: JSON en PESO_ALARMAS o en el archivo PESO_ALARMAS_ARCHIVO, ej:
+# {"defecto": {"tolerancia": 0.10}, "12345": {"objetivo": 2.0, "tolerancia": 0.08}}
+# - objetivo: peso sauciso esperado (kg); códigos sin objetivo no generan alarmas
+# - tolerancia: desvío (kg) que activa la alarma
+# - histeresis: margen (kg) dentro de la banda que hay que recuperar para normalizar
+# - pesajes_activar / pesajes_normalizar: pesajes consecutivos para cambiar de estado
+CONFIGURACION_POR_DEFECTO = {
+    'defecto': {'tolerancia': 0.10, 'histeresis': 0.02, 'pesajes_activar': 2, 'pesajes_normalizar': 3},
+}
+RUTA_CONFIGURACION_ALARMAS = os.environ.get(
+    "PESO_ALARMAS_ARCHIVO",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "alarmas.json")
+)
+# Archivo de registro de alarmas y webhook opcional (POST JSON por cada alarma)
+RUTA_LOG_ALARMAS = os.environ.get(
+    "PESO_ALARMAS_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_local", "alarmas.log")
+)
+URL_WEBHOOK_ALARMAS = os.environ.get("PESO_ALARMAS_WEBHOOK", "")
+# Pesajes más antiguos que esto no se evalúan (carga inicial y recargas de historia)
+MINUTOS_ANTIGUEDAD_ALARMA = int(os.environ.get("PESO_ALARMAS_ANTIGUEDAD_MINUTOS", "60"))
+
+ESQUEMA_ALARMAS = """
+CREATE TABLE IF NOT EXISTS alarmas_peso (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    FECHAINGRESO TEXT NOT NULL,
+    CODIGO TEXT NOT NULL,
+    ODP TEXT NOT NULL,
+    evento TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    peso_sauciso REAL NOT NULL,
+    objetivo REAL NOT NULL,
+    tolerancia REAL NOT NULL,
+    registrado TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_alarmas_peso_orden ON alarmas_peso (CODIGO, ODP, id);
+"""
+
+
+class MotorAlarmas:
+    """
+    Evalúa cada punto nuevo contra la banda objetivo ± tolerancia de su código.
+    El estado por orden (CODIGO, ODP) es un diccionario: cada pesaje es O(1).
+
+    Histéresis: la alarma se activa tras pesajes_activar pesajes seguidos fuera de la
+    banda y se normaliza tras pesajes_normalizar pesajes seguidos dentro de la banda
+    reducida en histeresis. Solo se emiten los cambios de estado (sin duplicados).
+    """
+
+    def __init__(self, ruta_configuracion=RUTA_CONFIGURACION_ALARMAS):
+        self.ruta_configuracion = ruta_configuracion
+        self.configuracion = {}
+        self.fecha_configuracion = None
+        self.estados = {}    # (CODIGO, ODP) -> {'estado', 'consecutivos', 'ultima'}
+        self.activas = {}    # (CODIGO, ODP) -> evento de activación vigente
+        self.sumideros = []  # funcion(evento)
+        self.restaurado = False
+        self.lock = threading.Lock()
+        self._leer_configuracion()
+
+    def _leer_configuracion(self):
+        """Configuración de PESO_ALARMAS o del archivo (releído si cambia)"""
+        texto = os.environ.get("PESO_ALARMAS")
+        fecha = None
+        if not texto:
+            try:
+                fecha = os.path.getmtime(self.ruta_configuracion)
+            except OSError:
+                fecha = None
+            if fecha is not None and fecha == self.fecha_configuracion:
+                return
+            if fecha is not None:
+                try:
+                    with open(self.ruta_configuracion, encoding="utf-8") as archivo:
+                        texto = archivo.read()
+                except OSError:
+                    return
+        try:
+            configuracion = json.loads(texto) if texto else {}
+        except ValueError as e:
+            logger.warning("Configuración de alarmas inválida: %s", e)
+            return
+        self.configuracion = {
+            'defecto': {**CONFIGURACION_POR_DEFECTO['defecto'], **configuracion.get('defecto', {})},
+            **{str(codigo): valores for codigo, valores in configuracion.items() if codigo != 'defecto'},
+        }
+        self.fecha_configuracion = fecha
+
+    def limites(self, codigo):
+        """Configuración efectiva de un código o None si no tiene objetivo"""
+        config = {**self.configuracion.get('defecto', {}), **self.configuracion.get(str(codigo), {})}
+        return config if config.get('objetivo') is not None else None
+
+    def registrar_sumidero(self, funcion):
+        self.sumideros.append(funcion)
+
+    def _restaurar(self):
+        """Alarmas activas al reiniciar: la última activación de cada orden sin normalización posterior"""
+        asegurar_esquema("alarmas", ESQUEMA_ALARMAS)
+        conn = conectar_almacen_local()
+        try:
+            filas = conn.execute("""
+                SELECT a.FECHAINGRESO, a.CODIGO, a.ODP, a.evento, a.estado, a.peso_sauciso, a.objetivo, a.tolerancia
+                FROM alarmas_peso a
+                JOIN (SELECT CODIGO, ODP, MAX(id) as id FROM alarmas_peso GROUP BY CODIGO, ODP) u ON u.id = a.id
+                WHERE a.evento = 'activada'
+            """).fetchall()
+        finally:
+            conn.close()
+        for fecha, codigo, odp, evento, estado, peso, objetivo, tolerancia in filas:
+            self.estados[(codigo, odp)] = {'estado': estado, 'consecutivos': 0, 'ultima': pd.Timestamp(fecha)}
+            self.activas[(codigo, odp)] = {
+                'FECHAINGRESO': pd.Timestamp(fecha), 'CODIGO': codigo, 'ODP': odp, 'evento': evento,
+                'estado': estado, 'peso_sauciso': peso, 'objetivo': objetivo, 'tolerancia': tolerancia,
+            }
+        self.restaurado = True
+
+    def evaluar(self, fecha, codigo, odp, peso):
+        """Evaluar un pesaje; devuelve el evento emitido o None"""
+        config = self.limites(codigo)
+        if config is None:
+            return None
+        clave = (codigo, odp)
+        estado = self.estados.get(clave)
+        if estado is None:
+            estado = self.estados[clave] = {'estado': 'normal', 'consecutivos': 0, 'ultima': None}
+        # Pesajes repetidos o tardíos de una orden ya evaluada no cambian el estado
+        if estado['ultima'] is not None and fecha <= estado['ultima']:
+            return None
+        estado['ultima'] = fecha
+
+        objetivo, tolerancia = float(config['objetivo']), float(config['tolerancia'])
+        desvio = peso - objetivo
+        fuera = 'alto' if desvio > tolerancia else 'bajo' if desvio < -tolerancia else None
+        if estado['estado'] == 'normal':
+            estado['consecutivos'] = estado['consecutivos'] + 1 if fuera else 0
+            if not fuera or estado['consecutivos'] < int(config['pesajes_activar']):
+                return None
+            estado['estado'], estado['consecutivos'], evento = fuera, 0, 'activada'
+        else:
+            dentro = abs(desvio) <= tolerancia - float(config['histeresis'])
+            estado['consecutivos'] = estado['consecutivos'] + 1 if dentro else 0
+            if not dentro or estado['consecutivos'] < int(config['pesajes_normalizar']):
+                return None
+            estado['estado'], estado['consecutivos'], evento = 'normal', 0, 'normalizada'
+
+        resultado = {
+            'FECHAINGRESO': fecha, 'CODIGO': codigo, 'ODP': odp, 'evento': evento,
+            'estado': estado['estado'],
+            'peso_sauciso': float(peso), 'objetivo': objetivo, 'tolerancia': tolerancia,
+        }
+        if evento == 'activada':
+            self.activas[clave] = resultado
+        else:
+            self.activas.pop(clave, None)
+        return resultado
+
+    def procesar(self, df_puntos, ahora=None):
+        """Evaluar puntos en orden de llegada y enviar los eventos a los sumideros"""
+        limite = pd.Timestamp(ahora or datetime.now()) - timedelta(minutes=MINUTOS_ANTIGUEDAD_ALARMA)
+        df = df_puntos[df_puntos['FECHAINGRESO'] >= limite].sort_values('FECHAINGRESO')
+        eventos = []
+        with self.lock:
+            if not self.restaurado:
+                self._restaurar()
+            self._leer_configuracion()
+            for fecha, codigo, odp, peso in df[['FECHAINGRESO', 'CODIGO', 'ODP', '_PesoSauciso']].itertuples(index=False, name=None):
+                evento = self.evaluar(fecha, codigo, odp, peso)
+                if evento is not None:
+                    eventos.append(evento)
+        for evento in eventos:
+            for sumidero in list(self.sumideros):
+                try:
+                    sumidero(evento)
+                except Exception as e:
+                    logger.warning("Error en sumidero de alarmas: %s", e)
+        return eventos
+
+    def alarmas_activas(self):
+        """Alarmas vigentes por (CODIGO, ODP)"""
+        with self.lock:
+            return dict(self.activas)
+
+# --- Sumideros ---
+def sumidero_sqlite(evento):
+    asegurar_esquema("alarmas", ESQUEMA_ALARMAS)
+    conn = conectar_almacen_local()
+    try:
+        conn.execute(
+            "INSERT INTO alarmas_peso (FECHAINGRESO, CODIGO, ODP, evento, estado, peso_sauciso, objetivo, tolerancia, registrado) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (fecha_local(evento['FECHAINGRESO']), evento['CODIGO'], evento['ODP'], evento['evento'], evento['estado'],
+             evento['peso_sauciso'], evento['objetivo'], evento['tolerancia'], datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def _texto_evento(evento):
+    return (
+        f"Alarma {evento['evento']} ({evento['estado']}) código {evento['CODIGO']} ODP {evento['ODP']}: "
+        f"peso sauciso {evento['peso_sauciso']:.3f} kg, objetivo {evento['objetivo']:.3f} ± {evento['tolerancia']:.3f} "
+        f"({pd.Timestamp(evento['FECHAINGRESO']):%d/%m/%Y %H:%M:%S})"
+    )
+
+_logger_archivo = logging.getLogger(__name__ + ".archivo")
+
+def sumidero_log(evento):
+    if not _logger_archivo.handlers:
+        os.makedirs(os.path.dirname(RUTA_LOG_ALARMAS), exist_ok=True)
+        manejador = logging.FileHandler(RUTA_LOG_ALARMAS, encoding="utf-8")
+        manejador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _logger_archivo.addHandler(manejador)
+        _logger_archivo.setLevel(logging.INFO)
+    _logger_archivo.info(_texto_evento(evento))
+
+def sumidero_webhook(evento, url=None):
+    """POST JSON al webhook configurado en un hilo aparte (no frena la ingesta)"""
+    url = url or URL_WEBHOOK_ALARMAS
+    if not url:
+        return
+    cuerpo = json.dumps({**evento, 'FECHAINGRESO': pd.Timestamp(evento['FECHAINGRESO']).isoformat(),
+                         'texto': _texto_evento(evento)}).encode("utf-8")
+
+    def enviar():
+        try:
+            solicitud = urllib.request.Request(url, data=cuerpo, headers={"Content-Type": "application/json"})
+            urllib.request.urlopen(solicitud, timeout=5).close()
+        except Exception as e:
+            logger.warning("No se pudo enviar la alarma al webhook: %s", e)
+
+    threading.Thread(target=enviar, daemon=True).start()
+
+
+MOTOR_ALARMAS = MotorAlarmas()
+for _sumidero in (sumidero_sqlite, sumidero_log, sumidero_webhook):
+    MOTOR_ALARMAS.registrar_sumidero(_sumidero)
+registrar_consumidor("alarmas", lambda df_nuevos, df_reemplazados: MOTOR_ALARMAS.procesar(df_nuevos))
+
+def ultimas_alarmas(limite=100):
+    """Últimos eventos de alarma registrados"""
+    asegurar_esquema("alarmas", ESQUEMA_ALARMAS)
+    conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(
+            "SELECT FECHAINGRESO, CODIGO, ODP, evento, estado, peso_sauciso, objetivo, tolerancia, registrado "
+            "FROM alarmas_peso ORDER BY id DESC LIMIT ?",
+            conn, params=[int(limite)]
+        )
+    finally:
+        conn.close()
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    return df
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+
+# Ruta del almacen local (SQLite) para agregados y caches persistentes
+RUTA_ALMACEN_LOCAL = os.environ.get(
+    "PESO_EMBUTICION_ALMACEN",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_local", "peso_embuticion.db")
+)
+
+_esquemas_creados = set()
+_lock_esquemas = threading.Lock()
+
+def conectar_almacen_local():
+    """
+    Conexión al almacen local SQLite (una por llamada, igual que conectar_sql_server)
+    """
+    os.makedirs(os.path.dirname(RUTA_ALMACEN_LOCAL), exist_ok=True)
+    conn = sqlite3.connect(RUTA_ALMACEN_LOCAL, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def asegurar_esquema(nombre, script_sql):
+    """
+    Crear tablas del almacen local una sola vez por proceso
+    """
+    if nombre in _esquemas_creados:
+        return
+    with _lock_esquemas:
+        if nombre in _esquemas_creados:
+            return
+        conn = conectar_almacen_local()
+        try:
+            conn.executescript(script_sql)
+            conn.commit()
+        finally:
+            conn.close()
+        _esquemas_creados.add(nombre)
+
+def cargar_claves_temporales(conn, tabla, columnas, filas):
+    """
+    Cargar claves en una tabla temporal de la conexión (reemplaza la anterior) para
+    leer con un JOIN en lugar de una consulta por clave
+    """
+    conn.execute(f"DROP TABLE IF EXISTS temp.{tabla}")
+    conn.execute(f"CREATE TEMP TABLE {tabla} ({', '.join(columnas)}, PRIMARY KEY ({', '.join(columnas)}))")
+    conn.executemany(
+        f"INSERT OR IGNORE INTO temp.{tabla} VALUES ({', '.join('?' * len(columnas))})", filas
+    )
+
+def leer_marca(clave, defecto=None):
+    """Leer un valor de control (marcas de agua, tokens de sincronización)"""
+    asegurar_esquema("marcas", ESQUEMA_MARCAS)
+    conn = conectar_almacen_local()
+    try:
+        fila = conn.execute("SELECT valor FROM marcas WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else defecto
+    finally:
+        conn.close()
+
+def guardar_marca(clave, valor, conn=None):
+    """Guardar un valor de control; si se pasa conn se usa su transacción"""
+    asegurar_esquema("marcas", ESQUEMA_MARCAS)
+    propia = conn is None
+    if propia:
+        conn = conectar_almacen_local()
+    try:
+        conn.execute(
+            "INSERT INTO marcas (clave, valor) VALUES (?, ?) "
+            "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+            (clave, None if valor is None else str(valor))
+        )
+        if propia:
+            conn.commit()
+    finally:
+        if propia:
+            conn.close()
+
+ESQUEMA_MARCAS = """
+CREATE TABLE IF NOT EXISTS marcas (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
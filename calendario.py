@@ -0,0 +1,123 @@
+import os
+import re
+from functools import lru_cache
+from datetime import date, timedelta
+
+import pandas as pd
+
+# Nombres de dia en el orden de pandas (dayofweek: 0 = lunes)
+DIAS_SEMANA = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+# Primer dia de semana de DATEPART(week, ...) en SQL Server (SET DATEFIRST): 7 = domingo (us_english)
+PRIMER_DIA_SEMANA_SQL = int(os.environ.get("PESO_DATEFIRST", "7"))
+
+# Mas de estos rangos se expresan como lista de fechas en lugar de OR de rangos
+MAXIMO_RANGOS_EXPLICITOS = 3
+
+@lru_cache(maxsize=32)
+def construir_calendario(año_inicio, año_fin):
+    """
+    Calendario precalculado (una fila por dia) entre dos años inclusive:
+    fecha, año, semana (igual a DATEPART(week) de SQL Server), año_iso, semana_iso,
+    dia_semana (0 = lunes) y nombre_dia en español
+    """
+    fechas = pd.date_range(date(año_inicio, 1, 1), date(año_fin, 12, 31), freq='D')
+    calendario = pd.DataFrame({'fecha': fechas})
+    calendario['año'] = fechas.year
+    calendario['dia_semana'] = fechas.dayofweek
+    calendario['nombre_dia'] = pd.Categorical.from_codes(calendario['dia_semana'], DIAS_SEMANA)
+
+    # DATEPART(week): la semana 1 contiene el 1 de enero y las semanas empiezan en DATEFIRST
+    inicio_semana = PRIMER_DIA_SEMANA_SQL - 1  # mismo indice que dayofweek
+    primero_enero = pd.to_datetime(dict(year=calendario['año'], month=1, day=1))
+    desfase = (primero_enero.dt.dayofweek - inicio_semana) % 7
+    calendario['semana'] = (fechas.dayofyear - 1 + desfase.values) // 7 + 1
+
+    iso = fechas.isocalendar()
+    calendario['año_iso'] = iso['year'].values
+    calendario['semana_iso'] = iso['week'].values
+    return calendario
+
+def calendario_para_fechas(fechas):
+    """Calendario que cubre una serie de fechas"""
+    fechas = pd.to_datetime(pd.Series(fechas)).dropna()
+    if fechas.empty:
+        return construir_calendario(date.today().year, date.today().year)
+    return construir_calendario(int(fechas.min().year), int(fechas.max().year))
+
+def unir_calendario(df, columna='FECHAINGRESO'):
+    """Agregar las columnas del calendario a un DataFrame por la fecha de una columna datetime"""
+    calendario = calendario_para_fechas(df[columna])
+    return df.assign(fecha=df[columna].dt.normalize()).merge(calendario, on='fecha', how='left')
+
+def resolver_rangos(años, semana=None, dia=None):
+    """
+    Resolver filtros de año/semana/dia a rangos [inicio, fin) de fechas, unidos si son contiguos.
+    años: lista de años; semana: numero de DATEPART(week) o None; dia: nombre en español o None
+    """
+    años = sorted(int(a) for a in años)
+    if not años:
+        return []
+    calendario = construir_calendario(años[0], años[-1])
+    seleccion = calendario['año'].isin(años)
+    if semana is not None:
+        seleccion &= calendario['semana'] == int(semana)
+    if dia is not None:
+        seleccion &= calendario['nombre_dia'] == dia
+    fechas = calendario.loc[seleccion, 'fecha']
+    if fechas.empty:
+        return []
+
+    # Agrupar dias consecutivos en rangos
+    inicio_bloque = fechas.diff() != pd.Timedelta(days=1)
+    bloques = inicio_bloque.cumsum()
+    rangos = []
+    for _, fechas_bloque in fechas.groupby(bloques):
+        rangos.append((fechas_bloque.iloc[0].to_pydatetime(), (fechas_bloque.iloc[-1] + timedelta(days=1)).to_pydatetime()))
+    return rangos
+
+def condicion_fecha(rangos, columna='FECHAINGRESO'):
+    """
+    Condicion SQL para rangos de fechas sin funciones dependientes del idioma.
+    Pocos rangos: OR de comparaciones; muchos dias sueltos: lista de fechas.
+    Literales 'yyyymmdd' (sin separadores): SQL Server los lee igual con cualquier
+    DATEFORMAT, mientras que 'yyyy-mm-dd' contra datetime depende del idioma de la sesion.
+    """
+    if not rangos:
+        return "1=0"
+    if len(rangos) <= MAXIMO_RANGOS_EXPLICITOS:
+        return "(" + " OR ".join(
+            f"({columna} >= '{inicio:%Y%m%d}' AND {columna} < '{fin:%Y%m%d}')" for inicio, fin in rangos
+        ) + ")"
+    fechas = []
+    for inicio, fin in rangos:
+        fechas.extend(pd.date_range(inicio, fin - timedelta(days=1), freq='D'))
+    return f"CAST({columna} AS date) IN (" + ", ".join(f"'{f:%Y%m%d}'" for f in fechas) + ")"
+
+_RANGO = r"\(FECHAINGRESO >= '\d{8}' AND FECHAINGRESO < '\d{8}'\)"
+_PATRON_RANGOS = re.compile(rf"\({_RANGO}(?: OR {_RANGO})*\)")
+_PATRON_LISTA = re.compile(r"CAST\(FECHAINGRESO AS date\) IN \('\d{8}'(?:, '\d{8}')*\)")
+
+def extraer_condiciones_fecha(where_clause, columna_destino='FECHAINGRESO'):
+    """
+    Extraer de un where_clause las condiciones generadas por condicion_fecha,
+    cambiando la columna (ej: FECHAINGRESO -> FechaCreacion)
+    """
+    condiciones = _PATRON_RANGOS.findall(where_clause) + _PATRON_LISTA.findall(where_clause)
+    return [c.replace('FECHAINGRESO', columna_destino) for c in condiciones]
+
+def semanas_de_fechas(fechas):
+    """Semanas (DATEPART(week)) presentes en una serie de fechas, ordenadas"""
+    fechas = pd.to_datetime(pd.Series(fechas)).dt.normalize()
+    calendario = calendario_para_fechas(fechas)
+    return sorted(calendario.loc[calendario['fecha'].isin(fechas), 'semana'].unique().tolist())
+
+def dias_de_fechas(fechas, semana=None):
+    """Nombres de dia presentes en una serie de fechas (opcionalmente de una semana), de lunes a domingo"""
+    fechas = pd.to_datetime(pd.Series(fechas)).dt.normalize()
+    calendario = calendario_para_fechas(fechas)
+    seleccion = calendario['fecha'].isin(fechas)
+    if semana is not None:
+        seleccion &= calendario['semana'] == int(semana)
+    dias = calendario.loc[seleccion, 'dia_semana'].unique()
+    return [DIAS_SEMANA[d] for d in sorted(dias)]
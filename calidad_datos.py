@@ -0,0 +1,199 @@
+import logging
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema
+
+logger = logging.getLogger(__name__)
+
+# Máximo de embalajes razonable para un registro de pesaje
+MAX_EMBALAJES_REGISTRO = float(os.environ.get("PESO_CALIDAD_MAX_EMBALAJES", "500"))
+
+COLUMNAS_REGISTRO_CALIDAD = ['FECHAINGRESO', 'CODIGO', 'ODP', 'PROCESO', 'PESONETO', 'NUMEMBALAJE']
+
+# Reglas de calidad de registros crudos: (nombre, acción, descripción)
+# - cuarentena: el registro no entra a los puntos ni a los agregados
+# - marcar: el registro se usa pero se cuenta como observación
+REGLAS_CALIDAD = [
+    ('fecha_nula', 'cuarentena', 'FECHAINGRESO vacía'),
+    ('codigo_vacio', 'cuarentena', 'CODIGO vacío'),
+    ('peso_nulo', 'cuarentena', 'PESONETO vacío'),
+    ('peso_negativo', 'cuarentena', 'PESONETO negativo'),
+    ('embalajes_invalidos', 'cuarentena', 'NUMEMBALAJE vacío, cero o negativo'),
+    ('embalajes_absurdos', 'cuarentena', f'NUMEMBALAJE mayor a {MAX_EMBALAJES_REGISTRO:g}'),
+    ('duplicado', 'cuarentena', 'ID de registro repetido (el mismo registro leído dos veces)'),
+    ('contenido_repetido', 'marcar', 'Registro sin ID idéntico a otro (puede ser otro pesaje igual)'),
+    ('odp_vacia', 'marcar', 'ODP vacía'),
+]
+
+ESQUEMA_CALIDAD = """
+CREATE TABLE IF NOT EXISTS calidad_registros (
+    huella TEXT NOT NULL,
+    regla TEXT NOT NULL,
+    accion TEXT NOT NULL,
+    FECHAINGRESO TEXT,
+    CODIGO TEXT,
+    ODP TEXT,
+    PROCESO TEXT,
+    PESONETO REAL,
+    NUMEMBALAJE REAL,
+    detectado TEXT NOT NULL,
+    PRIMARY KEY (huella, regla)
+);
+CREATE TABLE IF NOT EXISTS calidad_contadores (
+    regla TEXT PRIMARY KEY,
+    cantidad INTEGER NOT NULL,
+    ultima_deteccion TEXT
+);
+"""
+
+def _mascaras_reglas(df):
+    """Una máscara booleana por regla (True = el registro incumple la regla)"""
+    # Con ID de la fuente solo un ID repetido es un duplicado seguro; sin ID, dos pesajes
+    # legítimos pueden coincidir en todo el contenido y solo se marcan
+    sin_marca = pd.Series(False, index=df.index)
+    if 'ID' in df.columns:
+        duplicado, contenido_repetido = df['ID'].duplicated(keep='first'), sin_marca
+    else:
+        duplicado, contenido_repetido = sin_marca, df[COLUMNAS_REGISTRO_CALIDAD].duplicated(keep='first')
+    return {
+        'fecha_nula': df['FECHAINGRESO'].isna(),
+        'codigo_vacio': df['CODIGO'] == '',
+        'peso_nulo': df['PESONETO'].isna(),
+        'peso_negativo': df['PESONETO'] < 0,
+        'embalajes_invalidos': df['NUMEMBALAJE'].isna() | (df['NUMEMBALAJE'] <= 0),
+        'embalajes_absurdos': df['NUMEMBALAJE'] > MAX_EMBALAJES_REGISTRO,
+        'duplicado': duplicado,
+        'contenido_repetido': contenido_repetido,
+        'odp_vacia': df['ODP'] == '',
+    }
+
+def condicion_calidad_sql(alias=None):
+    """
+    Predicado SQL con las mismas reglas de cuarentena que validar_registros, para que las
+    agregaciones que se hacen en SQL Server sobre vwRegistrosDetallados excluyan los mismos
+    registros que la ingesta local (duplicado no aplica: depende del ID de la fuente de cambios)
+    """
+    p = f"{alias}." if alias else ""
+    return (
+        f"{p}FECHAINGRESO IS NOT NULL AND LTRIM(RTRIM({p}CODIGO)) <> '' "
+        f"AND {p}PESONETO >= 0 AND {p}NUMEMBALAJE > 0 AND {p}NUMEMBALAJE <= {MAX_EMBALAJES_REGISTRO:g}"
+    )
+
+def _huellas(df):
+    """
+    Identificador estable de cada registro (ID de la fuente si existe, si no su contenido
+    y el número de repetición), para registrar cada problema una sola vez aunque la
+    ventana de ingesta vuelva a leer el mismo registro
+    """
+    if 'ID' in df.columns:
+        return df['ID'].astype(str)
+    contenido = df[COLUMNAS_REGISTRO_CALIDAD]
+    repeticion = contenido.groupby(COLUMNAS_REGISTRO_CALIDAD, dropna=False).cumcount()
+    return pd.util.hash_pandas_object(contenido.assign(_repeticion=repeticion), index=False).astype(str)
+
+def validar_registros(df_registros):
+    """
+    Etapa de calidad antes de agregar registros crudos a puntos.
+    Devuelve (DataFrame de registros válidos, DataFrame de observaciones con columnas
+    regla y accion; un registro puede incumplir varias reglas).
+    Las columnas deben venir normalizadas (CODIGO/ODP texto sin NULL, PESONETO y
+    NUMEMBALAJE numéricos).
+    """
+    mascaras = _mascaras_reglas(df_registros)
+    en_cuarentena = pd.Series(False, index=df_registros.index)
+    observaciones = []
+    for regla, accion, _ in REGLAS_CALIDAD:
+        mascara = mascaras[regla].fillna(False)
+        if not mascara.any():
+            continue
+        if accion == 'cuarentena':
+            en_cuarentena |= mascara
+        observaciones.append(df_registros.loc[mascara].assign(regla=regla, accion=accion))
+    if observaciones:
+        df_observaciones = pd.concat(observaciones)
+        df_observaciones['huella'] = _huellas(df_registros).loc[df_observaciones.index].values
+    else:
+        df_observaciones = pd.DataFrame(columns=COLUMNAS_REGISTRO_CALIDAD + ['regla', 'accion', 'huella'])
+    return df_registros.loc[~en_cuarentena], df_observaciones.reset_index(drop=True)
+
+def registrar_observaciones(df_observaciones):
+    """
+    Guardar las observaciones nuevas y sumarlas a los contadores por regla.
+    Las ya registradas (misma huella y regla) no se vuelven a contar.
+    Devuelve {regla: observaciones nuevas}.
+    """
+    if df_observaciones is None or df_observaciones.empty:
+        return {}
+    asegurar_esquema("calidad", ESQUEMA_CALIDAD)
+    detectado = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    fechas = pd.to_datetime(df_observaciones['FECHAINGRESO']).dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+    nuevas = {}
+    conn = conectar_almacen_local()
+    try:
+        for regla, df_regla in df_observaciones.assign(FECHAINGRESO=fechas).groupby('regla'):
+            antes = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO calidad_registros "
+                "(huella, regla, accion, FECHAINGRESO, CODIGO, ODP, PROCESO, PESONETO, NUMEMBALAJE, detectado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (h, regla, a, None if pd.isna(f) else f, c, o, p,
+                     None if pd.isna(pn) else float(pn), None if pd.isna(n) else float(n), detectado)
+                    for h, a, f, c, o, p, pn, n in df_regla[
+                        ['huella', 'accion'] + COLUMNAS_REGISTRO_CALIDAD
+                    ].itertuples(index=False, name=None)
+                ]
+            )
+            cantidad = conn.total_changes - antes
+            if cantidad:
+                nuevas[regla] = cantidad
+                conn.execute(
+                    "INSERT INTO calidad_contadores (regla, cantidad, ultima_deteccion) VALUES (?, ?, ?) "
+                    "ON CONFLICT(regla) DO UPDATE SET cantidad = cantidad + excluded.cantidad, "
+                    "ultima_deteccion = excluded.ultima_deteccion",
+                    (regla, cantidad, detectado)
+                )
+        conn.commit()
+    finally:
+        conn.close()
+    if nuevas:
+        logger.info("Calidad de datos: %s", ", ".join(f"{r}={n}" for r, n in nuevas.items()))
+    return nuevas
+
+def contadores_calidad():
+    """Observaciones acumuladas por regla: DataFrame con Regla, Accion, Descripcion, Cantidad y UltimaDeteccion"""
+    asegurar_esquema("calidad", ESQUEMA_CALIDAD)
+    conn = conectar_almacen_local()
+    try:
+        filas = dict((r, (n, u)) for r, n, u in conn.execute(
+            "SELECT regla, cantidad, ultima_deteccion FROM calidad_contadores"
+        ).fetchall())
+    finally:
+        conn.close()
+    return pd.DataFrame([
+        {
+            'Regla': regla,
+            'Accion': accion,
+            'Descripcion': descripcion,
+            'Cantidad': filas.get(regla, (0, None))[0],
+            'UltimaDeteccion': filas.get(regla, (0, None))[1],
+        }
+        for regla, accion, descripcion in REGLAS_CALIDAD
+    ])
+
+def leer_cuarentena(regla=None, limite=1000):
+    """Últimos registros observados (opcionalmente de una regla)"""
+    asegurar_esquema("calidad", ESQUEMA_CALIDAD)
+    condicion, parametros = ("WHERE regla = ?", [regla]) if regla else ("", [])
+    conn = conectar_almacen_local()
+    try:
+        return pd.read_sql_query(
+            f"SELECT regla, accion, {', '.join(COLUMNAS_REGISTRO_CALIDAD)}, detectado FROM calidad_registros "
+            f"{condicion} ORDER BY detectado DESC, FECHAINGRESO DESC LIMIT ?",
+            conn, params=parametros + [int(limite)]
+        )
+    finally:
+        conn.close()
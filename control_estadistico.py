@@ -0,0 +1,248 @@
+import threading
+from collections import deque
+import math
+
+import streamlit as st
+
+# Constantes de cartas de control para individuales / rango movil (n=2)
+D2_RANGO_MOVIL = 1.128
+D4_RANGO_MOVIL = 3.267
+
+# Puntos minimos en la ventana antes de evaluar reglas
+MINIMO_PUNTOS_REGLAS = 5
+
+
+class EstadoSPC:
+    """
+    Estado incremental de control estadistico para una serie (CODIGO, ODP).
+
+    Mantiene media, sigma y limites sobre una ventana movil con sumas
+    acumuladas, de modo que cada punto nuevo cuesta O(1) sin recorrer la ventana.
+    Carta de individuales + rango movil (I-MR): cada FECHAINGRESO es un punto.
+    """
+
+    def __init__(self, ventana=25, historial=500):
+        self.ventana = ventana
+        self.valores = deque()
+        self.suma = 0.0
+        self.suma_cuadrados = 0.0
+        self.rangos = deque()
+        self.suma_rangos = 0.0
+        self.ultimo_valor = None
+        self.ultima_fecha = None
+        # Zonas recientes para reglas Western Electric (signo * nivel de sigma)
+        self.zonas_3 = deque(maxlen=3)
+        self.zonas_5 = deque(maxlen=5)
+        self.racha_lado = 0
+        self.racha_longitud = 0
+        # Ultimos resultados por punto (acotado) para superponer en los graficos
+        self.resultados = deque(maxlen=historial)
+
+    def limites(self):
+        """Devuelve media, sigma, LCS, LCI y LCS del rango movil con la ventana actual"""
+        n = len(self.valores)
+        if n == 0:
+            return None
+        media = self.suma / n
+        if self.rangos:
+            mr_promedio = self.suma_rangos / len(self.rangos)
+            sigma = mr_promedio / D2_RANGO_MOVIL
+        else:
+            mr_promedio = 0.0
+            sigma = 0.0
+        if sigma == 0.0 and n > 1:
+            # Respaldo: desviacion estandar de la ventana
+            varianza = max(0.0, (self.suma_cuadrados - n * media * media) / (n - 1))
+            sigma = math.sqrt(varianza)
+        return {
+            'media': media,
+            'sigma': sigma,
+            'lcs': media + 3 * sigma,
+            'lci': max(0.0, media - 3 * sigma),
+            'mr_promedio': mr_promedio,
+            'lcs_rango': D4_RANGO_MOVIL * mr_promedio,
+            'puntos': n
+        }
+
+    def _evaluar_reglas(self, valor, limites):
+        """Reglas Western Electric contra los limites previos al punto"""
+        reglas = []
+        sigma = limites['sigma']
+        desviacion = valor - limites['media']
+        lado = 1 if desviacion > 0 else (-1 if desviacion < 0 else 0)
+        nivel = 0
+        if sigma > 0:
+            distancia = abs(desviacion) / sigma
+            nivel = 3 if distancia > 3 else 2 if distancia > 2 else 1 if distancia > 1 else 0
+        zona = lado * nivel
+        self.zonas_3.append(zona)
+        self.zonas_5.append(zona)
+
+        if lado != 0 and lado == self.racha_lado:
+            self.racha_longitud += 1
+        else:
+            self.racha_lado = lado
+            self.racha_longitud = 1 if lado != 0 else 0
+
+        if limites['puntos'] < MINIMO_PUNTOS_REGLAS or sigma == 0:
+            return reglas
+
+        # Regla 1: un punto fuera de 3 sigma
+        if nivel >= 3:
+            reglas.append('R1')
+        # Regla 2: 2 de 3 puntos consecutivos mas alla de 2 sigma del mismo lado
+        if lado != 0 and sum(1 for z in self.zonas_3 if z * lado >= 2) >= 2:
+            reglas.append('R2')
+        # Regla 3: 4 de 5 puntos consecutivos mas alla de 1 sigma del mismo lado
+        if lado != 0 and sum(1 for z in self.zonas_5 if z * lado >= 1) >= 4:
+            reglas.append('R3')
+        # Regla 4: 8 puntos consecutivos del mismo lado de la media
+        if self.racha_longitud >= 8:
+            reglas.append('R4')
+        return reglas
+
+    def agregar(self, fecha, valor):
+        """Incorporar un nuevo punto; devuelve el resultado evaluado para ese punto"""
+        valor = float(valor)
+        limites = self.limites()
+        reglas = self._evaluar_reglas(valor, limites) if limites else []
+
+        # Actualizar ventana de valores
+        self.valores.append(valor)
+        self.suma += valor
+        self.suma_cuadrados += valor * valor
+        if len(self.valores) > self.ventana:
+            saliente = self.valores.popleft()
+            self.suma -= saliente
+            self.suma_cuadrados -= saliente * saliente
+
+        # Actualizar ventana de rangos moviles
+        if self.ultimo_valor is not None:
+            rango = abs(valor - self.ultimo_valor)
+            self.rangos.append(rango)
+            self.suma_rangos += rango
+            if len(self.rangos) > self.ventana - 1:
+                self.suma_rangos -= self.rangos.popleft()
+        self.ultimo_valor = valor
+        self.ultima_fecha = fecha
+
+        resultado = {'fecha': fecha, 'valor': valor, 'reglas': reglas}
+        if limites:
+            resultado.update(lcs=limites['lcs'], lci=limites['lci'], media=limites['media'])
+        self.resultados.append(resultado)
+        return resultado
+
+    def violaciones_desde(self, fecha_inicio):
+        """Puntos con reglas incumplidas a partir de una fecha (solo historial acotado)"""
+        return [r for r in self.resultados if r['reglas'] and r['fecha'] >= fecha_inicio]
+
+
+class MotorSPC:
+    """Registro de estados SPC por (CODIGO, ODP), compartido entre reruns y sesiones"""
+
+    def __init__(self, ventana=25):
+        self.ventana = ventana
+        self.estados = {}
+        self.lock = threading.Lock()
+
+    def estado(self, codigo, odp):
+        clave = (str(codigo), str(odp) if odp is not None else '')
+        with self.lock:
+            if clave not in self.estados:
+                self.estados[clave] = EstadoSPC(self.ventana)
+            return self.estados[clave]
+
+    def procesar_serie(self, df_serie, codigo, odp):
+        """
+        Alimentar el estado con los puntos nuevos de la serie y devolver el resumen.
+        Solo se procesan los puntos posteriores al ultimo visto (sin reescanear).
+        Si la serie es completamente anterior al estado (ej: filtro de otro año),
+        se evalua con un estado temporal que no altera el compartido.
+        """
+        if df_serie is None or df_serie.empty:
+            return None
+        df_serie = df_serie.sort_values('FECHAINGRESO')
+        estado = self.estado(codigo, odp)
+        fecha_maxima = df_serie['FECHAINGRESO'].iloc[-1]
+
+        with self.lock:
+            if estado.ultima_fecha is not None and fecha_maxima < estado.ultima_fecha:
+                estado = EstadoSPC(self.ventana)
+                nuevos = df_serie
+            elif estado.ultima_fecha is not None:
+                nuevos = df_serie[df_serie['FECHAINGRESO'] > estado.ultima_fecha]
+            else:
+                nuevos = df_serie
+            for fecha, valor in zip(nuevos['FECHAINGRESO'], nuevos['_PesoSauciso']):
+                if valor is not None and not (isinstance(valor, float) and math.isnan(valor)):
+                    estado.agregar(fecha, valor)
+
+            limites = estado.limites()
+            if limites is None:
+                return None
+            resumen = dict(limites)
+            resumen['violaciones'] = estado.violaciones_desde(df_serie['FECHAINGRESO'].iloc[0])
+            return resumen
+
+
+@st.cache_resource
+def obtener_motor_spc():
+    """Motor SPC unico por proceso"""
+    return MotorSPC()
+
+
+def calcular_spc_por_serie(df_peso_sauciso, motor=None):
+    """
+    Calcular el resumen SPC de cada serie (CODIGO, ODP) presente en el DataFrame.
+    Si no existe la columna ODP, la serie se agrupa solo por CODIGO.
+    motor permite usar un motor propio (reproducción) en lugar del compartido.
+    Devuelve {(codigo, odp): resumen}
+    """
+    motor = motor or obtener_motor_spc()
+    if df_peso_sauciso is not None and df_peso_sauciso.attrs.get('granularidad'):
+        # Series agregadas (rollups): motor temporal para no mezclar con pesajes individuales
+        motor = MotorSPC()
+    resumenes = {}
+    if df_peso_sauciso is None or df_peso_sauciso.empty:
+        return resumenes
+    columnas = ['CODIGO', 'ODP'] if 'ODP' in df_peso_sauciso.columns else ['CODIGO']
+    for clave, df_serie in df_peso_sauciso.groupby(columnas, sort=False):
+        if not isinstance(clave, tuple):
+            clave = (clave,)
+        codigo = clave[0]
+        odp = clave[1] if len(clave) > 1 else ''
+        resumen = motor.procesar_serie(df_serie, codigo, odp)
+        if resumen:
+            resumenes[(codigo, odp)] = resumen
+    return resumenes
+
+
+def agregar_limites_control(fig, resumen, tamano_texto=12, ancho_linea=2):
+    """Superponer LCS/LCI y marcar violaciones de reglas en un grafico plotly"""
+    import plotly.graph_objects as go
+
+    if not resumen:
+        return
+    if resumen['sigma'] > 0:
+        for valor, etiqueta in ((resumen['lcs'], 'LCS'), (resumen['lci'], 'LCI')):
+            fig.add_hline(
+                y=valor,
+                line_dash="dot",
+                line_color="rgba(220, 20, 60, 0.8)",
+                line_width=ancho_linea,
+                annotation_text=f"{etiqueta}: {valor:.2f}",
+                annotation_position="right",
+                annotation_font=dict(size=tamano_texto, color="crimson")
+            )
+    violaciones = resumen.get('violaciones', [])
+    if violaciones:
+        fig.add_trace(go.Scatter(
+            x=[v['fecha'] for v in violaciones],
+            y=[v['valor'] for v in violaciones],
+            mode='markers',
+            name='Fuera de control',
+            marker=dict(size=tamano_texto + 4, symbol='x', color='crimson', line=dict(width=2)),
+            text=[", ".join(v['reglas']) for v in violaciones],
+            hovertemplate='<b>Fecha:</b> %{x}<br><b>Reglas:</b> %{text}<extra></extra>',
+            showlegend=False
+        ))
@@ -1,25 +1,73 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import time
 import sqlite3
 import os
-import math
 import re
-from database_connection import consultar_datos, verificar_conexion
+from database_connection import consultar_datos, verificar_conexion, estado_conexion
+from control_estadistico import calcular_spc_por_serie, agregar_limites_control
+from pronostico_embuticion import pronosticar_fin_orden, formatear_pronostico
+from ingesta_peso import (
+    sincronizar_ingesta, cobertura_desde, version_datos, leer_snapshot_local, ultima_fecha_local,
+    carga_inicial_pendiente
+)
+from programador_refresco import PROGRAMADOR_REFRESCO
+from rollups_peso import consultar_rollup, elegir_granularidad
+from calendario import (
+    resolver_rangos, condicion_fecha, extraer_condiciones_fecha, semanas_de_fechas, dias_de_fechas, DIAS_SEMANA
+)
+from progreso_ordenes import calcular_progreso_lote, progreso_de_orden
+from tablero_ordenes import obtener_tablero_ordenes, inicio_periodo
+from exportar_peso import exportar_consulta, formatos_disponibles, FORMATOS_EXPORTACION
+from replay_peso import cargar_grabacion, cargar_masas_iniciales, SesionReplay
+from turnos_peso import consultar_turnos, reporte_turno, turno_actual, turno_anterior, CALENDARIO_TURNOS
+from indice_actividad import INDICE_ACTIVIDAD
+from calidad_datos import contadores_calidad, leer_cuarentena, condicion_calidad_sql
+from sketches_peso import consultar_distribucion
+from mapa_calor_peso import mapa_calor, codigos_disponibles, meses_disponibles
+from perfil_base import CACHE_PERFILES
+from merma_ordenes import ordenes_cerradas, actualizar_merma, consultar_merma, tendencia_merma
+from alarmas_peso import MOTOR_ALARMAS
 
 # Funciones de SQLite removidas - volviendo al cálculo original
 
+# Fragmentos de Streamlit (reejecucion parcial) si la version instalada los soporta
+_fragmento_periodico = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+_fragmento = _fragmento_periodico or (lambda funcion: funcion)
+
 # --- Obtener las últimas N combinaciones (CODIGO, ODP) de las últimas 2 semanas ---
-def obtener_ultimas_ordenes_embuticion(where_clause, cantidad=3):
+def ultimas_ordenes_desde_indice(cantidad, filtros):
+    """
+    Últimas N órdenes desde el índice de actividad local.
+    filtros: desde/hasta/codigo/odp equivalentes al where_clause de la consulta SQL.
+    Devuelve None si no hay filtros equivalentes o el índice no puede responder.
+    """
+    if filtros is None:
+        return None
+    try:
+        sincronizar_ingesta()
+        return INDICE_ACTIVIDAD.ultimas_ordenes(cantidad, **filtros)
+    except Exception as e:
+        st.warning(f"No se pudo usar el índice de actividad: {e}")
+        return None
+
+def obtener_ultimas_ordenes_embuticion(where_clause, cantidad=3, filtros=None):
     """Devuelve las últimas N combinaciones únicas de (CODIGO, ODP) con datos de embutición en las últimas 2 semanas."""
+    if filtros is None and where_clause == WHERE_TIEMPO_REAL:
+        filtros = {'desde': datetime.now() - timedelta(weeks=2)}
+    ordenes = ultimas_ordenes_desde_indice(cantidad, filtros)
+    if ordenes is not None:
+        return ordenes
     try:
         query = f'''
         WITH DatosEmbuticion AS (
             SELECT FECHAINGRESO, PESONETO, NUMEMBALAJE, PROCESO, CODIGO, ODP
             FROM vwRegistrosDetallados
             WHERE {where_clause}
+                AND {condicion_calidad_sql()}
         ),
         KgEmbutidos AS (
             SELECT FECHAINGRESO, CODIGO, ODP,
@@ -52,16 +100,249 @@ def obtener_ultimas_ordenes_embuticion(where_clause, cantidad=3):
     except Exception as e:
         st.error(f"Error al obtener últimas órdenes: {e}")
         return []
+# --- SNAPSHOT TIEMPO REAL: una sola consulta para todas las órdenes mostradas ---
+# Filtro fijo de las últimas 2 semanas
+WHERE_TIEMPO_REAL = "FECHAINGRESO >= DATEADD(week, -2, GETDATE()) AND FECHAINGRESO IS NOT NULL AND CODIGO IS NOT NULL AND CODIGO != ''"
+WHERE_PROGRESO_TIEMPO_REAL = "FECHAINGRESO >= DATEADD(week, -2, GETDATE())"
+# El snapshot siempre trae el mismo número de órdenes para que todas las pantallas compartan la consulta cacheada
+MAX_ORDENES_SNAPSHOT = 9
+PUNTOS_POR_ORDEN_SNAPSHOT = 8
+# Paneles del modo grilla y órdenes en rotación si la URL no indica otra cosa
+PANELES_POR_DEFECTO = 4
+ORDENES_EN_ROTACION = 3
+
+def construir_snapshot(df_puntos):
+    """
+    Separar los puntos del snapshot por (CODIGO, ODP).
+    Devuelve (ordenes, series): ordenes de la más reciente a la más antigua y
+    series {(CODIGO, ODP): DataFrame ordenado por FECHAINGRESO ascendente}
+    """
+    if df_puntos is None or df_puntos.empty:
+        return [], {}
+    df_puntos = df_puntos.sort_values('FECHAINGRESO')
+    ultima_fecha = df_puntos.groupby(['CODIGO', 'ODP'])['FECHAINGRESO'].max().sort_values(ascending=False)
+    ordenes = list(ultima_fecha.index)
+    series = {clave: df_orden for clave, df_orden in df_puntos.groupby(['CODIGO', 'ODP'], sort=False)}
+    return ordenes, series
+
+def obtener_snapshot_tiempo_real(where_clause=WHERE_TIEMPO_REAL, cantidad_ordenes=MAX_ORDENES_SNAPSHOT, puntos_por_orden=PUNTOS_POR_ORDEN_SNAPSHOT):
+    """Últimos puntos de peso sauciso de las N órdenes más recientes en una sola consulta"""
+    query = f"""
+    WITH DatosEmbuticion AS (
+        SELECT FECHAINGRESO, PESONETO, NUMEMBALAJE, PROCESO, CODIGO, ODP
+        FROM vwRegistrosDetallados
+        WHERE {where_clause}
+            AND {condicion_calidad_sql()}
+    ),
+    KgEmbutidos AS (
+        SELECT FECHAINGRESO, CODIGO, ODP,
+               SUM(CASE WHEN PROCESO = 'Embutición' THEN PESONETO ELSE 0 END) as _kgEmbutidos,
+               SUM(NUMEMBALAJE) as TotalEmbalajes
+        FROM DatosEmbuticion
+        GROUP BY FECHAINGRESO, CODIGO, ODP
+    ),
+    PesoSauciso AS (
+        SELECT FECHAINGRESO, CODIGO, ODP, _kgEmbutidos, TotalEmbalajes,
+               CASE WHEN TotalEmbalajes > 0 THEN _kgEmbutidos / TotalEmbalajes ELSE 0 END as _PesoSauciso
+        FROM KgEmbutidos
+        WHERE _kgEmbutidos > 0
+            AND CODIGO IS NOT NULL AND CODIGO != '' AND ODP IS NOT NULL AND ODP != ''
+    ),
+    UltimasOrdenes AS (
+        SELECT TOP {cantidad_ordenes} CODIGO, ODP, MAX(FECHAINGRESO) as UltimaFecha
+        FROM PesoSauciso
+        GROUP BY CODIGO, ODP
+        ORDER BY UltimaFecha DESC
+    ),
+    PuntosNumerados AS (
+        SELECT ps.FECHAINGRESO, ps.CODIGO, ps.ODP, ps._kgEmbutidos, ps.TotalEmbalajes, ps._PesoSauciso,
+               ROW_NUMBER() OVER (PARTITION BY ps.CODIGO, ps.ODP ORDER BY ps.FECHAINGRESO DESC) as Orden
+        FROM PesoSauciso ps
+        INNER JOIN UltimasOrdenes uo ON ps.CODIGO = uo.CODIGO AND ps.ODP = uo.ODP
+    )
+    SELECT FECHAINGRESO, CODIGO, ODP, _kgEmbutidos, TotalEmbalajes, _PesoSauciso
+    FROM PuntosNumerados
+    WHERE Orden <= {puntos_por_orden}
+    ORDER BY FECHAINGRESO ASC
+    """
+    try:
+        df, error = consultar_datos(query, vista='tiempo_real', version=version_datos())
+        if (error or df is None) and where_clause == WHERE_TIEMPO_REAL:
+            # Sin SQL Server: el mismo snapshot desde el almacen local (aviso "datos desde" en main)
+            df = leer_snapshot_local(cantidad_ordenes, puntos_por_orden, datetime.now() - timedelta(weeks=2))
+        return construir_snapshot(df)
+    except Exception as e:
+        st.error(f"Error al obtener snapshot de tiempo real: {e}")
+        return [], {}
+
+def mostrar_aviso_sin_conexion():
+    """Banner de trabajo sin conexión: hasta qué hora llegan los datos del almacen local"""
+    estado = estado_conexion()
+    try:
+        ultima_fecha = ultima_fecha_local()
+    except Exception:
+        ultima_fecha = None
+    datos = f"datos desde {ultima_fecha:%H:%M}" if ultima_fecha is not None else "sin datos locales"
+    if ultima_fecha is not None and ultima_fecha.date() != datetime.now().date():
+        datos = f"datos desde {ultima_fecha:%d/%m %H:%M}"
+    reintento = "reintentando en segundo plano" if estado['abierto'] else "reintentando"
+    st.markdown(f"""
+    <div style='background-color: #fff3cd; color: #856404; border: 1px solid #ffeeba; border-radius: 8px;
+                padding: 8px; text-align: center; font-size: 20px; font-weight: bold;'>
+        ⚠ Sin conexión a la base de datos: {datos} (almacen local), {reintento}
+    </div>
+    """, unsafe_allow_html=True)
+
+def version_datos_sincronizada():
+    """Versión de datos de la ingesta (sincroniza antes; la ingesta limita su propia frecuencia)"""
+    sincronizar_ingesta()
+    return version_datos()
+
+def refrescar_vista(vista, version=None, limite=None, intervalo=None):
+    """
+    Volver a ejecutar el script según la política de refresco de la vista.
+    Con version (función) solo se refresca si cambian los datos, al llegar a limite
+    (ej: rotación, time.time()) o al pasar el intervalo máximo de la política.
+    La revisión corre en un fragmento periódico: el script termina y los controles
+    siguen respondiendo mientras tanto. Sin fragmentos (Streamlit antiguo) se bloquea.
+    """
+    if _fragmento_periodico is None:
+        PROGRAMADOR_REFRESCO.esperar_refresco(vista, version=version, limite=limite, intervalo=intervalo)
+        st.rerun()
+    inicio = time.monotonic()
+    version_inicial = version() if version else None
+
+    @_fragmento_periodico(run_every=max(1.0, PROGRAMADOR_REFRESCO.intervalo_revision(vista, limite, intervalo)))
+    def _revisar_refresco():
+        if PROGRAMADOR_REFRESCO.motivo_refresco(vista, inicio, version_inicial, version, limite, intervalo):
+            st.rerun()
+
+    _revisar_refresco()
+
+def esperar_carga_inicial():
+    """
+    Vistas que solo leen el almacen local: mientras la carga inicial corre en segundo
+    plano se muestra un aviso y se reintenta. Devuelve True si hay que esperar.
+    """
+    if not carga_inicial_pendiente():
+        return False
+    st.info("⏳ Carga inicial del almacen local en curso (en segundo plano); la vista se mostrará al terminar.")
+    refrescar_vista('defecto')
+    return True
+
+def leer_parametro_url(nombre, defecto):
+    """Leer un parámetro de la URL (configuración por pantalla, ej: ?modo=grilla&paneles=4)"""
+    try:
+        valor = st.query_params.get(nombre)
+    except AttributeError:
+        valor = st.experimental_get_query_params().get(nombre, [None])[0]
+    return valor if valor not in (None, '') else defecto
+
+def obtener_sesion_replay():
+    """
+    Sesión de reproducción si la URL la pide (?replay=local|ruta.csv&velocidad=20&desde=2025-03-03T06:00&hasta=...).
+    Se guarda en session_state para que el reloj simulado continúe entre reruns.
+    """
+    origen = leer_parametro_url('replay', None)
+    if origen is None:
+        return None
+    parametros = (origen, leer_parametro_url('velocidad', '1'), leer_parametro_url('desde', None), leer_parametro_url('hasta', None))
+    sesion = st.session_state.get('sesion_replay')
+    if sesion is None or st.session_state.get('sesion_replay_parametros') != parametros:
+        try:
+            df_grabacion = cargar_grabacion(origen, parametros[2], parametros[3])
+            sesion = SesionReplay(df_grabacion, velocidad=float(parametros[1]), inicio=parametros[2],
+                                  masas=cargar_masas_iniciales())
+        except (OSError, ValueError) as e:
+            st.error(f"Error al cargar la grabación para reproducir: {e}")
+            return None
+        st.session_state.sesion_replay = sesion
+        st.session_state.sesion_replay_parametros = parametros
+    return sesion
+
+def mostrar_estado_replay(sesion, ahora_simulado):
+    """Banner de reproducción con el instante simulado y los tiempos de cuadro"""
+    tiempos = sesion.resumen_tiempos()
+    estado = "finalizada" if ahora_simulado > sesion.fin else f"x{sesion.velocidad:g}"
+    st.markdown(f"""
+    <div style='background-color: #fff3cd; padding: 6px; border-radius: 6px; text-align: center; color: #856404;'>
+        ⏪ <b>REPRODUCCIÓN</b> {ahora_simulado:%d/%m/%Y %H:%M:%S} ({estado}) ·
+        cuadros: {tiempos['cuadros']} · p50: {tiempos['p50_ms']:.0f} ms · p95: {tiempos['p95_ms']:.0f} ms
+    </div>
+    """, unsafe_allow_html=True)
+
+def calcular_progreso_snapshot(ordenes, where_progreso, sesion_replay=None):
+    """Progreso de las órdenes del snapshot: en reproducción se calcula con la grabación, sin SQL Server"""
+    if sesion_replay is not None:
+        return sesion_replay.progreso(ordenes), None
+    return calcular_progreso_lote(ordenes, where_progreso)
+
+def mostrar_grilla_tiempo_real(ordenes, series, where_progreso, sesion_replay=None):
+    """Grilla con un panel por orden (gráfico compacto + barra de progreso), todos del mismo snapshot"""
+    columnas_por_fila = 2 if len(ordenes) <= 4 else 3
+    escala = 0.55 if columnas_por_fila == 2 else 0.45
+    # Progreso de todos los paneles en una sola consulta
+    df_progreso, error = calcular_progreso_snapshot(ordenes, where_progreso, sesion_replay)
+    if error:
+        st.error(f"Error calculando progreso de las órdenes: {error}")
+    for inicio in range(0, len(ordenes), columnas_por_fila):
+        columnas = st.columns(columnas_por_fila)
+        for columna, (codigo, odp) in zip(columnas, ordenes[inicio:inicio + columnas_por_fila]):
+            with columna:
+                st.markdown(f"""
+                <div style='background-color: #ffffff; padding: 6px; border-radius: 8px; text-align: center; border-left: 5px solid #1f77b4;'>
+                    <h3 style='color: #1f77b4; margin: 0;'>{codigo} <span style='font-size:0.6em; color:#888;'>ODP: {odp}</span></h3>
+                </div>
+                """, unsafe_allow_html=True)
+                crear_grafico_pantalla_completa_con_orden(
+                    series[(codigo, odp)], codigo, odp, where_progreso, escala=escala,
+                    progreso=progreso_de_orden(df_progreso, codigo, odp), sesion_replay=sesion_replay
+                )
+
 # --- DASHBOARD PESO EMBUTICION TIEMPO REAL (solo gráfico, sin filtros, lógica pantalla completa) ---
 def dashboard_peso_embuticion_tiempo_real():
-    """Vista tiempo real: solo el gráfico, alternancia de los últimos 3 códigos/órdenes de las últimas 2 semanas, sin filtros ni botón salir."""
-    # Filtro fijo de las últimas 2 semanas
-    where_clause = "FECHAINGRESO >= DATEADD(week, -2, GETDATE()) AND FECHAINGRESO IS NOT NULL AND CODIGO IS NOT NULL AND CODIGO != ''"
-    # Alternancia y visualización por (CODIGO, ODP) únicos
-    ultimas_ordenes = obtener_ultimas_ordenes_embuticion(where_clause, 3)
-    if not ultimas_ordenes:
+    """
+    Vista tiempo real sin filtros ni botón salir, alimentada por un único snapshot.
+    Parámetros de URL: modo=rotacion|grilla, paneles=K (órdenes en grilla), rotacion=segundos (0 = sin rotar).
+    Con replay=local|ruta (y velocidad, desde, hasta) reproduce una grabación en lugar de consultar SQL Server.
+    """
+    modo = leer_parametro_url('modo', 'rotacion')
+    politica = PROGRAMADOR_REFRESCO.politica('tiempo_real')
+    try:
+        paneles = max(1, min(MAX_ORDENES_SNAPSHOT, int(leer_parametro_url('paneles', PANELES_POR_DEFECTO))))
+        intervalo_rotacion = max(0, int(leer_parametro_url('rotacion', politica['intervalo_rotacion'])))
+    except ValueError:
+        paneles, intervalo_rotacion = PANELES_POR_DEFECTO, politica['intervalo_rotacion']
+    where_progreso = WHERE_PROGRESO_TIEMPO_REAL
+    inicio_cuadro = time.perf_counter()
+    
+    sesion_replay = obtener_sesion_replay()
+    if sesion_replay is not None:
+        # Reproducción: snapshot y progreso calculados con la grabación en el instante simulado
+        ahora_simulado = sesion_replay.tiempo_simulado()
+        ordenes_snapshot, series_snapshot = construir_snapshot(
+            sesion_replay.snapshot(MAX_ORDENES_SNAPSHOT, PUNTOS_POR_ORDEN_SNAPSHOT)
+        )
+        mostrar_estado_replay(sesion_replay, ahora_simulado)
+    else:
+        ordenes_snapshot, series_snapshot = obtener_snapshot_tiempo_real()
+    # En reproducción el reloj simulado avanza solo: refrescar en cada intervalo sin esperar datos nuevos
+    version = None if sesion_replay is not None else version_datos_sincronizada
+    if not ordenes_snapshot:
         st.warning("No hay órdenes recientes para mostrar.")
+        if sesion_replay is None or not sesion_replay.terminado():
+            refrescar_vista('tiempo_real', version)
+        return
+    
+    if modo == 'grilla':
+        mostrar_grilla_tiempo_real(ordenes_snapshot[:paneles], series_snapshot, where_progreso, sesion_replay)
+        if sesion_replay is not None:
+            sesion_replay.registrar_cuadro(time.perf_counter() - inicio_cuadro)
+        refrescar_vista('tiempo_real', version)
         return
+    
+    # Alternancia y visualización por (CODIGO, ODP) únicos
+    ultimas_ordenes = ordenes_snapshot[:ORDENES_EN_ROTACION]
     if 'indice_orden_actual_rt' not in st.session_state:
         st.session_state.indice_orden_actual_rt = 0
     if 'ultimo_cambio_orden_rt' not in st.session_state:
@@ -74,7 +355,7 @@ def dashboard_peso_embuticion_tiempo_real():
         st.session_state.lista_ordenes_anterior_rt = ultimas_ordenes.copy()
     tiempo_actual = time.time()
     tiempo_transcurrido = tiempo_actual - st.session_state.ultimo_cambio_orden_rt
-    if tiempo_transcurrido >= 30 and len(ultimas_ordenes) > 1:
+    if intervalo_rotacion and tiempo_transcurrido >= intervalo_rotacion and len(ultimas_ordenes) > 1:
         st.session_state.indice_orden_actual_rt = (st.session_state.indice_orden_actual_rt + 1) % len(ultimas_ordenes)
         st.session_state.ultimo_cambio_orden_rt = tiempo_actual
     codigo_mostrado, odp_mostrado = ultimas_ordenes[st.session_state.indice_orden_actual_rt]
@@ -91,14 +372,15 @@ def dashboard_peso_embuticion_tiempo_real():
             </h1>
         </div>
         """, unsafe_allow_html=True)
-        if len(ultimas_ordenes) > 1:
-            tiempo_restante = max(0, 30 - int(tiempo_transcurrido))
+        if intervalo_rotacion and len(ultimas_ordenes) > 1:
+            # La pantalla solo se redibuja con datos nuevos o al rotar: mostrar la hora del cambio, no una cuenta regresiva
+            proximo_cambio = datetime.fromtimestamp(st.session_state.ultimo_cambio_orden_rt + intervalo_rotacion)
             posicion_actual = st.session_state.indice_orden_actual_rt + 1
             total_ordenes = len(ultimas_ordenes)
             st.markdown(f"""
             <div style='background-color: #e8f4fd; padding: 15px; border-radius: 8px; text-align: center; margin-top: 15px;'>
                 <p style='margin: 0; color: #1f77b4; font-size: 1.2em;'><b>Orden {posicion_actual} de {total_ordenes}</b></p>
-                <p style='margin: 5px 0 0 0; color: #666; font-size: 1em;'>Siguiente en {tiempo_restante}s</p>
+                <p style='margin: 5px 0 0 0; color: #666; font-size: 1em;'>Siguiente a las {proximo_cambio:%H:%M:%S}</p>
             </div>
             """, unsafe_allow_html=True)
         st.markdown("<div style='margin-top: 20px;'>", unsafe_allow_html=True)
@@ -121,98 +403,374 @@ def dashboard_peso_embuticion_tiempo_real():
         st.markdown("</div>", unsafe_allow_html=True)
     with col_grafico:
         if codigo_mostrado and odp_mostrado:
-            query_orden = f"""
-            WITH DatosEmbuticion AS (
-                SELECT FECHAINGRESO, PESONETO, NUMEMBALAJE, PROCESO, CODIGO, ODP
-                FROM vwRegistrosDetallados
-                WHERE CODIGO = '{codigo_mostrado}'
-                  AND ODP = '{odp_mostrado}'
-                  AND FECHAINGRESO >= DATEADD(week, -2, GETDATE())
-                  AND FECHAINGRESO IS NOT NULL
-            ),
-            KgEmbutidos AS (
-                SELECT FECHAINGRESO, CODIGO,
-                       SUM(CASE WHEN PROCESO = 'Embutición' THEN PESONETO ELSE 0 END) as _kgEmbutidos,
-                       SUM(NUMEMBALAJE) as TotalEmbalajes
-                FROM DatosEmbuticion
-                GROUP BY FECHAINGRESO, CODIGO
-            ),
-            PesoSauciso AS (
-                SELECT FECHAINGRESO, CODIGO, _kgEmbutidos, TotalEmbalajes,
-                       CASE WHEN TotalEmbalajes > 0 THEN _kgEmbutidos / TotalEmbalajes ELSE 0 END as _PesoSauciso
-                FROM KgEmbutidos
-                WHERE _kgEmbutidos > 0
-            )
-            SELECT TOP 8 FECHAINGRESO, CODIGO, _kgEmbutidos, TotalEmbalajes, _PesoSauciso
-            FROM PesoSauciso
-            WHERE FECHAINGRESO >= DATEADD(week, -2, GETDATE())
-            ORDER BY FECHAINGRESO DESC
-            """
-            df_orden, _ = consultar_datos(query_orden)
+            # Serie de la orden tomada del snapshot compartido (sin consulta adicional)
+            df_orden = series_snapshot.get((codigo_mostrado, odp_mostrado))
             if df_orden is not None and not df_orden.empty:
-                df_orden = df_orden.sort_values('FECHAINGRESO')
-                # Usar cálculo original de peso sauciso
-                crear_grafico_pantalla_completa_con_orden(df_orden, codigo_mostrado, odp_mostrado, "FECHAINGRESO >= DATEADD(week, -2, GETDATE())")
+                # Progreso de las órdenes en rotación en una sola consulta (misma clave de caché en cada cambio)
+                df_progreso, error = calcular_progreso_snapshot(ultimas_ordenes, where_progreso, sesion_replay)
+                if error:
+                    st.error(f"Error calculando progreso de las órdenes: {error}")
+                crear_grafico_pantalla_completa_con_orden(
+                    df_orden, codigo_mostrado, odp_mostrado, where_progreso,
+                    progreso=progreso_de_orden(df_progreso, codigo_mostrado, odp_mostrado), sesion_replay=sesion_replay
+                )
             else:
                 st.warning(f"No se encontraron datos para la orden {codigo_mostrado} | ODP: {odp_mostrado}")
         else:
             st.warning("No hay datos disponibles para mostrar en tiempo real")
-    # Auto-actualización cada 1 segundo
-    time.sleep(1)
-    st.rerun()
+    if sesion_replay is not None:
+        sesion_replay.registrar_cuadro(time.perf_counter() - inicio_cuadro)
+    limite_rotacion = st.session_state.ultimo_cambio_orden_rt + intervalo_rotacion if intervalo_rotacion and len(ultimas_ordenes) > 1 else None
+    refrescar_vista('tiempo_real', version, limite=limite_rotacion)
+
+def mostrar_metricas_turno(df_turno):
+    """Totales de un turno (todas las líneas/códigos)"""
+    col1, col2, col3, col4 = st.columns(4)
+    pesajes = df_turno['Pesajes'].sum()
+    with col1:
+        st.metric("Kg Embutidos", f"{df_turno['KgEmbutidos'].sum():,.1f} kg")
+    with col2:
+        st.metric("Saucissos", f"{df_turno['Saucissos'].sum():,.0f}")
+    with col3:
+        promedio = (df_turno['PesoPromedio'] * df_turno['Pesajes']).sum() / pesajes if pesajes else 0
+        st.metric("Peso Promedio", f"{promedio:.2f} kg")
+    with col4:
+        st.metric("Pesajes", int(pesajes))
+
+def dashboard_reporte_turnos():
+    """
+    Reporte por turno (kg embutidos, peso sauciso promedio y saucissos por código)
+    leído de los agregados por turno mantenidos por la ingesta
+    """
+    st.title("Reporte por Turno")
+    sincronizar_ingesta()
+    if esperar_carga_inicial():
+        return
+
+    fecha_actual, turno_en_curso = turno_actual()
+    if turno_en_curso is None:
+        st.info("⏸️ Fuera de los turnos configurados")
+    else:
+        inicio, fin = CALENDARIO_TURNOS.limites(fecha_actual, turno_en_curso)
+        st.subheader(f"Turno en curso: {turno_en_curso} ({inicio:%d/%m %H:%M} - {fin:%d/%m %H:%M})")
+        mostrar_metricas_turno(reporte_turno(fecha_actual, turno_en_curso))
+
+        fecha_previa, turno_previo = turno_anterior(fecha_actual, turno_en_curso)
+        if turno_previo is not None:
+            st.subheader(f"Turno anterior: {turno_previo} del {fecha_previa:%d/%m/%Y}")
+            df_previo = reporte_turno(fecha_previa, turno_previo)
+            mostrar_metricas_turno(df_previo)
+            st.dataframe(df_previo.drop(columns=['Fecha', 'Dia', 'Turno']), use_container_width=True, hide_index=True)
+
+    st.markdown("---")
+    st.subheader("Histórico por turno")
+    col1, col2 = st.columns(2)
+    with col1:
+        rango = st.date_input("Fechas de turno", value=(fecha_actual.date() - timedelta(days=6), fecha_actual.date()), key="turnos_rango")
+    df_turnos = pd.DataFrame()
+    if isinstance(rango, (list, tuple)) and len(rango) == 2:
+        df_turnos = consultar_turnos(pd.Timestamp(rango[0]), pd.Timestamp(rango[1]) + timedelta(days=1))
+    with col2:
+        codigos = ['Todos'] + sorted(df_turnos['CODIGO'].unique().tolist()) if not df_turnos.empty else ['Todos']
+        codigo = st.selectbox("Código", codigos, key="turnos_codigo")
+    if df_turnos.empty:
+        st.warning("No hay pesajes en los turnos seleccionados")
+        return
+    if codigo != 'Todos':
+        df_turnos = df_turnos[df_turnos['CODIGO'] == codigo]
+
+    # Kg embutidos por turno (barras apiladas por código)
+    df_turnos = df_turnos.assign(Etiqueta=df_turnos['Fecha'].astype(str) + ' ' + df_turnos['Turno'])
+    fig = go.Figure()
+    for codigo_serie, df_codigo in df_turnos.groupby('CODIGO'):
+        fig.add_trace(go.Bar(x=df_codigo['Etiqueta'], y=df_codigo['KgEmbutidos'], name=str(codigo_serie)))
+    fig.update_layout(
+        barmode='stack',
+        height=450,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(categoryorder='array', categoryarray=df_turnos['Etiqueta'].drop_duplicates().tolist(), tickangle=45),
+        yaxis=dict(title='Kg embutidos', gridcolor='lightgray')
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(df_turnos.drop(columns=['Etiqueta']), use_container_width=True, hide_index=True)
+
+def dashboard_mapa_calor():
+    """
+    Mapa de calor de peso sauciso promedio y kg embutidos por día de semana y hora
+    para un código y un periodo de meses, desde las celdas mantenidas por la ingesta
+    """
+    st.title("Peso Sauciso por Día y Hora")
+    sincronizar_ingesta()
+    if esperar_carga_inicial():
+        return
+    codigos = codigos_disponibles()
+    if not codigos:
+        st.warning("No hay pesajes en el almacen local")
+        return
+
+    col_codigo, col_periodo, col_medida = st.columns([1, 2, 1])
+    with col_codigo:
+        codigo = st.selectbox("Código", ['Todos'] + codigos, key="calor_codigo")
+    codigo = None if codigo == 'Todos' else codigo
+    meses = meses_disponibles(codigo)
+    if not meses:
+        st.warning("No hay pesajes para el código seleccionado")
+        return
+    with col_periodo:
+        if len(meses) > 1:
+            mes_inicio, mes_fin = st.select_slider("Meses", options=meses, value=(meses[max(0, len(meses) - 3)], meses[-1]), key="calor_meses")
+        else:
+            mes_inicio = mes_fin = meses[0]
+            st.write(f"**Mes:** {mes_inicio}")
+    with col_medida:
+        medidas = {'peso_promedio': "Peso sauciso promedio (kg)", 'kg_embutidos': "Kg embutidos", 'pesajes': "Pesajes"}
+        medida = st.radio("Medida", list(medidas), format_func=medidas.get, key="calor_medida")
+
+    matrices = mapa_calor(codigo, mes_inicio, mes_fin)
+    fig = go.Figure(go.Heatmap(
+        z=matrices[medida],
+        x=[f"{hora:02d}:00" for hora in range(24)],
+        y=[dia.capitalize() for dia in DIAS_SEMANA],
+        customdata=np.stack([matrices['peso_promedio'], matrices['kg_embutidos'], matrices['pesajes']], axis=-1),
+        colorscale='Greens',
+        colorbar=dict(title=medidas[medida]),
+        hovertemplate='<b>%{y} %{x}</b><br>' +
+                      'Peso promedio: %{customdata[0]:.2f} kg<br>' +
+                      'Kg embutidos: %{customdata[1]:.1f}<br>' +
+                      'Pesajes: %{customdata[2]:.0f}<extra></extra>'
+    ))
+    fig.update_layout(
+        height=450,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        yaxis=dict(autorange='reversed'),
+        margin=dict(l=80, r=40, t=40, b=60)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"{int(matrices['pesajes'].sum())} pesajes entre {mes_inicio} y {mes_fin}")
+
+def dashboard_merma():
+    """
+    Merma por orden cerrada (masa esperada contra kg embutidos) y tendencia mensual por
+    código, leídas de los resultados guardados por merma_ordenes
+    """
+    st.title("Merma por Orden")
+    sincronizar_ingesta()
+    if esperar_carga_inicial():
+        return
+    pendientes = ordenes_cerradas(pendientes=True)
+    col_estado, col_boton = st.columns([3, 1])
+    with col_estado:
+        st.write(f"Órdenes cerradas sin analizar: **{len(pendientes)}**")
+    with col_boton:
+        if st.button("🔄 Analizar pendientes", use_container_width=True, disabled=pendientes.empty):
+            try:
+                with st.spinner("Calculando merma de las órdenes cerradas..."):
+                    actualizar_merma()
+            except Exception as e:
+                st.error(f"Error al calcular la merma: {e}")
+            st.rerun()
+
+    df_merma = consultar_merma()
+    if df_merma.empty:
+        st.warning("Todavía no hay órdenes analizadas")
+        return
+    codigos = ['Todos'] + sorted(df_merma['CODIGO'].unique().tolist())
+    codigo = st.selectbox("Código", codigos, key="merma_codigo")
+    if codigo != 'Todos':
+        df_merma = df_merma[df_merma['CODIGO'] == codigo]
+
+    df_tendencia = tendencia_merma(df_merma)
+    fig = go.Figure()
+    for codigo_serie, df_codigo in df_tendencia.groupby('CODIGO'):
+        fig.add_trace(go.Scatter(
+            x=df_codigo['Periodo'], y=df_codigo['Rendimiento'], mode='lines+markers', name=str(codigo_serie),
+            customdata=df_codigo[['Ordenes', 'MermaReal', 'MermaPlan']],
+            hovertemplate='<b>%{x|%m/%Y}</b><br>Rendimiento: %{y:.1f}%<br>Órdenes: %{customdata[0]}<br>' +
+                          'Merma real: %{customdata[1]:.1f}% | plan: %{customdata[2]:.1f}%<extra></extra>'
+        ))
+    fig.add_hline(y=100, line_dash="dash", line_color="rgba(255, 105, 180, 0.8)")
+    fig.update_layout(
+        height=450,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(title='Mes de cierre', gridcolor='lightgray'),
+        yaxis=dict(title='Kg embutidos / masa esperada (%)', gridcolor='lightgray')
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    df_mostrar = df_merma.sort_values('fin', ascending=False).rename(columns={
+        'inicio': 'Inicio', 'fin': 'Fin', 'peso_odp': 'PesoODP', 'porcentaje_merma_plan': 'MermaPlan',
+        'kg_deben_embutir': 'KgDebenEmbutir', 'kg_embutidos': 'KgEmbutidos', 'rendimiento': 'Rendimiento',
+        'porcentaje_merma_real': 'MermaReal'
+    })
+    st.dataframe(df_mostrar.round(2), use_container_width=True, hide_index=True)
+
+def dashboard_tablero_ordenes():
+    """
+    Tablero de todas las órdenes con actividad de embutición del día o la semana,
+    ordenado por avance y fin estimado. Parámetros de URL: periodo=dia|semana, refresco=segundos.
+    """
+    st.title("Órdenes en Embutición")
+    sincronizar_ingesta()
+    if esperar_carga_inicial():
+        return
+    try:
+        intervalo_refresco = max(0, int(leer_parametro_url('refresco', PROGRAMADOR_REFRESCO.politica('ordenes')['intervalo_datos'])))
+    except ValueError:
+        intervalo_refresco = PROGRAMADOR_REFRESCO.politica('ordenes')['intervalo_datos']
+
+    col_periodo, col_filtro = st.columns([1, 1])
+    with col_periodo:
+        opciones_periodo = {'dia': "Hoy", 'semana': "Esta semana"}
+        periodo_defecto = leer_parametro_url('periodo', 'dia')
+        periodo = st.radio(
+            "Periodo", list(opciones_periodo), format_func=opciones_periodo.get, horizontal=True,
+            index=list(opciones_periodo).index(periodo_defecto) if periodo_defecto in opciones_periodo else 0
+        )
+    with col_filtro:
+        ocultar_completas = st.toggle("Ocultar órdenes completas", value=False)
+
+    df_tablero, error = obtener_tablero_ordenes().actualizar(inicio_periodo(periodo))
+    if error:
+        st.error(f"Error al calcular el progreso de las órdenes: {error}")
+        return
+    if df_tablero.empty:
+        st.warning("No hay órdenes con embutición en el periodo")
+    else:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Órdenes con actividad", len(df_tablero))
+        with col2:
+            st.metric("Completas", int((df_tablero['Porcentaje'] >= 100).sum()))
+        with col3:
+            st.metric("Kg Embutidos", f"{df_tablero['KgEmbutidos'].sum():,.0f} kg")
+
+        if ocultar_completas:
+            df_tablero = df_tablero[df_tablero['Porcentaje'] < 100]
+        st.dataframe(
+            df_tablero,
+            use_container_width=True,
+            hide_index=True,
+            height=min(900, 40 + 35 * len(df_tablero)),
+            column_order=['CODIGO', 'ODP', 'Porcentaje', 'KgEmbutidos', 'KgDebenEmbutir', 'SaucissosFaltantes',
+                          'FinEstimado', 'MinutosRestantes', 'KgPorMinuto', 'UltimoPesaje', 'Pesajes'],
+            column_config={
+                'CODIGO': st.column_config.TextColumn("Código", width="small"),
+                'ODP': st.column_config.TextColumn("ODP", width="small"),
+                'Porcentaje': st.column_config.ProgressColumn("Progreso", min_value=0, max_value=100, format="%.1f%%"),
+                'KgEmbutidos': st.column_config.NumberColumn("Kg Embutidos", format="%.0f"),
+                'KgDebenEmbutir': st.column_config.NumberColumn("Kg a Embutir", format="%.0f"),
+                'SaucissosFaltantes': st.column_config.NumberColumn("Sau.Fal", format="%d"),
+                'FinEstimado': st.column_config.DatetimeColumn("Fin Estimado", format="HH:mm"),
+                'MinutosRestantes': st.column_config.NumberColumn("Min. Restantes", format="%.0f"),
+                'KgPorMinuto': st.column_config.NumberColumn("Kg/min", format="%.1f"),
+                'UltimoPesaje': st.column_config.DatetimeColumn("Último Pesaje", format="DD/MM HH:mm"),
+                'Pesajes': st.column_config.NumberColumn("Pesajes", format="%d"),
+            }
+        )
+
+    if intervalo_refresco:
+        refrescar_vista('ordenes', version_datos_sincronizada, intervalo=intervalo_refresco)
 
 def _convertir_filtros_a_fecha_creacion(where_clause):
     """
     Convertir filtros de FECHAINGRESO a filtros de FechaCreacion
-    Ejemplo: YEAR(FECHAINGRESO) = 2025 -> YEAR(FechaCreacion) = 2025
-    Maneja correctamente el caso día "Todas" + semana específica
+    Ejemplo: (FECHAINGRESO >= '2025-01-01' AND FECHAINGRESO < '2026-01-01') -> mismo rango sobre FechaCreacion
+    Los filtros de año/semana/día ya vienen resueltos a rangos de fechas por el calendario local
     """
-    import re
-    
-    filtros_fecha_creacion = []
-    
-    # Extraer año
-    if "YEAR(FECHAINGRESO)" in where_clause:
-        year_match = re.search(r"YEAR\(FECHAINGRESO\) = (\d+)", where_clause)
-        if year_match:
-            year = year_match.group(1)
-            filtros_fecha_creacion.append(f"YEAR(FechaCreacion) = {year}")
-    
-    # Extraer semana  
-    if "DATEPART(week, FECHAINGRESO)" in where_clause:
-        week_match = re.search(r"DATEPART\(week, FECHAINGRESO\) = (\d+)", where_clause)
-        if week_match:
-            week = week_match.group(1)
-            filtros_fecha_creacion.append(f"DATEPART(week, FechaCreacion) = {week}")
-    
-    # Extraer dia de la semana 
-    if "DATENAME(weekday, FECHAINGRESO)" in where_clause:
-        day_match = re.search(r"DATENAME\(weekday, FECHAINGRESO\) = '(\w+)'", where_clause)
-        if day_match:
-            day_en = day_match.group(1)  # Día en ingles del filtro
-            # Mapear dias
-            day_mapping = {
-                'Monday': 'lunes',
-                'Tuesday': 'martes', 
-                'Wednesday': 'miércoles',
-                'Thursday': 'jueves',
-                'Friday': 'viernes',
-                'Saturday': 'sábado',
-                'Sunday': 'domingo',
-                'lunes': 'Monday',
-                'martes': 'Tuesday',
-                'miércoles': 'Wednesday', 
-                'jueves': 'Thursday',
-                'viernes': 'Friday',
-                'sábado': 'Saturday',
-                'domingo': 'Sunday'
-            }
-            
-            # Probar ambos formatos para compatibilidad
-            filtros_fecha_creacion.append(f"(DATENAME(weekday, FechaCreacion) = '{day_en}' OR DATENAME(weekday, FechaCreacion) = '{day_mapping.get(day_en, day_en)}')")
-    
+    filtros_fecha_creacion = extraer_condiciones_fecha(where_clause, 'FechaCreacion')
     return " AND " + " AND ".join(filtros_fecha_creacion) if filtros_fecha_creacion else ""
 
+# --- Consultas de listas de filtros (también las usa el precalentamiento para llenar la caché) ---
+ANO_POR_DEFECTO = '2025'
+
+QUERY_ANOS = """
+        SELECT DISTINCT YEAR(FECHAINGRESO) as Año
+        FROM vwRegistrosDetallados 
+        WHERE FECHAINGRESO IS NOT NULL
+        ORDER BY Año DESC
+        """
+
+def query_codigos_disponibles(rangos_tiempo):
+    """Códigos con registros en los rangos de tiempo (None = sin filtro de tiempo)"""
+    condiciones_codigo = ["FECHAINGRESO IS NOT NULL", "CODIGO IS NOT NULL", "CODIGO != ''"]
+    
+    if rangos_tiempo is not None:
+        condiciones_codigo.append(condicion_fecha(rangos_tiempo))
+    
+    where_codigo = " AND ".join(condiciones_codigo)
+    
+    return f"""
+        SELECT DISTINCT CODIGO
+        FROM vwRegistrosDetallados 
+        WHERE {where_codigo}
+        ORDER BY CODIGO
+        """
+
+def query_odps_disponibles(rangos_tiempo, codigo_seleccionado='Todas'):
+    """ODPs con registros en los rangos de tiempo más las órdenes existentes del código"""
+    condiciones_odp = ["FECHAINGRESO IS NOT NULL", "ODP IS NOT NULL", "ODP != ''"]
+    
+    if rangos_tiempo is not None:
+        condiciones_odp.append(condicion_fecha(rangos_tiempo))
+    
+    if codigo_seleccionado != 'Todas':
+        condiciones_odp.append(f"CODIGO = '{codigo_seleccionado}'")
+    
+    where_odp = " AND ".join(condiciones_odp)
+    
+    # MEJORADO: Buscar ODPs tanto en registros como en órdenes disponibles
+    return f"""
+        WITH ODPsDeRegistros AS (
+            -- ODPs que YA tienen registros de producción (aplicando filtros)
+            SELECT DISTINCT ODP
+            FROM vwRegistrosDetallados 
+            WHERE {where_odp}
+        ),
+        ODPsDeOrdenes AS (
+            -- ODPs de órdenes que existen (aplicando filtros de código si está seleccionado)
+            SELECT DISTINCT od.CodigoOrden as ODP
+            FROM vwOrdenDocumento od
+            WHERE 1=1
+                {f"AND od.CodigoProducto = '{codigo_seleccionado}'" if codigo_seleccionado != 'Todas' else ''}
+        )
+        SELECT DISTINCT ODP 
+        FROM (
+            SELECT ODP FROM ODPsDeRegistros
+            UNION
+            SELECT ODP FROM ODPsDeOrdenes
+        ) AS TodosODPs
+        WHERE ODP IS NOT NULL AND ODP != ''
+        ORDER BY ODP
+        """
+
+def resolver_rangos_filtro(año, semana, dia, anos_disponibles):
+    """Rangos [inicio, fin) del filtro de tiempo seleccionado, o None si no hay filtro de tiempo"""
+    if año == 'Todas' and semana == 'Todas' and dia == 'Todas':
+        return None
+    años = [int(año)] if año != 'Todas' else [int(a) for a in anos_disponibles if a != 'Todas']
+    return resolver_rangos(
+        años,
+        None if semana == 'Todas' else semana,
+        None if dia == 'Todas' else dia
+    )
+
+def obtener_fechas_con_datos(año):
+    """Fechas distintas con registros (para resolver semanas y días localmente)"""
+    condicion = "FECHAINGRESO IS NOT NULL"
+    if año != 'Todas':
+        condicion += " AND " + condicion_fecha([(datetime(int(año), 1, 1), datetime(int(año) + 1, 1, 1))])
+    query = f"""
+    SELECT DISTINCT CAST(FECHAINGRESO AS date) as Fecha
+    FROM vwRegistrosDetallados 
+    WHERE {condicion}
+    ORDER BY Fecha
+    """
+    df_fechas, _ = consultar_datos(query)
+    return df_fechas
+
 def obtener_codigo_orden_por_producto(codigo_producto, where_clause):
     """
     Obtener el CodigoOrden correspondiente a un CodigoProducto 
@@ -342,6 +900,7 @@ def calcular_progreso_embuticion_bi(codigo_producto, where_clause, codigo_orden=
                     SUM(CASE WHEN PROCESO = 'Embutición' THEN PESONETO ELSE 0 END) as TotalKgEmbutidos
                 FROM vwRegistrosDetallados 
                 WHERE CODIGO = '{codigo_producto}' 
+                    AND {condicion_calidad_sql()}
                     AND ODP = '{codigo_orden}'  -- CLAVE: Filtrar por la orden especifica
                     AND PROCESO = 'Embutición'
                     AND {where_clause}
@@ -412,6 +971,7 @@ def calcular_progreso_embuticion_bi(codigo_producto, where_clause, codigo_orden=
                     SUM(CASE WHEN PROCESO = 'Embutición' THEN PESONETO ELSE 0 END) as TotalKgEmbutidos
                 FROM vwRegistrosDetallados 
                 WHERE CODIGO = '{codigo_producto}' 
+                    AND {condicion_calidad_sql()}
                     AND PROCESO = 'Embutición'
                     AND {where_clause}
             )
@@ -453,6 +1013,7 @@ def calcular_progreso_embuticion_bi(codigo_producto, where_clause, codigo_orden=
                         ODP
                     FROM vwRegistrosDetallados 
                     WHERE CODIGO = '{codigo_producto}' 
+                        AND {condicion_calidad_sql()}
                         AND ODP = '{codigo_orden}'
                         AND PROCESO = 'Embutición'
                         AND {where_clause}
@@ -550,6 +1111,15 @@ def mostrar_vista_normal(df_peso_sauciso):
                      '<extra></extra>'
     ))
     
+    # Limites de control (SPC incremental por CODIGO/ODP)
+    resumenes_spc = calcular_spc_por_serie(df_peso_sauciso)
+    if len(resumenes_spc) == 1:
+        agregar_limites_control(fig, next(iter(resumenes_spc.values())))
+    else:
+        # Varias series mezcladas: solo marcar violaciones de cada una
+        for resumen in resumenes_spc.values():
+            agregar_limites_control(fig, {'sigma': 0, 'violaciones': resumen['violaciones']})
+    
     # Configurar layout con grafico más grande y barra de desplazamiento
     fig.update_layout(
         title=dict(
@@ -611,39 +1181,154 @@ def mostrar_vista_normal(df_peso_sauciso):
         'scrollZoom': True
     })
     
-    # Mostrar DataFrame con datos detallados debajo del gráfico
+    # Carta de rango movil cuando hay una sola serie
+    if len(resumenes_spc) == 1:
+        mostrar_carta_rango_movil(df_peso_sauciso, next(iter(resumenes_spc.values())))
+    
+    # Resumen, ultimo codigo y detalle se cargan despues del grafico
+    mostrar_estadisticas_resumen(df_peso_sauciso)
+    mostrar_ultimo_codigo(df_peso_sauciso)
+    mostrar_datos_detallados(df_peso_sauciso)
+
+@_fragmento
+def mostrar_estadisticas_resumen(df_peso_sauciso):
+    """
+    Estadisticas resumidas calculadas directamente sobre la serie ya cargada.
+    Con filas de rollup (attrs['granularidad']) cada fila es un periodo: se usan los
+    pesajes, mínimos y máximos de cada periodo y el promedio ponderado por pesajes.
+    """
+    if df_peso_sauciso.empty:
+        return
+    col1, col2, col3, col4 = st.columns(4)
+    if df_peso_sauciso.attrs.get('granularidad'):
+        registros = int(df_peso_sauciso['Registros'].sum())
+        promedio = (df_peso_sauciso['_PesoSauciso'] * df_peso_sauciso['Registros']).sum() / registros if registros else 0.0
+        minimo, maximo = df_peso_sauciso['_PesoMin'].min(), df_peso_sauciso['_PesoMax'].max()
+        sufijo = " (agregado)"
+    else:
+        pesos = df_peso_sauciso['_PesoSauciso'].round(2)
+        registros, promedio, minimo, maximo = len(df_peso_sauciso), pesos.mean(), pesos.min(), pesos.max()
+        sufijo = ""
+    with col1:
+        st.metric(f"Total Registros{sufijo}", registros)
+    with col2:
+        st.metric(f"Peso Promedio{sufijo}", f"{promedio:.2f} kg")
+    with col3:
+        st.metric(f"Peso Mínimo{sufijo}", f"{minimo:.2f} kg")
+    with col4:
+        st.metric(f"Peso Máximo{sufijo}", f"{maximo:.2f} kg")
+
+@_fragmento
+def mostrar_distribucion_peso(df_peso_sauciso, rangos_tiempo, codigo, odp):
+    """
+    Distribución de peso sauciso (P5/P50/P95 e histograma) del filtro actual,
+    fusionando los sketches diarios del almacen local en lugar de leer cada pesaje
+    """
+    st.subheader("📊 Distribución de Peso Sauciso")
+    sketch = None
+    try:
+        sincronizar_ingesta()
+        cobertura = cobertura_desde()
+        if cobertura is not None and (rangos_tiempo is None or min(inicio for inicio, _ in rangos_tiempo) >= cobertura):
+            sketch = consultar_distribucion(rangos_tiempo, codigo, odp)
+    except Exception as e:
+        st.warning(f"No se pudieron usar los sketches locales: {e}")
+
+    if sketch is not None:
+        p5, p50, p95 = sketch.cuantiles([0.05, 0.5, 0.95])
+        bordes, cantidades = sketch.histograma(30)
+        cantidad = int(round(sketch.cantidad))
+        if rangos_tiempo is None:
+            st.caption(f"📦 Sketches diarios locales desde {cobertura:%d/%m/%Y}")
+    elif 'Registros' not in df_peso_sauciso.columns and not df_peso_sauciso.empty:
+        # Sin sketches: calcular sobre la serie cruda ya cargada
+        pesos = df_peso_sauciso['_PesoSauciso']
+        p5, p50, p95 = pesos.quantile([0.05, 0.5, 0.95])
+        cantidades, bordes = np.histogram(pesos, bins=30)
+        cantidad = len(pesos)
+    else:
+        st.info("No hay distribución disponible para el filtro seleccionado")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Pesajes", cantidad)
+    with col2:
+        st.metric("P5", f"{p5:.2f} kg")
+    with col3:
+        st.metric("P50 (mediana)", f"{p50:.2f} kg")
+    with col4:
+        st.metric("P95", f"{p95:.2f} kg")
+
+    fig = go.Figure(go.Bar(
+        x=(bordes[:-1] + bordes[1:]) / 2,
+        y=cantidades,
+        width=np.diff(bordes),
+        marker_color='green',
+        hovertemplate='<b>Peso:</b> %{x:.2f} kg<br><b>Pesajes:</b> %{y:.0f}<extra></extra>'
+    ))
+    for valor, nombre in [(p5, "P5"), (p50, "P50"), (p95, "P95")]:
+        fig.add_vline(x=valor, line_dash="dash", line_color="rgba(255, 105, 180, 0.8)",
+                      annotation_text=nombre, annotation_position="top")
+    fig.update_layout(
+        height=350,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis_title="Peso Sauciso (kg)",
+        yaxis_title="Pesajes",
+        bargap=0.05,
+        showlegend=False
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+@_fragmento
+def mostrar_ultimo_codigo(df_peso_sauciso):
+    """Banner de depuracion con el ultimo codigo detectado en los datos cargados"""
+    ultimo_codigo = resolver_ultimo_codigo(df_peso_sauciso)
+    if ultimo_codigo != "Sin datos":
+        st.info(f"🔍 Último código detectado: **{ultimo_codigo}**")
+    else:
+        st.warning("⚠️ No se pudo detectar último código con datos válidos")
+
+@_fragmento
+def mostrar_datos_detallados(df_peso_sauciso):
+    """Tabla de datos detallados, solo se construye y envia cuando se solicita"""
     st.subheader("📋 Datos Detallados")
     
+    # La tabla completa se envia bajo demanda; al alternar solo se reejecuta este fragmento
+    if not st.toggle("Mostrar tabla de datos detallados", key="mostrar_datos_detallados"):
+        return
+    
     # Preparar el DataFrame para mostrar
     df_mostrar = df_peso_sauciso.copy()
-    
+
     # Formatear las columnas para mejor visualización
     if not df_mostrar.empty:
         # Agregar columnas de fecha y hora separadas
         df_mostrar['Fecha'] = df_mostrar['FECHAINGRESO'].dt.strftime('%d/%m/%Y')
         df_mostrar['Hora'] = df_mostrar['FECHAINGRESO'].dt.strftime('%H:%M:%S')
-        
+    
         # Seleccionar las columnas que queremos mostrar (verificando que existan)
         columnas_mostrar = []
-        
+    
         # Columnas básicas obligatorias
         if 'CODIGO' in df_mostrar.columns:
             columnas_mostrar.append('CODIGO')
-        
+    
         # ODP puede no existir en algunos casos
         if 'ODP' in df_mostrar.columns:
             columnas_mostrar.append('ODP')
-        
+    
         # Fecha y hora (siempre deben existir)
         columnas_mostrar.extend(['Fecha', 'Hora'])
-        
+    
         # Peso sauciso (obligatorio)
         if '_PesoSauciso' in df_mostrar.columns:
             columnas_mostrar.append('_PesoSauciso')
-        
+    
         # Crear DataFrame final para mostrar
         df_final = df_mostrar[columnas_mostrar].copy()
-        
+    
         # Renombrar columnas para mejor presentación
         nombres_columnas = []
         for col in columnas_mostrar:
@@ -659,9 +1344,9 @@ def mostrar_vista_normal(df_peso_sauciso):
                 nombres_columnas.append('Peso Sauciso (kg)')
             else:
                 nombres_columnas.append(col)
-        
+    
         df_final.columns = nombres_columnas
-        
+    
         # Formatear números con 2 decimales (solo columnas numéricas)
         for col in df_final.columns:
             if 'Peso' in col:
@@ -675,11 +1360,11 @@ def mostrar_vista_normal(df_peso_sauciso):
                     except:
                         # Si no se puede convertir, mantener el valor original
                         pass
-        
+    
         # Mostrar el DataFrame
         # Crear configuración de columnas dinámicamente
         column_config = {}
-        
+    
         for col in df_final.columns:
             if col == "Código":
                 column_config[col] = st.column_config.TextColumn("Código", width="small")
@@ -695,29 +1380,108 @@ def mostrar_vista_normal(df_peso_sauciso):
                     width="medium",
                     format="%.2f"
                 )
-        
+    
         st.dataframe(
             df_final,
             use_container_width=True,
             hide_index=True,
             column_config=column_config
         )
-        
-        # Mostrar estadísticas resumidas
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.metric("Total Registros", len(df_final))
-        with col2:
-            st.metric("Peso Promedio", f"{df_final['Peso Sauciso (kg)'].mean():.2f} kg")
-        with col3:
-            st.metric("Peso Mínimo", f"{df_final['Peso Sauciso (kg)'].min():.2f} kg")
-        with col4:
-            st.metric("Peso Máximo", f"{df_final['Peso Sauciso (kg)'].max():.2f} kg")
     else:
         st.info("No hay datos disponibles para mostrar en la tabla.")
 
-def obtener_ultimos_codigos_con_orden(where_clause, cantidad=3):
+@_fragmento
+def mostrar_exportacion(query_peso_sauciso):
+    """Exportar los datos del filtro actual; la consulta se lee y escribe por lotes a un archivo temporal"""
+    formatos = formatos_disponibles()
+    col_formato, col_preparar, col_descargar = st.columns([1, 1, 2])
+    with col_formato:
+        formato = st.selectbox("Formato de exportación", formatos, key="formato_exportacion")
+    with col_preparar:
+        st.write("")
+        preparar = st.button("📤 Preparar exportación", use_container_width=True)
+    clave = (query_peso_sauciso, formato)
+    exportacion = st.session_state.get('exportacion_peso')
+    if preparar:
+        # Borrar el archivo de una exportación anterior
+        if exportacion and os.path.exists(exportacion['ruta']):
+            os.remove(exportacion['ruta'])
+        try:
+            with st.spinner("Exportando datos..."):
+                ruta, filas = exportar_consulta(query_peso_sauciso, formato)
+            exportacion = {'clave': clave, 'ruta': ruta, 'filas': filas}
+            st.session_state['exportacion_peso'] = exportacion
+        except Exception as e:
+            st.session_state.pop('exportacion_peso', None)
+            st.error(f"Error al exportar datos: {e}")
+            return
+    if exportacion and exportacion['clave'] == clave and os.path.exists(exportacion['ruta']):
+        with col_descargar:
+            st.write("")
+            with open(exportacion['ruta'], 'rb') as archivo:
+                st.download_button(
+                    f"⬇️ Descargar {exportacion['filas']} filas",
+                    data=archivo,
+                    file_name=f"peso_sauciso_{datetime.now():%Y%m%d_%H%M}{FORMATOS_EXPORTACION[formato]['extension']}",
+                    mime=FORMATOS_EXPORTACION[formato]['mime'],
+                    use_container_width=True
+                )
+
+def mostrar_calidad_datos():
+    """Observaciones de calidad de la ingesta por regla y últimos registros en cuarentena"""
+    try:
+        df_contadores = contadores_calidad()
+    except Exception as e:
+        st.warning(f"No se pudo leer la calidad de datos: {e}")
+        return
+    total_cuarentena = int(df_contadores.loc[df_contadores['Accion'] == 'cuarentena', 'Cantidad'].sum())
+    with st.expander(f"🧪 Calidad de datos ({total_cuarentena} registros en cuarentena)"):
+        st.dataframe(df_contadores, use_container_width=True, hide_index=True)
+        df_cuarentena = leer_cuarentena(limite=200)
+        if not df_cuarentena.empty:
+            st.write("**Últimos registros observados**")
+            st.dataframe(df_cuarentena, use_container_width=True, hide_index=True)
+
+def mostrar_carta_rango_movil(df_peso_sauciso, resumen):
+    """Carta R (rango movil entre pesajes consecutivos) con su limite superior"""
+    rango_movil = df_peso_sauciso['_PesoSauciso'].diff().abs()
+    
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=df_peso_sauciso['FECHAINGRESO'],
+        y=rango_movil,
+        mode='lines+markers',
+        line=dict(color='gray', width=1),
+        marker=dict(size=4, color='gray'),
+        showlegend=False,
+        hovertemplate='<b>Fecha:</b> %{x}<br><b>Rango móvil:</b> %{y:.3f}<extra></extra>'
+    ))
+    if resumen['lcs_rango'] > 0:
+        fig.add_hline(
+            y=resumen['lcs_rango'],
+            line_dash="dot",
+            line_color="rgba(220, 20, 60, 0.8)",
+            annotation_text=f"LCS R: {resumen['lcs_rango']:.3f}",
+            annotation_position="right"
+        )
+    fig.add_hline(y=resumen['mr_promedio'], line_dash="dash", line_color="rgba(255, 105, 180, 0.8)")
+    fig.update_layout(
+        title=dict(text='Rango móvil', font=dict(size=14, color='black'), x=0, xanchor='left'),
+        height=250,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        margin=dict(l=80, r=80, t=50, b=40),
+        xaxis=dict(showgrid=True, gridcolor='lightgray', tickformat='%d/%m/%Y<br>%H:%M'),
+        yaxis=dict(showgrid=True, gridcolor='lightgray'),
+        showlegend=False
+    )
+    st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
+
+def obtener_ultimos_codigos_con_orden(where_clause, cantidad=3, filtros=None):
     """Obtener las últimas N combinaciones únicas de (CODIGO, ODP) que tengan datos de embutición"""
+    ordenes = ultimas_ordenes_desde_indice(cantidad, filtros)
+    if ordenes is not None:
+        return ordenes
     try:
         query = f"""
         WITH DatosEmbuticion AS (
@@ -730,6 +1494,7 @@ def obtener_ultimos_codigos_con_orden(where_clause, cantidad=3):
                 ODP
             FROM vwRegistrosDetallados 
             WHERE {where_clause}
+                AND {condicion_calidad_sql()}
         ),
         KgEmbutidos AS (
             SELECT 
@@ -782,14 +1547,14 @@ def obtener_ultimos_codigos_con_orden(where_clause, cantidad=3):
         st.error(f"Error al obtener últimos códigos con orden: {e}")
         return []
 
-def mostrar_vista_pantalla_completa(df_peso_sauciso, ultimo_codigo, where_clause):
+def mostrar_vista_pantalla_completa(df_peso_sauciso, ultimo_codigo, where_clause, filtros_indice=None):
     """Vista de pantalla completa con alternancia de últimas 3 combinaciones CODIGO+ODP"""
     
     # Limpiar la interfaz para pantalla completa
     st.empty()
     
     # Obtener las ultimas 3 combinaciones únicas CODIGO+ODP
-    ultimas_combinaciones = obtener_ultimos_codigos_con_orden(where_clause, 3)
+    ultimas_combinaciones = obtener_ultimos_codigos_con_orden(where_clause, 3, filtros_indice)
     
     # Inicializar session state para alternancia
     if 'indice_combinacion_actual' not in st.session_state:
@@ -809,11 +1574,12 @@ def mostrar_vista_pantalla_completa(df_peso_sauciso, ultimo_codigo, where_clause
         st.session_state.ultimo_cambio_combinacion = time.time()
         st.session_state.lista_combinaciones_anterior = ultimas_combinaciones.copy()
     
-    # Alternar combinaciones cada 30 segundos
+    # Alternar combinaciones según la política de refresco de pantalla completa
+    intervalo_rotacion = PROGRAMADOR_REFRESCO.politica('pantalla_completa')['intervalo_rotacion']
     tiempo_actual = time.time()
     tiempo_transcurrido = tiempo_actual - st.session_state.ultimo_cambio_combinacion
     
-    if tiempo_transcurrido >= 30 and len(ultimas_combinaciones) > 1:
+    if intervalo_rotacion and tiempo_transcurrido >= intervalo_rotacion and len(ultimas_combinaciones) > 1:
         st.session_state.indice_combinacion_actual = (st.session_state.indice_combinacion_actual + 1) % len(ultimas_combinaciones)
         st.session_state.ultimo_cambio_combinacion = tiempo_actual
     
@@ -842,15 +1608,15 @@ def mostrar_vista_pantalla_completa(df_peso_sauciso, ultimo_codigo, where_clause
         """, unsafe_allow_html=True)
 
         # Mostrar información de alternancia solo si hay más de una combinación
-        if len(ultimas_combinaciones) > 1:
-            tiempo_restante = max(0, 30 - int(tiempo_transcurrido))
+        if intervalo_rotacion and len(ultimas_combinaciones) > 1:
+            proximo_cambio = datetime.fromtimestamp(st.session_state.ultimo_cambio_combinacion + intervalo_rotacion)
             posicion_actual = st.session_state.indice_combinacion_actual + 1
             total_combinaciones = len(ultimas_combinaciones)
             
             st.markdown(f"""
             <div style='background-color: #e8f4fd; padding: 15px; border-radius: 8px; text-align: center; margin-top: 15px;'>
                 <p style='margin: 0; color: #1f77b4; font-size: 1.2em;'><b>Orden {posicion_actual} de {total_combinaciones}</b></p>
-                <p style='margin: 5px 0 0 0; color: #666; font-size: 1em;'>Siguiente en {tiempo_restante}s</p>
+                <p style='margin: 5px 0 0 0; color: #666; font-size: 1em;'>Siguiente a las {proximo_cambio:%H:%M:%S}</p>
             </div>
             """, unsafe_allow_html=True)
         
@@ -900,6 +1666,7 @@ def mostrar_vista_pantalla_completa(df_peso_sauciso, ultimo_codigo, where_clause
                     ODP
                 FROM vwRegistrosDetallados 
                 WHERE CODIGO = '{codigo_mostrado}' 
+                    AND {condicion_calidad_sql()}
                     AND ODP = '{odp_mostrado}'
                     AND {where_clause}
             ),
@@ -948,42 +1715,123 @@ def mostrar_vista_pantalla_completa(df_peso_sauciso, ultimo_codigo, where_clause
         else:
             st.warning("No hay datos disponibles para mostrar en pantalla completa")
 
-    # Auto-actualizacion específica para pantalla completa cada 1 segundo
-    time.sleep(1)
-    st.rerun()
+    # Refrescar con datos nuevos o al llegar la próxima rotación
+    limite_rotacion = st.session_state.ultimo_cambio_combinacion + intervalo_rotacion if intervalo_rotacion and len(ultimas_combinaciones) > 1 else None
+    refrescar_vista('pantalla_completa', version_datos_sincronizada, limite=limite_rotacion)
 
-def crear_grafico_pantalla_completa_con_orden(df_peso_sauciso, codigo_actual, odp_actual, where_clause):
-    """Crear grafico optimizado para pantalla completa y TV con barra de progreso para combinación CODIGO+ODP específica"""
+def agregar_perfil_base(fig, df_peso_sauciso, codigo, progreso, escala=1.0):
+    """
+    Banda de referencia del código (mediana y P10-P90 de órdenes anteriores) en el
+    avance que tenía la orden en cada pesaje mostrado. Sale de la caché de perfiles.
+    """
+    if not progreso or progreso.get('kg_deben_embutir', 0) <= 0 or '_kgEmbutidos' not in df_peso_sauciso.columns:
+        return
+    # Avance en cada pesaje: kg embutidos actuales menos lo embutido en los pesajes posteriores
+    kg = df_peso_sauciso['_kgEmbutidos'].to_numpy(dtype=float)
+    kg_posteriores = kg[::-1].cumsum()[::-1] - kg
+    porcentajes = (progreso['kg_embutidos'] - kg_posteriores) / progreso['kg_deben_embutir'] * 100
+    banda = CACHE_PERFILES.banda(codigo, porcentajes)
+    if banda is None:
+        return
+    mediana, inferior, superior = banda
+    fechas = df_peso_sauciso['FECHAINGRESO']
+    fig.add_trace(go.Scatter(
+        x=fechas, y=superior, mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'
+    ))
+    fig.add_trace(go.Scatter(
+        x=fechas, y=inferior, mode='lines', line=dict(width=0), fill='tonexty',
+        fillcolor='rgba(128, 128, 128, 0.2)', showlegend=False, hoverinfo='skip'
+    ))
+    fig.add_trace(go.Scatter(
+        x=fechas, y=mediana, mode='lines', name='Referencia del código',
+        line=dict(color='rgba(100, 100, 100, 0.8)', width=max(1, int(round(3 * escala))), dash='dot'),
+        hovertemplate='<b>Referencia:</b> %{y:.2f} kg<extra></extra>'
+    ))
+
+def mostrar_alarma_peso(codigo, odp, escala=1.0, alarmas_activas=None):
+    """Aviso intermitente en la vista de TV si la orden tiene una alarma de peso activa"""
+    if alarmas_activas is None:
+        alarmas_activas = MOTOR_ALARMAS.alarmas_activas()
+    alarma = alarmas_activas.get((str(codigo), str(odp)))
+    if alarma is None:
+        return
+    sentido = "ALTO" if alarma['estado'] == 'alto' else "BAJO"
+    st.markdown(f"""
+    <style>
+    @keyframes parpadeo_alarma {{ 0%, 100% {{ opacity: 1; }} 50% {{ opacity: 0.25; }} }}
+    </style>
+    <div style='background-color: #d62728; color: white; text-align: center; border-radius: 8px;
+                padding: {max(4, int(10 * escala))}px; font-size: {max(12, int(28 * escala))}px; font-weight: bold;
+                animation: parpadeo_alarma 1s step-start infinite;'>
+        ⚠ PESO {sentido}: {alarma['peso_sauciso']:.2f} kg (objetivo {alarma['objetivo']:.2f} ± {alarma['tolerancia']:.2f})
+        desde {pd.Timestamp(alarma['FECHAINGRESO']):%H:%M}
+    </div>
+    """, unsafe_allow_html=True)
+
+def crear_grafico_pantalla_completa_con_orden(df_peso_sauciso, codigo_actual, odp_actual, where_clause, escala=1.0, progreso=None,
+                                              sesion_replay=None):
+    """
+    Crear grafico optimizado para pantalla completa y TV con barra de progreso para combinación CODIGO+ODP específica.
+    escala < 1 reduce alto y textos para mostrar varios paneles en grilla.
+    En reproducción usa el motor SPC, los estimadores y las alarmas propios de la sesión.
+    """
+    
+    def _t(tamano):
+        return max(8, int(round(tamano * escala)))
     
     # Evitar renderizado múltiple con un placeholder único
     container = st.container()
     
     with container:
-        # Calcular progreso usando la logica con orden específica
-        progreso = calcular_progreso_embuticion_bi(codigo_actual, where_clause, odp_actual)
+        # Calcular progreso usando la logica con orden específica (si no viene precalculado)
+        if progreso is None:
+            progreso = calcular_progreso_embuticion_bi(codigo_actual, where_clause, odp_actual)
+        
+        # Pronostico de fin de la orden con la misma serie en memoria
+        pronostico = pronosticar_fin_orden(
+            odp_actual, df_peso_sauciso, progreso,
+            registro=sesion_replay.estimadores if sesion_replay is not None else None,
+            ahora=sesion_replay.tiempo_simulado() if sesion_replay is not None else None
+        )
+        
+        # Alarma de tolerancia de peso de la orden (estado en memoria del motor de alarmas)
+        mostrar_alarma_peso(
+            codigo_actual, odp_actual, escala,
+            alarmas_activas=sesion_replay.alarmas_activas() if sesion_replay is not None else None
+        )
         
         # Configurar el grafico de lineas
         fig = go.Figure()
         
+        # Perfil de referencia del código por avance de la orden (debajo de la serie)
+        agregar_perfil_base(fig, df_peso_sauciso, codigo_actual, progreso, escala)
+        
         # Agregar linea principal optimizada para TV
         fig.add_trace(go.Scatter(
             x=df_peso_sauciso['FECHAINGRESO'],
             y=df_peso_sauciso['_PesoSauciso'],
             mode='lines+markers+text',
             name=f'Código {codigo_actual} - ODP {odp_actual}',
-            line=dict(color='#1f77b4', width=6),  # Linea mas gruesa para TV
-            marker=dict(size=12, symbol='circle', color='#1f77b4'),
+            line=dict(color='#1f77b4', width=_t(6)),  # Linea mas gruesa para TV
+            marker=dict(size=_t(12), symbol='circle', color='#1f77b4'),
             text=[f"{val:.2f}" for val in df_peso_sauciso['_PesoSauciso']], # Decimales en grafico
             textposition="top center",
-            textfont=dict(size=20, color='#1f77b4'),  # Texto mas grande para TV 
+            textfont=dict(size=_t(20), color='#1f77b4'),  # Texto mas grande para TV 
             hovertemplate='<b>Fecha:</b> %{x}<br><b>Peso Sauciso:</b> %{y:.2f} kg<extra></extra>'
         ))
         
+        # Limites de control de la orden (estado incremental, sin consultas extra)
+        resumen_spc = calcular_spc_por_serie(
+            df_peso_sauciso.assign(CODIGO=codigo_actual, ODP=odp_actual),
+            motor=sesion_replay.motor_spc if sesion_replay is not None else None
+        ).get((codigo_actual, odp_actual))
+        agregar_limites_control(fig, resumen_spc, tamano_texto=_t(18), ancho_linea=3)
+        
         # Configuracion del layout optimizado para pantalla completa
         fig.update_layout(
             title=dict(
                 text=f'<b>Orden: {odp_actual} | <span style="color: {"red" if progreso["saucissos_faltantes"] < 34 else "#000000"}">Sau.Fal: {progreso["saucissos_faltantes"]}</span></b>',
-                font=dict(size=28, color="#000000"),  # Titulo mas grande 
+                font=dict(size=_t(28), color="#000000"),  # Titulo mas grande 
                 x=0.100
             ),
             annotations=[
@@ -993,9 +1841,18 @@ def crear_grafico_pantalla_completa_con_orden(df_peso_sauciso, codigo_actual, od
                     xref="paper", yref="paper",
                     x=0.74, y=1.13,  # Posición
                     showarrow=False,
-                    font=dict(size=22, color="#000000"),  # Texto 
+                    font=dict(size=_t(22), color="#000000"),  # Texto 
                     xanchor="center"
                 ),
+                # Pronostico de fin junto a la barra de progreso
+                dict(
+                    text=f"<b>{formatear_pronostico(pronostico)}</b>",
+                    xref="paper", yref="paper",
+                    x=0.98, y=1.02,
+                    showarrow=False,
+                    font=dict(size=_t(18), color="#333333"),
+                    xanchor="right"
+                ),
                 
             ],
             # Shapes para crear la barra de progreso visual
@@ -1026,21 +1883,21 @@ def crear_grafico_pantalla_completa_con_orden(df_peso_sauciso, codigo_actual, od
                 )
             ],
             xaxis=dict(
-                title=dict(text='<b>Fecha y Hora</b>', font=dict(size=24)),
+                title=dict(text='<b>Fecha y Hora</b>', font=dict(size=_t(24))),
                 showgrid=True,
                 gridcolor='lightgray',
                 gridwidth=2,
-                tickfont=dict(size=15),  # Texto mas grande
+                tickfont=dict(size=_t(15)),  # Texto mas grande
                 showline=True,
                 linecolor='black',
                 linewidth=2
             ),
             yaxis=dict(
-                title=dict(text='<b>Peso Sauciso (kg)</b>' , font=dict(size=24)),
+                title=dict(text='<b>Peso Sauciso (kg)</b>' , font=dict(size=_t(24))),
                 showgrid=True,
                 gridcolor='lightgray',
                 gridwidth=2,
-                tickfont=dict(size=15),  # Texto más grande
+                tickfont=dict(size=_t(15)),  # Texto más grande
                 showline=True,
                 linecolor='black',
                 linewidth=2,
@@ -1049,15 +1906,15 @@ def crear_grafico_pantalla_completa_con_orden(df_peso_sauciso, codigo_actual, od
             ),
             plot_bgcolor='white',
             paper_bgcolor='white',
-            height=825,  # Altura mayor para pantalla completa
-            margin=dict(t=80, b=150, l=100, r=60),
+            height=_t(825),  # Altura mayor para pantalla completa
+            margin=dict(t=_t(80), b=_t(150), l=_t(100), r=_t(60)),
             dragmode='pan',
             showlegend=True,
             legend=dict(
                 x=0.02,
                 y=0.98,
                 bgcolor='rgba(255, 255, 255, 0.8)',
-                font=dict(size=16)
+                font=dict(size=_t(16))
             )
         )
         
@@ -1068,6 +1925,40 @@ def crear_grafico_pantalla_completa_con_orden(df_peso_sauciso, codigo_actual, od
             'scrollZoom': False
         }, key=f"grafico_{codigo_actual}_{odp_actual}")  # Clave única para evitar duplicación
 
+def obtener_serie_desde_rollups(fecha_inicio, fecha_fin, codigo, odp, incluir_odp):
+    """
+    Serie de peso sauciso agregada desde los rollups locales.
+    Devuelve None si el rango pide datos crudos o el almacen no cubre el periodo.
+    """
+    if elegir_granularidad(fecha_inicio, fecha_fin) is None:
+        return None
+    try:
+        sincronizar_ingesta()
+        cobertura = cobertura_desde()
+        if cobertura is None or cobertura > pd.Timestamp(fecha_inicio):
+            return None
+        df_rollup = consultar_rollup(fecha_inicio, fecha_fin, codigo, odp, incluir_odp=incluir_odp)
+    except Exception as e:
+        st.warning(f"No se pudieron usar los agregados locales: {e}")
+        return None
+    if df_rollup is None or df_rollup.empty:
+        return None
+    st.caption(f"📦 Datos agregados por {df_rollup.attrs['granularidad']} (rollup local)")
+    return df_rollup
+
+def resolver_ultimo_codigo(df_peso_sauciso):
+    """
+    Obtener el ultimo codigo registrado DE LOS DATOS QUE TIENEN PESO SAUCISO
+    directamente del DataFrame ya cargado (sin consultas adicionales)
+    """
+    if df_peso_sauciso is None or df_peso_sauciso.empty:
+        return "Sin datos"
+    codigos = df_peso_sauciso['CODIGO'].fillna('').astype(str).str.strip()
+    df_validos = df_peso_sauciso[(codigos != '') & (df_peso_sauciso['_kgEmbutidos'] > 0)]
+    if df_validos.empty:
+        return "Sin datos"
+    return df_validos.loc[df_validos['FECHAINGRESO'].idxmax(), 'CODIGO']
+
 def dashboard_peso_embuticion():
     """Dashboard específico para Peso Embutición - Tabla Peso Sauciso"""
     
@@ -1081,7 +1972,7 @@ def dashboard_peso_embuticion():
 
     # Inicializar session_state para persistencia de filtros
     if 'peso_ano_seleccionado' not in st.session_state:
-        st.session_state.peso_ano_seleccionado = '2025'  # Valor por defecto
+        st.session_state.peso_ano_seleccionado = ANO_POR_DEFECTO
     if 'peso_semana_seleccionada' not in st.session_state:
         st.session_state.peso_semana_seleccionada = 'Todas'
     if 'peso_dia_seleccionado' not in st.session_state:
@@ -1093,26 +1984,16 @@ def dashboard_peso_embuticion():
     if 'modo_pantalla_completa' not in st.session_state:
         st.session_state.modo_pantalla_completa = False
 
-    # Control de auto-refresh desde session state
+    # Control de auto-refresh desde session state (intervalo por defecto de la política de la vista normal)
     auto_refresh = st.session_state.get('auto_refresh', False)
-    refresh_interval = st.session_state.get('refresh_interval', 60)  # 60 segundos por defecto
+    refresh_interval = st.session_state.get('refresh_interval', PROGRAMADOR_REFRESCO.politica('normal')['intervalo_datos'])
     
     # Mostrar estado de actualización
     if auto_refresh:
-        # Calcular tiempo restante
-        last_update = st.session_state.get('last_update_time', datetime.now())
-        time_elapsed = (datetime.now() - last_update).total_seconds()
-        time_remaining = max(0, refresh_interval - time_elapsed)
-        
-        if time_remaining > 0:
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.success(f"🔄 **Actualización automática ACTIVA** - Cada {refresh_interval} segundos")
-        else:
-            st.success("🔄 **Actualizando datos...**")
-            st.session_state['last_update_time'] = datetime.now()
-            time.sleep(1)
-            st.rerun()
+        st.session_state['last_update_time'] = datetime.now()
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.success(f"🔄 **Actualización automática ACTIVA** - Revisión de datos nuevos cada {refresh_interval} segundos")
     else:
         st.info("⏸️ **Actualización automática DESACTIVADA** - Solo manual")
     
@@ -1127,13 +2008,7 @@ def dashboard_peso_embuticion():
     with col1:
         st.write("**Año**")
         # Obtener años disponibles
-        query_anos = """
-        SELECT DISTINCT YEAR(FECHAINGRESO) as Año
-        FROM vwRegistrosDetallados 
-        WHERE FECHAINGRESO IS NOT NULL
-        ORDER BY Año DESC
-        """
-        df_anos, _ = consultar_datos(query_anos)
+        df_anos, _ = consultar_datos(QUERY_ANOS)
         
         if df_anos is not None and not df_anos.empty:
             anos_disponibles = ['Todas'] + [str(int(año)) for año in df_anos['Año'].tolist()]
@@ -1142,7 +2017,7 @@ def dashboard_peso_embuticion():
             if st.session_state.peso_ano_seleccionado in anos_disponibles:
                 index_default = anos_disponibles.index(st.session_state.peso_ano_seleccionado)
             else:
-                index_default = 1 if '2025' in anos_disponibles else 0
+                index_default = 1 if ANO_POR_DEFECTO in anos_disponibles else 0
                 st.session_state.peso_ano_seleccionado = anos_disponibles[index_default]
             
             año_seleccionado = st.selectbox("", anos_disponibles, index=index_default, key="año")
@@ -1161,27 +2036,11 @@ def dashboard_peso_embuticion():
     
     with col2:
         st.write("**Semana**")
-        # Obtener semanas disponibles para el año seleccionado
-        if año_seleccionado != 'Todas':
-            query_semanas = f"""
-            SELECT DISTINCT DATEPART(week, FECHAINGRESO) as Semana
-            FROM vwRegistrosDetallados 
-            WHERE YEAR(FECHAINGRESO) = {año_seleccionado}
-            AND FECHAINGRESO IS NOT NULL
-            ORDER BY Semana
-            """
-        else:
-            query_semanas = """
-            SELECT DISTINCT DATEPART(week, FECHAINGRESO) as Semana
-            FROM vwRegistrosDetallados 
-            WHERE FECHAINGRESO IS NOT NULL
-            ORDER BY Semana
-            """
+        # Fechas con datos del año (una consulta); las semanas se resuelven con el calendario local
+        df_fechas = obtener_fechas_con_datos(año_seleccionado)
         
-        df_semanas, _ = consultar_datos(query_semanas)
-        
-        if df_semanas is not None and not df_semanas.empty:
-            semanas_disponibles = ['Todas'] + [str(int(sem)) for sem in df_semanas['Semana'].tolist()]
+        if df_fechas is not None and not df_fechas.empty:
+            semanas_disponibles = ['Todas'] + [str(sem) for sem in semanas_de_fechas(df_fechas['Fecha'])]
             
             # Usar el valor guardado en session_state si existe en las opciones disponibles
             if st.session_state.peso_semana_seleccionada in semanas_disponibles:
@@ -1205,48 +2064,11 @@ def dashboard_peso_embuticion():
     
     with col3:
         st.write("**Día**")
-        # Obtener días disponibles basado en selecciones anteriores
-        condiciones_dia = ["FECHAINGRESO IS NOT NULL"]
-        
-        if año_seleccionado != 'Todas':
-            condiciones_dia.append(f"YEAR(FECHAINGRESO) = {año_seleccionado}")
-        
-        if semana_seleccionada != 'Todas':
-            condiciones_dia.append(f"DATEPART(week, FECHAINGRESO) = {semana_seleccionada}")
-        
-        where_dia = " AND ".join(condiciones_dia)
-        
-        query_dias = f"""
-        SELECT DISTINCT DATENAME(weekday, FECHAINGRESO) as Nom_dia
-        FROM vwRegistrosDetallados 
-        WHERE {where_dia}
-        ORDER BY 
-            CASE DATENAME(weekday, FECHAINGRESO)
-                WHEN 'Monday' THEN 1
-                WHEN 'Tuesday' THEN 2
-                WHEN 'Wednesday' THEN 3
-                WHEN 'Thursday' THEN 4
-                WHEN 'Friday' THEN 5
-                WHEN 'Saturday' THEN 6
-                WHEN 'Sunday' THEN 7
-            END
-        """
-        
-        df_dias, _ = consultar_datos(query_dias)
-        
-        if df_dias is not None and not df_dias.empty:
-            # Mapear dias de ingles a español
-            dias_map = {
-                'Monday': 'lunes',
-                'Tuesday': 'martes', 
-                'Wednesday': 'miércoles',
-                'Thursday': 'jueves',
-                'Friday': 'viernes',
-                'Saturday': 'sábado',
-                'Sunday': 'domingo'
-            }
-            
-            dias_disponibles_es = ['Todas'] + [dias_map.get(dia, dia) for dia in df_dias['Nom_dia'].tolist()]
+        # Días disponibles a partir de las mismas fechas con datos (sin DATENAME dependiente del idioma)
+        if df_fechas is not None and not df_fechas.empty:
+            dias_disponibles_es = ['Todas'] + dias_de_fechas(
+                df_fechas['Fecha'], None if semana_seleccionada == 'Todas' else semana_seleccionada
+            )
         else:
             # Si no hay datos disponibles, mostrar todos los días
             dias_disponibles_es = ['Todas', 'lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
@@ -1268,6 +2090,12 @@ def dashboard_peso_embuticion():
             st.session_state.peso_odp_seleccionado = 'Todas'
             st.rerun()
     
+    # Filtro de tiempo resuelto a rangos de fechas con el calendario local
+    rangos_tiempo = resolver_rangos_filtro(
+        año_seleccionado, semana_seleccionada, dia_seleccionado,
+        anos_disponibles if df_anos is not None and not df_anos.empty else []
+    )
+    
     # Filtros adicionales
     st.subheader("Filtros")
     
@@ -1277,36 +2105,7 @@ def dashboard_peso_embuticion():
     with col1:
         st.write("**Por CÓDIGO**")
         # Obtener codigos disponibles basado en selecciones de tiempo
-        condiciones_codigo = ["FECHAINGRESO IS NOT NULL", "CODIGO IS NOT NULL", "CODIGO != ''"]
-        
-        if año_seleccionado != 'Todas':
-            condiciones_codigo.append(f"YEAR(FECHAINGRESO) = {año_seleccionado}")
-        
-        if semana_seleccionada != 'Todas':
-            condiciones_codigo.append(f"DATEPART(week, FECHAINGRESO) = {semana_seleccionada}")
-        
-        if dia_seleccionado != 'Todas':
-            dias_map_reverse = {
-                'lunes': 'Monday',
-                'martes': 'Tuesday', 
-                'miércoles': 'Wednesday',
-                'jueves': 'Thursday',
-                'viernes': 'Friday',
-                'sábado': 'Saturday',
-                'domingo': 'Sunday'
-            }
-            dia_ingles = dias_map_reverse.get(dia_seleccionado, dia_seleccionado)
-            condiciones_codigo.append(f"DATENAME(weekday, FECHAINGRESO) = '{dia_ingles}'")
-        
-        where_codigo = " AND ".join(condiciones_codigo)
-        
-        query_codigos = f"""
-        SELECT DISTINCT CODIGO
-        FROM vwRegistrosDetallados 
-        WHERE {where_codigo}
-        ORDER BY CODIGO
-        """
-        df_codigos, _ = consultar_datos(query_codigos)
+        df_codigos, _ = consultar_datos(query_codigos_disponibles(rangos_tiempo))
         
         if df_codigos is not None and not df_codigos.empty:
             codigos_disponibles = ['Todas'] + df_codigos['CODIGO'].tolist()
@@ -1342,57 +2141,7 @@ def dashboard_peso_embuticion():
     with col2:
         st.write("**Por ODP**")
         # Obtener ODPs disponibles basado en selecciones anteriores
-        condiciones_odp = ["FECHAINGRESO IS NOT NULL", "ODP IS NOT NULL", "ODP != ''"]
-        
-        if año_seleccionado != 'Todas':
-            condiciones_odp.append(f"YEAR(FECHAINGRESO) = {año_seleccionado}")
-        
-        if semana_seleccionada != 'Todas':
-            condiciones_odp.append(f"DATEPART(week, FECHAINGRESO) = {semana_seleccionada}")
-        
-        if dia_seleccionado != 'Todas':
-            dias_map_reverse = {
-                'lunes': 'Monday',
-                'martes': 'Tuesday', 
-                'miércoles': 'Wednesday',
-                'jueves': 'Thursday',
-                'viernes': 'Friday',
-                'sábado': 'Saturday',
-                'domingo': 'Sunday'
-            }
-            dia_ingles = dias_map_reverse.get(dia_seleccionado, dia_seleccionado)
-            condiciones_odp.append(f"DATENAME(weekday, FECHAINGRESO) = '{dia_ingles}'")
-        
-        if codigo_seleccionado != 'Todas':
-            condiciones_odp.append(f"CODIGO = '{codigo_seleccionado}'")
-        
-        where_odp = " AND ".join(condiciones_odp)
-        
-        # MEJORADO: Buscar ODPs tanto en registros como en órdenes disponibles
-        query_odps = f"""
-        WITH ODPsDeRegistros AS (
-            -- ODPs que YA tienen registros de producción (aplicando filtros)
-            SELECT DISTINCT ODP
-            FROM vwRegistrosDetallados 
-            WHERE {where_odp}
-        ),
-        ODPsDeOrdenes AS (
-            -- ODPs de órdenes que existen (aplicando filtros de código si está seleccionado)
-            SELECT DISTINCT od.CodigoOrden as ODP
-            FROM vwOrdenDocumento od
-            WHERE 1=1
-                {f"AND od.CodigoProducto = '{codigo_seleccionado}'" if codigo_seleccionado != 'Todas' else ''}
-        )
-        SELECT DISTINCT ODP 
-        FROM (
-            SELECT ODP FROM ODPsDeRegistros
-            UNION
-            SELECT ODP FROM ODPsDeOrdenes
-        ) AS TodosODPs
-        WHERE ODP IS NOT NULL AND ODP != ''
-        ORDER BY ODP
-        """
-        df_odps, _ = consultar_datos(query_odps)
+        df_odps, _ = consultar_datos(query_odps_disponibles(rangos_tiempo, codigo_seleccionado))
         
         if df_odps is not None and not df_odps.empty:
             odps_disponibles = ['Todas'] + df_odps['ODP'].tolist()
@@ -1446,27 +2195,11 @@ def dashboard_peso_embuticion():
     
     
     # Construir condiciones WHERE basadas en los filtros
-    condiciones_where = ["FECHAINGRESO IS NOT NULL", "PESONETO IS NOT NULL", "NUMEMBALAJE IS NOT NULL", "NUMEMBALAJE > 0"]
-    
-    if año_seleccionado != 'Todas':
-        condiciones_where.append(f"YEAR(FECHAINGRESO) = {año_seleccionado}")
+    # Mismas reglas de cuarentena que la ingesta local (rollups, sketches) para que ambos orígenes coincidan
+    condiciones_where = [condicion_calidad_sql()]
     
-    if semana_seleccionada != 'Todas':
-        condiciones_where.append(f"DATEPART(week, FECHAINGRESO) = {semana_seleccionada}")
-    
-    if dia_seleccionado != 'Todas':
-        # Mapear dias en español a ingles para SQL Server
-        dias_map = {
-            'lunes': 'Monday',
-            'martes': 'Tuesday', 
-            'miércoles': 'Wednesday',
-            'jueves': 'Thursday',
-            'viernes': 'Friday',
-            'sábado': 'Saturday',
-            'domingo': 'Sunday'
-        }
-        dia_ingles = dias_map.get(dia_seleccionado, dia_seleccionado)
-        condiciones_where.append(f"DATENAME(weekday, FECHAINGRESO) = '{dia_ingles}'")
+    if rangos_tiempo is not None:
+        condiciones_where.append(condicion_fecha(rangos_tiempo))
     
     if codigo_seleccionado != 'Todas':
         condiciones_where.append(f"CODIGO = '{codigo_seleccionado}'")
@@ -1476,6 +2209,16 @@ def dashboard_peso_embuticion():
     
     where_clause = " AND ".join(condiciones_where)
     
+    # Mismos filtros para el índice de actividad local (solo con un rango continuo o sin filtro de tiempo)
+    filtros_indice = None
+    if rangos_tiempo is None or len(rangos_tiempo) == 1:
+        filtros_indice = {
+            'desde': rangos_tiempo[0][0] if rangos_tiempo else None,
+            'hasta': rangos_tiempo[0][1] if rangos_tiempo else None,
+            'codigo': None if codigo_seleccionado == 'Todas' else codigo_seleccionado,
+            'odp': None if odp_seleccionado == 'Todas' else odp_seleccionado,
+        }
+    
     # Determinar si incluir ODP en la consulta (cuando se ha filtrado por una ODP específica)
     incluir_odp = odp_seleccionado != 'Todas'
     
@@ -1493,6 +2236,7 @@ def dashboard_peso_embuticion():
                 ODP
             FROM vwRegistrosDetallados 
             WHERE {where_clause}
+                AND {condicion_calidad_sql()}
         ),
         KgEmbutidos AS (
             SELECT 
@@ -1531,6 +2275,7 @@ def dashboard_peso_embuticion():
                 ODP
             FROM vwRegistrosDetallados 
             WHERE {where_clause}
+                AND {condicion_calidad_sql()}
         ),
         KgEmbutidos AS (
             SELECT 
@@ -1555,8 +2300,20 @@ def dashboard_peso_embuticion():
         ORDER BY FECHAINGRESO ASC
         """
     
+    # Rango continuo (año, semana o día): servir desde los rollups locales si cubren el periodo
+    df_peso_sauciso, error = None, None
+    if rangos_tiempo is not None and len(rangos_tiempo) == 1:
+        df_peso_sauciso = obtener_serie_desde_rollups(
+            rangos_tiempo[0][0],
+            rangos_tiempo[0][1],
+            None if codigo_seleccionado == 'Todas' else codigo_seleccionado,
+            None if odp_seleccionado == 'Todas' else odp_seleccionado,
+            incluir_odp
+        )
+    
     # Cargar datos
-    df_peso_sauciso, error = consultar_datos(query_peso_sauciso)
+    if df_peso_sauciso is None:
+        df_peso_sauciso, error = consultar_datos(query_peso_sauciso)
     
     if error:
         st.error(f"Error al cargar datos: {error}")
@@ -1569,91 +2326,6 @@ def dashboard_peso_embuticion():
     # Ordenar por fecha para el grafico
     df_peso_sauciso = df_peso_sauciso.sort_values('FECHAINGRESO')
     
-    # Obtener el ultimo codigo registrado DE LOS DATOS QUE TIENEN PESO SAUCISO
-    ultimo_codigo = "Sin datos"
-    if not df_peso_sauciso.empty:
-        # Obtener el ultimo codigo directamente de los datos calculados de peso sauciso
-        # Esto asegura que el codigo tenga datos reales para mostrar
-        query_ultimo_codigo_peso = f"""
-        WITH DatosEmbuticion AS (
-            SELECT 
-                FECHAINGRESO,
-                PESONETO,
-                NUMEMBALAJE,
-                PROCESO,
-                CODIGO,
-                ODP
-            FROM vwRegistrosDetallados 
-            WHERE {where_clause}
-        ),
-        KgEmbutidos AS (
-            SELECT 
-                FECHAINGRESO,
-                CODIGO,
-                SUM(CASE WHEN PROCESO = 'Embutición' THEN PESONETO ELSE 0 END) as _kgEmbutidos,
-                SUM(NUMEMBALAJE) as TotalEmbalajes
-            FROM DatosEmbuticion
-            GROUP BY FECHAINGRESO, CODIGO
-        ),
-        PesoSauciso AS (
-            SELECT 
-                FECHAINGRESO,
-                CODIGO,
-                _kgEmbutidos,
-                TotalEmbalajes,
-                CASE 
-                    WHEN TotalEmbalajes > 0 THEN _kgEmbutidos / TotalEmbalajes 
-                    ELSE 0 
-                END as _PesoSauciso
-            FROM KgEmbutidos
-            WHERE _kgEmbutidos > 0
-        )
-        SELECT TOP 1 CODIGO, FECHAINGRESO
-        FROM PesoSauciso
-        WHERE CODIGO IS NOT NULL 
-            AND CODIGO != ''
-        ORDER BY FECHAINGRESO DESC
-        """
-        try:
-            df_ultimo, _ = consultar_datos(query_ultimo_codigo_peso)
-            if df_ultimo is not None and not df_ultimo.empty and df_ultimo.iloc[0]['CODIGO'] is not None:
-                ultimo_codigo = df_ultimo.iloc[0]['CODIGO']
-            else:
-                # Fallback: consulta mas simple para obtener ultimo codigo con datos
-                query_simple = f"""
-                SELECT TOP 1 CODIGO 
-                FROM vwRegistrosDetallados 
-                WHERE {where_clause}
-                    AND PROCESO = 'Embutición'
-                    AND CODIGO IS NOT NULL 
-                    AND CODIGO != ''
-                    AND PESONETO > 0
-                ORDER BY FECHAINGRESO DESC
-                """
-                df_simple, _ = consultar_datos(query_simple)
-                if df_simple is not None and not df_simple.empty:
-                    ultimo_codigo = df_simple.iloc[0]['CODIGO']
-        except Exception as e:
-            st.error(f"Error al obtener ultimo codigo: {e}")
-            # Fallback final: consulta mas simple aun
-            try:
-                query_fallback = f"""
-                SELECT TOP 1 CODIGO 
-                FROM vwRegistrosDetallados 
-                WHERE {where_clause}
-                    AND CODIGO IS NOT NULL 
-                    AND CODIGO != ''
-                ORDER BY FECHAINGRESO DESC
-                """
-                df_fallback, _ = consultar_datos(query_fallback)
-                if df_fallback is not None and not df_fallback.empty:
-                    ultimo_codigo = df_fallback.iloc[0]['CODIGO']
-                else:
-                    ultimo_codigo = "Sin datos"
-            except:
-                ultimo_codigo = "Sin datos"
-    
-    
     # Botones de visualizacion
     col_btn1, col_btn2 = st.columns([1, 4])
     
@@ -1663,27 +2335,21 @@ def dashboard_peso_embuticion():
     # Mostrar vista segun el modo seleccionado
     if pantalla_completa or st.session_state.get('modo_pantalla_completa', False):
         st.session_state['modo_pantalla_completa'] = True
-        mostrar_vista_pantalla_completa(df_peso_sauciso, ultimo_codigo, where_clause)
+        mostrar_vista_pantalla_completa(df_peso_sauciso, resolver_ultimo_codigo(df_peso_sauciso), where_clause, filtros_indice)
     else:
         st.session_state['modo_pantalla_completa'] = False
-        # Debug temporal para verificar qué codigo se detecto (solo en vista normal)
-        if ultimo_codigo != "Sin datos":
-            st.info(f"🔍 Último código detectado: **{ultimo_codigo}**")
-        else:
-            st.warning("⚠️ No se pudo detectar último código con datos válidos")
+        # Grafico primero; el ultimo codigo (debug), resumen y detalle se cargan despues
         mostrar_vista_normal(df_peso_sauciso)
-    
-    # Auto-refresh si esta activado
-    if auto_refresh:
-        # En vista normal mostrar contador, en pantalla completa solo actualizar silenciosamente
-        if not st.session_state.get('modo_pantalla_completa', False):
-            # Vista normal: mostrar contador
-            placeholder = st.empty()
-            for i in range(refresh_interval, 0, -1):
-                placeholder.info(f"⏱️ Próxima actualización en: **{i} segundos**")
-                time.sleep(1)
-            placeholder.empty()
-        else:
-            # Pantalla completa: actualizar cada 1 segundo para alternancia suave
-            time.sleep(1)
-        st.rerun()
+        mostrar_distribucion_peso(
+            df_peso_sauciso,
+            rangos_tiempo,
+            None if codigo_seleccionado == 'Todas' else codigo_seleccionado,
+            None if odp_seleccionado == 'Todas' else odp_seleccionado
+        )
+        mostrar_exportacion(query_peso_sauciso)
+        mostrar_calidad_datos()
+
+        # Auto-refresh si esta activado: solo se vuelve a ejecutar cuando la ingesta trae datos nuevos
+        # (la pantalla completa ya registra su propio refresco)
+        if auto_refresh:
+            refrescar_vista('normal', version_datos_sincronizada, intervalo=refresh_interval)
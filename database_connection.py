@@ -1,33 +1,205 @@
+import copy
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
 import pyodbc
 import pandas as pd
 import streamlit as st
 
+from programador_refresco import PROGRAMADOR_REFRESCO
+
+logger = logging.getLogger(__name__)
+
+CADENA_CONEXION = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=192.168.3.18\\SCMI_PRODUCCION;"
+    "DATABASE=mms_planta;"
+    "UID=genmmsdw;"
+    "PWD=Pronaca2023;"
+    "Connection Timeout=30;"
+    "Login Timeout=30;"
+    "TrustServerCertificate=yes;"
+)
+
+# --- Interruptor de circuito: tras fallos seguidos no se intenta conectar hasta que un sondeo en segundo plano lo logre ---
+FALLOS_PARA_ABRIR_CIRCUITO = int(os.environ.get("PESO_CIRCUITO_FALLOS", "3"))
+SEGUNDOS_ENTRE_SONDEOS = int(os.environ.get("PESO_CIRCUITO_SONDEO_SEGUNDOS", "15"))
+# El sondeo usa un login corto: solo confirma que el servidor volvió
+SEGUNDOS_LOGIN_SONDEO = 5
+
+class InterruptorCircuito:
+    """
+    Estados: cerrado (se conecta normalmente) y abierto (se falla de inmediato sin
+    esperar el timeout de login). Abre tras FALLOS_PARA_ABRIR_CIRCUITO fallos seguidos;
+    mientras está abierto un hilo sondea la conexión y lo cierra cuando responde.
+    """
+
+    def __init__(self, fallos_para_abrir=FALLOS_PARA_ABRIR_CIRCUITO, segundos_sondeo=SEGUNDOS_ENTRE_SONDEOS):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.segundos_sondeo = segundos_sondeo
+        self.fallos = 0
+        self.abierto_desde = None
+        self.ultimo_exito = None
+        self.ultimo_error = None
+        self.sondeo = None
+        self.lock = threading.Lock()
+
+    def permitir(self):
+        """True si se puede intentar conectar (circuito cerrado)"""
+        with self.lock:
+            return self.abierto_desde is None
+
+    def registrar_exito(self):
+        with self.lock:
+            if self.abierto_desde is not None:
+                logger.info("Conexión a SQL Server recuperada, circuito cerrado")
+            self.fallos = 0
+            self.abierto_desde = None
+            self.ultimo_exito = datetime.now()
+
+    def registrar_fallo(self, error):
+        with self.lock:
+            self.fallos += 1
+            self.ultimo_error = str(error)
+            if self.abierto_desde is not None or self.fallos < self.fallos_para_abrir:
+                return
+            self.abierto_desde = datetime.now()
+            logger.warning("Circuito abierto tras %d fallos de conexión: %s", self.fallos, error)
+            if self.sondeo is None or not self.sondeo.is_alive():
+                self.sondeo = threading.Thread(target=self._sondear, name="sondeo_sql_server", daemon=True)
+                self.sondeo.start()
+
+    def _sondear(self):
+        cadena = CADENA_CONEXION.replace("Login Timeout=30;", f"Login Timeout={SEGUNDOS_LOGIN_SONDEO};")
+        while not self.permitir():
+            time.sleep(self.segundos_sondeo)
+            try:
+                pyodbc.connect(cadena).close()
+            except Exception as e:
+                with self.lock:
+                    self.ultimo_error = str(e)
+                continue
+            self.registrar_exito()
+
+    def estado(self):
+        """abierto, abierto_desde, ultimo_exito, fallos y ultimo_error"""
+        with self.lock:
+            return {
+                'abierto': self.abierto_desde is not None,
+                'abierto_desde': self.abierto_desde,
+                'ultimo_exito': self.ultimo_exito,
+                'fallos': self.fallos,
+                'ultimo_error': self.ultimo_error,
+            }
+
+
+INTERRUPTOR_SQL = InterruptorCircuito()
+
+def estado_conexion():
+    """Estado del interruptor de circuito de SQL Server"""
+    return INTERRUPTOR_SQL.estado()
+
 def conectar_sql_server():
     """
-    Conexión a SQL Server usando pyodbc 
-    """
-    connection_string = (
-        "DRIVER={ODBC Driver 17 for SQL Server};"
-        "SERVER=192.168.3.18\\SCMI_PRODUCCION;"
-        "DATABASE=mms_planta;"
-        "UID=genmmsdw;"
-        "PWD=Pronaca2023;"
-        "Connection Timeout=30;"
-        "Login Timeout=30;"
-        "TrustServerCertificate=yes;"
-    )
-    
+    Conexión a SQL Server usando pyodbc.
+    Con el circuito abierto devuelve None de inmediato (sin esperar el timeout de login).
+    """
+    if not INTERRUPTOR_SQL.permitir():
+        return None
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = pyodbc.connect(CADENA_CONEXION)
+        INTERRUPTOR_SQL.registrar_exito()
         return conn
     except Exception as e:
-        st.error(f"❌ Error de conexión: {e}")
+        INTERRUPTOR_SQL.registrar_fallo(e)
+        if INTERRUPTOR_SQL.permitir():
+            st.error(f"❌ Error de conexión: {e}")
         return None
 
-@st.cache_data(ttl=30)  # Cache por 30 segundos para tiempo real
-def consultar_datos(query, force_refresh=False):
+# --- Single-flight: una sola ejecución simultánea por consulta, el resto comparte el resultado ---
+class _LlamadaEnCurso:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.excepcion = None
+
+_llamadas_en_curso = {}
+_lock_llamadas = threading.Lock()
+_estadisticas_single_flight = {'ejecutadas': 0, 'compartidas': 0}
+
+_PATRON_LITERALES = re.compile(r"('(?:[^']|'')*')")
+
+def normalizar_query(query):
+    """Colapsar espacios y saltos de línea fuera de los literales de texto"""
+    partes = _PATRON_LITERALES.split(query)
+    return "".join(
+        parte if i % 2 else re.sub(r"\s+", " ", parte)
+        for i, parte in enumerate(partes)
+    ).strip()
+
+def ejecutar_una_vez(clave, funcion):
+    """
+    Ejecutar funcion() una sola vez para llamadas simultáneas con la misma clave:
+    la primera la ejecuta y las demás esperan y reciben una copia de su resultado
+    """
+    with _lock_llamadas:
+        llamada = _llamadas_en_curso.get(clave)
+        es_lider = llamada is None
+        if es_lider:
+            llamada = _llamadas_en_curso[clave] = _LlamadaEnCurso()
+            _estadisticas_single_flight['ejecutadas'] += 1
+        else:
+            _estadisticas_single_flight['compartidas'] += 1
+
+    if not es_lider:
+        llamada.evento.wait()
+        if llamada.excepcion is not None:
+            raise llamada.excepcion
+        # Copia para que una sesión no modifique el DataFrame de otra
+        return copy.deepcopy(llamada.resultado)
+
+    try:
+        llamada.resultado = funcion()
+        return llamada.resultado
+    except Exception as e:
+        llamada.excepcion = e
+        raise
+    finally:
+        with _lock_llamadas:
+            _llamadas_en_curso.pop(clave, None)
+        llamada.evento.set()
+
+def estadisticas_single_flight():
+    """Consultas ejecutadas y llamadas que compartieron el resultado de otra en curso"""
+    with _lock_llamadas:
+        return dict(_estadisticas_single_flight)
+
+# Vigencia máxima de una entrada de caché; la vigencia efectiva la define la política de refresco
+TTL_MAXIMO_CACHE = 600
+
+def consultar_datos(query, force_refresh=False, vista=None, version=None):
+    """
+    Función para ejecutar consultas SQL y retornar DataFrame.
+    El resultado se cachea según el ttl_cache de la política de refresco de la vista
+    (y se renueva antes si cambia la versión de datos indicada).
+    """
+    clave_refresco = PROGRAMADOR_REFRESCO.clave_cache(vista, version)
+    # Varias sesiones con la caché vencida al mismo tiempo: una sola llega a SQL Server
+    try:
+        return ejecutar_una_vez(
+            ('cache', normalizar_query(query), force_refresh, clave_refresco),
+            lambda: _consultar_datos_cache(query, force_refresh, clave_refresco)
+        )
+    except ConnectionError as e:
+        return None, str(e)
+
+@st.cache_data(ttl=TTL_MAXIMO_CACHE, max_entries=200)
+def _consultar_datos_cache(query, force_refresh=False, clave_refresco=None):
     """
-    Función para ejecutar consultas SQL y retornar DataFrame
+    Consulta cacheada por (query, clave_refresco)
     """
     conn = conectar_sql_server()
     if conn:
@@ -38,12 +210,17 @@ def consultar_datos(query, force_refresh=False):
         except Exception as e:
             conn.close()
             return None, f"Error en consulta: {e}"
-    return None, "No se pudo conectar a la base de datos"
+    # Excepción en lugar de resultado: un fallo de conexión no queda en la caché
+    raise ConnectionError(mensaje_sin_conexion())
 
 def consultar_datos_tiempo_real(query):
     """
-    Función para consultas en tiempo real (sin caché)
+    Función para consultas en tiempo real (sin caché; las llamadas simultáneas
+    con la misma consulta comparten una sola ejecución)
     """
+    return ejecutar_una_vez(('tiempo_real', normalizar_query(query)), lambda: _ejecutar_consulta(query))
+
+def _ejecutar_consulta(query):
     conn = conectar_sql_server()
     if conn:
         try:
@@ -53,7 +230,26 @@ def consultar_datos_tiempo_real(query):
         except Exception as e:
             conn.close()
             return None, f"Error en consulta: {e}"
-    return None, "No se pudo conectar a la base de datos"
+    return None, mensaje_sin_conexion()
+
+def mensaje_sin_conexion():
+    if not INTERRUPTOR_SQL.permitir():
+        return "Conexión a la base de datos suspendida (circuito abierto, reintentando en segundo plano)"
+    return "No se pudo conectar a la base de datos"
+
+def consultar_datos_por_lotes(query, tamano_lote=50000):
+    """
+    Ejecutar una consulta y entregar el resultado en DataFrames de tamano_lote filas
+    (sin caché ni resultado completo en memoria). La conexión se cierra al terminar.
+    """
+    conn = conectar_sql_server()
+    if not conn:
+        raise ConnectionError(mensaje_sin_conexion())
+    try:
+        for df_lote in pd.read_sql(query, conn, chunksize=tamano_lote):
+            yield df_lote
+    finally:
+        conn.close()
 
 def verificar_conexion():
     """
@@ -77,3 +273,106 @@ def obtener_tablas():
     """
     df, error = consultar_datos(query)
     return df, error
+
+# --- Alimentación por cambios (Change Tracking / rowversion) ---
+# Tabla base detrás de vwRegistrosDetallados y nombres de sus columnas
+CONFIG_CAMBIOS = {
+    'modo': os.environ.get("PESO_CDC_MODO", "change_tracking"),  # change_tracking | rowversion
+    'tabla': os.environ.get("PESO_CDC_TABLA", ""),
+    'clave': os.environ.get("PESO_CDC_CLAVE", "ID"),
+    'columna_version': os.environ.get("PESO_CDC_ROWVERSION", "RowVer"),
+    # Mapeo columna de la vista = columna de la tabla base, ej: "FECHAINGRESO=FechaIngreso,CODIGO=CodProducto"
+    'columnas': dict(
+        par.split("=", 1) for par in os.environ.get("PESO_CDC_COLUMNAS", "").split(",") if "=" in par
+    ),
+}
+COLUMNAS_REGISTRO = ['FECHAINGRESO', 'CODIGO', 'ODP', 'PROCESO', 'PESONETO', 'NUMEMBALAJE']
+
+def _columnas_tabla_base(alias=""):
+    """Lista SELECT de la tabla base con los nombres de columna de la vista"""
+    prefijo = f"{alias}." if alias else ""
+    return ",\n        ".join(
+        f"{prefijo}{CONFIG_CAMBIOS['columnas'].get(col, col)} AS {col}" for col in COLUMNAS_REGISTRO
+    )
+
+class FuenteCambiosSQLServer:
+    """
+    Fuente de cambios sobre la tabla base de SQL Server.
+    - change_tracking: CHANGETABLE(CHANGES ...) con inserciones, actualizaciones y borrados
+    - rowversion: filas con rowversion mayor al token (no detecta borrados)
+    Misma interfaz que la fuente local de pruebas (fuente_cambios_local.FuenteCambiosLocal).
+    """
+
+    def __init__(self, config=None):
+        self.config = config or CONFIG_CAMBIOS
+        if not self.config['tabla']:
+            raise ValueError("Configure PESO_CDC_TABLA con la tabla base de vwRegistrosDetallados")
+
+    def _version_actual(self):
+        if self.config['modo'] == 'rowversion':
+            query = f"SELECT CONVERT(BIGINT, MAX({self.config['columna_version']})) AS Version FROM {self.config['tabla']}"
+        else:
+            query = "SELECT CHANGE_TRACKING_CURRENT_VERSION() AS Version"
+        df, error = consultar_datos_tiempo_real(query)
+        if error:
+            raise ConnectionError(error)
+        version = df.iloc[0]['Version'] if df is not None and not df.empty else None
+        return 0 if version is None or pd.isna(version) else int(version)
+
+    def carga_inicial(self, fecha_desde):
+        """Registros de la tabla base desde una fecha y el token a partir del cual leer cambios"""
+        # El token se toma antes de leer: los cambios concurrentes se vuelven a aplicar (idempotente)
+        token = self._version_actual()
+        columna_fecha = self.config['columnas'].get('FECHAINGRESO', 'FECHAINGRESO')
+        query = f"""
+        SELECT
+            CAST({self.config['clave']} AS NVARCHAR(100)) AS ID,
+            {_columnas_tabla_base()}
+        FROM {self.config['tabla']}
+        WHERE {columna_fecha} >= '{fecha_desde:%Y-%m-%dT%H:%M:%S}'
+        """
+        df, error = consultar_datos_tiempo_real(query)
+        if error:
+            raise ConnectionError(error)
+        return df, token
+
+    def cambios_desde(self, token):
+        """
+        Cambios posteriores al token: DataFrame con ID, OPERACION (I/U/D) y columnas del registro.
+        Devuelve (None, None) si el token ya no es válido y hay que recargar.
+        """
+        tabla, clave = self.config['tabla'], self.config['clave']
+        if self.config['modo'] == 'rowversion':
+            nuevo_token = self._version_actual()
+            query = f"""
+            SELECT
+                'U' AS OPERACION,
+                CAST({clave} AS NVARCHAR(100)) AS ID,
+                {_columnas_tabla_base()}
+            FROM {tabla}
+            WHERE {self.config['columna_version']} > CONVERT(BINARY(8), CONVERT(BIGINT, {int(token)}))
+                AND {self.config['columna_version']} <= CONVERT(BINARY(8), CONVERT(BIGINT, {nuevo_token}))
+            """
+        else:
+            df_minima, error = consultar_datos_tiempo_real(
+                f"SELECT CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('{tabla}')) AS Version"
+            )
+            if error:
+                raise ConnectionError(error)
+            minima = df_minima.iloc[0]['Version']
+            if minima is not None and not pd.isna(minima) and int(token) < int(minima):
+                return None, None
+            nuevo_token = self._version_actual()
+            query = f"""
+            SELECT
+                CT.SYS_CHANGE_OPERATION AS OPERACION,
+                CAST(CT.{clave} AS NVARCHAR(100)) AS ID,
+                {_columnas_tabla_base('t')}
+            FROM CHANGETABLE(CHANGES {tabla}, {int(token)}) AS CT
+            LEFT JOIN {tabla} t ON t.{clave} = CT.{clave}
+            WHERE CT.SYS_CHANGE_VERSION <= {nuevo_token}
+            """
+        df, error = consultar_datos_tiempo_real(query)
+        if error:
+            raise ConnectionError(error)
+        return df, nuevo_token
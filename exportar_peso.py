@@ -0,0 +1,107 @@
+import importlib.util
+import os
+import tempfile
+
+import pandas as pd
+
+from database_connection import consultar_datos_por_lotes
+
+# Filas por lote leído de SQL Server y escrito al archivo
+TAMANO_LOTE_EXPORTACION = 50000
+# Límite de filas de una hoja de Excel (sin encabezado)
+MAXIMO_FILAS_HOJA = 1048575
+
+FORMATOS_EXPORTACION = {
+    'csv': {'extension': '.csv', 'mime': 'text/csv', 'modulo': None},
+    'parquet': {'extension': '.parquet', 'mime': 'application/octet-stream', 'modulo': 'pyarrow'},
+    'xlsx': {'extension': '.xlsx', 'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'modulo': 'openpyxl'},
+}
+
+def formatos_disponibles():
+    """Formatos cuya dependencia opcional está instalada"""
+    return [
+        nombre for nombre, config in FORMATOS_EXPORTACION.items()
+        if config['modulo'] is None or importlib.util.find_spec(config['modulo']) is not None
+    ]
+
+def formatear_lote(df_lote):
+    """Mismas columnas y nombres que la tabla de datos detallados, más kg y embalajes"""
+    df_lote = df_lote.assign(FECHAINGRESO=pd.to_datetime(df_lote['FECHAINGRESO']))
+    columnas = {'CODIGO': df_lote['CODIGO'].astype(str)}
+    if 'ODP' in df_lote.columns:
+        columnas['ODP'] = df_lote['ODP'].fillna('').astype(str)
+    columnas['Fecha'] = df_lote['FECHAINGRESO'].dt.strftime('%d/%m/%Y')
+    columnas['Hora'] = df_lote['FECHAINGRESO'].dt.strftime('%H:%M:%S')
+    columnas['Kg Embutidos'] = df_lote['_kgEmbutidos'].astype(float).round(3)
+    columnas['Embalajes'] = df_lote['TotalEmbalajes'].astype(float)
+    columnas['Peso Sauciso (kg)'] = df_lote['_PesoSauciso'].astype(float).round(2)
+    return pd.DataFrame(columnas).rename(columns={'CODIGO': 'Código'})
+
+def _escribir_csv(lotes, ruta):
+    filas = 0
+    with open(ruta, 'w', encoding='utf-8-sig', newline='') as archivo:
+        for i, df_lote in enumerate(lotes):
+            df_lote.to_csv(archivo, index=False, header=(i == 0))
+            filas += len(df_lote)
+    return filas
+
+def _escribir_parquet(lotes, ruta):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    filas, escritor = 0, None
+    try:
+        for df_lote in lotes:
+            tabla = pa.Table.from_pandas(df_lote, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(ruta, tabla.schema, compression='snappy')
+            escritor.write_table(tabla.cast(escritor.schema))
+            filas += len(df_lote)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    if escritor is None:
+        pd.DataFrame().to_parquet(ruta)
+    return filas
+
+def _escribir_xlsx(lotes, ruta):
+    from openpyxl import Workbook
+    # Modo solo escritura: las filas se vuelcan al archivo sin mantener la hoja en memoria
+    libro = Workbook(write_only=True)
+    hoja, filas, filas_hoja, encabezado = None, 0, 0, None
+    for df_lote in lotes:
+        encabezado = list(df_lote.columns)
+        for fila in df_lote.itertuples(index=False, name=None):
+            if hoja is None or filas_hoja >= MAXIMO_FILAS_HOJA:
+                hoja = libro.create_sheet(f"Datos {len(libro.worksheets) + 1}")
+                hoja.append(encabezado)
+                filas_hoja = 0
+            hoja.append(list(fila))
+            filas_hoja += 1
+        filas += len(df_lote)
+    if hoja is None:
+        libro.create_sheet("Datos 1")
+    libro.save(ruta)
+    return filas
+
+_ESCRITORES = {'csv': _escribir_csv, 'parquet': _escribir_parquet, 'xlsx': _escribir_xlsx}
+
+def exportar_consulta(query, formato, ruta=None, tamano_lote=TAMANO_LOTE_EXPORTACION):
+    """
+    Exportar el resultado de una consulta de peso sauciso lote a lote a un archivo.
+    Devuelve (ruta, filas). Si no se indica ruta se crea un archivo temporal.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    if formato not in formatos_disponibles():
+        raise ImportError(f"Para exportar a {formato} se requiere {FORMATOS_EXPORTACION[formato]['modulo']}")
+    if ruta is None:
+        descriptor, ruta = tempfile.mkstemp(prefix="peso_sauciso_", suffix=FORMATOS_EXPORTACION[formato]['extension'])
+        os.close(descriptor)
+    lotes = (formatear_lote(df_lote) for df_lote in consultar_datos_por_lotes(query, tamano_lote))
+    try:
+        filas = _ESCRITORES[formato](lotes, ruta)
+    except Exception:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        raise
+    return ruta, filas
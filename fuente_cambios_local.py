@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+
+import pandas as pd
+
+from database_connection import COLUMNAS_REGISTRO
+
+
+class FuenteCambiosLocal:
+    """
+    Sustituto local de la fuente de cambios de SQL Server (misma interfaz que
+    FuenteCambiosSQLServer) para probar la ingesta por cambios sin servidor.
+
+    Emula Change Tracking: cada inserción, actualización o borrado incrementa
+    una versión y cambios_desde(token) devuelve el cambio neto por registro.
+    """
+
+    def __init__(self, ruta=":memory:"):
+        self.conn = sqlite3.connect(ruta, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS registros (
+                ID TEXT PRIMARY KEY,
+                FECHAINGRESO TEXT,
+                CODIGO TEXT,
+                ODP TEXT,
+                PROCESO TEXT,
+                PESONETO REAL,
+                NUMEMBALAJE REAL
+            );
+            CREATE TABLE IF NOT EXISTS cambios (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                ID TEXT NOT NULL,
+                OPERACION TEXT NOT NULL
+            );
+        """)
+
+    def _registrar(self, id_registro, operacion):
+        self.conn.execute("INSERT INTO cambios (ID, OPERACION) VALUES (?, ?)", (str(id_registro), operacion))
+
+    def insertar(self, df_registros):
+        """Insertar registros (DataFrame con ID y las columnas de vwRegistrosDetallados)"""
+        with self.lock:
+            for fila in df_registros.to_dict('records'):
+                valores = [str(fila['ID'])] + [
+                    pd.Timestamp(fila[c]).isoformat(sep=' ') if c == 'FECHAINGRESO' else fila[c]
+                    for c in COLUMNAS_REGISTRO
+                ]
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO registros (ID, {', '.join(COLUMNAS_REGISTRO)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    valores
+                )
+                self._registrar(fila['ID'], 'I')
+            self.conn.commit()
+
+    def actualizar(self, id_registro, **columnas):
+        """Actualizar columnas de un registro existente"""
+        with self.lock:
+            asignaciones = ", ".join(f"{c} = ?" for c in columnas)
+            valores = [
+                pd.Timestamp(v).isoformat(sep=' ') if c == 'FECHAINGRESO' else v
+                for c, v in columnas.items()
+            ]
+            self.conn.execute(f"UPDATE registros SET {asignaciones} WHERE ID = ?", valores + [str(id_registro)])
+            self._registrar(id_registro, 'U')
+            self.conn.commit()
+
+    def eliminar(self, id_registro):
+        """Borrar un registro"""
+        with self.lock:
+            self.conn.execute("DELETE FROM registros WHERE ID = ?", (str(id_registro),))
+            self._registrar(id_registro, 'D')
+            self.conn.commit()
+
+    def _version_actual(self):
+        fila = self.conn.execute("SELECT MAX(version) FROM cambios").fetchone()
+        return fila[0] or 0
+
+    def _leer(self, query, parametros=()):
+        df = pd.read_sql_query(query, self.conn, params=parametros)
+        df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+        return df
+
+    def carga_inicial(self, fecha_desde):
+        """Registros desde una fecha y token de la versión actual"""
+        with self.lock:
+            token = self._version_actual()
+            df = self._leer(
+                f"SELECT ID, {', '.join(COLUMNAS_REGISTRO)} FROM registros WHERE FECHAINGRESO >= ?",
+                (pd.Timestamp(fecha_desde).isoformat(sep=' '),)
+            )
+            return df, token
+
+    def cambios_desde(self, token):
+        """Cambio neto por registro desde el token (I si se insertó después del token, D si ya no existe)"""
+        with self.lock:
+            nuevo_token = self._version_actual()
+            df = self._leer(f"""
+                SELECT
+                    CASE
+                        WHEN r.ID IS NULL THEN 'D'
+                        WHEN MIN(CASE WHEN c.OPERACION = 'I' THEN c.version END) IS NOT NULL THEN 'I'
+                        ELSE 'U'
+                    END AS OPERACION,
+                    c.ID,
+                    {', '.join('r.' + col + ' AS ' + col for col in COLUMNAS_REGISTRO)}
+                FROM cambios c
+                LEFT JOIN registros r ON r.ID = c.ID
+                WHERE c.version > ? AND c.version <= ?
+                GROUP BY c.ID
+            """, (int(token), nuevo_token))
+            return df, nuevo_token
@@ -0,0 +1,152 @@
+import threading
+from bisect import bisect_left, insort
+
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema, cargar_claves_temporales
+from ingesta_peso import registrar_consumidor, cobertura_desde, ESQUEMA_PUNTOS
+
+
+class IndiceActividad:
+    """
+    Índice de actividad por orden (CODIGO, ODP) mantenido por la ingesta:
+    primer y último FECHAINGRESO, kg embutidos y cantidad de pesajes.
+
+    Las órdenes se guardan además en una lista ordenada por último pesaje,
+    así "las últimas N órdenes" se leen desde el final sin agrupar pesajes.
+    """
+
+    def __init__(self):
+        self.ordenes = {}    # (CODIGO, ODP) -> {'primera', 'ultima', 'kg', 'cantidad'}
+        self.por_fecha = []  # [(ultima, CODIGO, ODP)] ordenada ascendente
+        self.cargado = False
+        self.lock = threading.Lock()
+
+    def _quitar(self, clave):
+        entrada = self.ordenes.pop(clave, None)
+        if entrada is not None:
+            posicion = bisect_left(self.por_fecha, (entrada['ultima'], *clave))
+            if posicion < len(self.por_fecha) and self.por_fecha[posicion] == (entrada['ultima'], *clave):
+                del self.por_fecha[posicion]
+
+    def _poner(self, clave, entrada):
+        self._quitar(clave)
+        self.ordenes[clave] = entrada
+        insort(self.por_fecha, (entrada['ultima'], *clave))
+
+    def _leer_agregados(self, claves=None):
+        """Agregados por orden desde los puntos locales (todas o las indicadas)"""
+        asegurar_esquema("puntos", ESQUEMA_PUNTOS)
+        conn = conectar_almacen_local()
+        try:
+            origen = "puntos_peso"
+            if claves is not None:
+                # Órdenes indicadas en una tabla temporal: un JOIN en lugar de una consulta por orden
+                cargar_claves_temporales(conn, "ordenes_afectadas", ['CODIGO', 'ODP'], list(claves))
+                origen = "puntos_peso INNER JOIN temp.ordenes_afectadas USING (CODIGO, ODP)"
+            filas = conn.execute(f"""
+                SELECT CODIGO, ODP, MIN(FECHAINGRESO) as primera, MAX(FECHAINGRESO) as ultima,
+                       SUM(kg_embutidos) as kg, COUNT(*) as cantidad
+                FROM {origen}
+                GROUP BY CODIGO, ODP
+            """).fetchall()
+        finally:
+            conn.close()
+        return filas
+
+    def _cargar(self):
+        """Construir el índice completo una vez por proceso"""
+        for codigo, odp, primera, ultima, kg, cantidad in self._leer_agregados():
+            self._poner((codigo, odp), {
+                'primera': pd.Timestamp(primera), 'ultima': pd.Timestamp(ultima),
+                'kg': float(kg), 'cantidad': int(cantidad)
+            })
+        self.cargado = True
+
+    def actualizar(self, df_nuevos, df_reemplazados):
+        """Consumidor de ingesta: sumar pesajes nuevos; recalcular las órdenes con pesajes modificados o borrados"""
+        with self.lock:
+            if not self.cargado:
+                # La primera carga ya incluye los puntos recién guardados
+                self._cargar()
+                return
+            recalcular = set()
+            if df_reemplazados is not None and not df_reemplazados.empty:
+                recalcular = set(df_reemplazados[['CODIGO', 'ODP']].itertuples(index=False, name=None))
+            if not df_nuevos.empty:
+                df_agregado = df_nuevos.groupby(['CODIGO', 'ODP']).agg(
+                    primera=('FECHAINGRESO', 'min'),
+                    ultima=('FECHAINGRESO', 'max'),
+                    kg=('_kgEmbutidos', 'sum'),
+                    cantidad=('FECHAINGRESO', 'size'),
+                )
+                for clave, fila in df_agregado.iterrows():
+                    if clave in recalcular:
+                        continue
+                    anterior = self.ordenes.get(clave)
+                    if anterior is None:
+                        entrada = {'primera': fila['primera'], 'ultima': fila['ultima'],
+                                   'kg': float(fila['kg']), 'cantidad': int(fila['cantidad'])}
+                    else:
+                        entrada = {
+                            'primera': min(anterior['primera'], fila['primera']),
+                            'ultima': max(anterior['ultima'], fila['ultima']),
+                            'kg': anterior['kg'] + float(fila['kg']),
+                            'cantidad': anterior['cantidad'] + int(fila['cantidad']),
+                        }
+                    self._poner(clave, entrada)
+            if recalcular:
+                filas = {(c, o): (p, u, kg, n) for c, o, p, u, kg, n in self._leer_agregados(recalcular)}
+                for clave in recalcular:
+                    if clave in filas:
+                        primera, ultima, kg, cantidad = filas[clave]
+                        self._poner(clave, {'primera': pd.Timestamp(primera), 'ultima': pd.Timestamp(ultima),
+                                            'kg': float(kg), 'cantidad': int(cantidad)})
+                    else:
+                        self._quitar(clave)
+
+    def ultimas_ordenes(self, cantidad, desde=None, hasta=None, codigo=None, odp=None):
+        """
+        Últimas N órdenes (CODIGO, ODP) con ODP, por último pesaje descendente.
+        Devuelve None si el índice no puede responder exactamente (historia local
+        insuficiente o un rango que termina antes del último pesaje conocido).
+        """
+        cobertura = cobertura_desde()
+        with self.lock:
+            if not self.cargado:
+                self._cargar()
+            if cobertura is None or not self.por_fecha:
+                return None
+            # Con un rango cerrado en el pasado el último pesaje de la orden dentro del rango es desconocido
+            if hasta is not None and pd.Timestamp(hasta) <= self.por_fecha[-1][0]:
+                return None
+            resultado = []
+            for ultima, codigo_orden, odp_orden in reversed(self.por_fecha):
+                if desde is not None and ultima < pd.Timestamp(desde):
+                    break
+                if not odp_orden or (codigo is not None and codigo_orden != codigo) or (odp is not None and odp_orden != odp):
+                    continue
+                resultado.append((codigo_orden, odp_orden))
+                if len(resultado) >= cantidad:
+                    return resultado
+            # Faltan órdenes: solo es exacto si el periodo pedido está dentro de la historia local
+            # (las órdenes fuera del índice tienen su último pesaje antes de la cobertura)
+            if desde is None or pd.Timestamp(desde) < cobertura:
+                return None
+            return resultado
+
+    def limites_orden(self, codigo, odp):
+        """
+        Primer y último pesaje, kg embutidos y cantidad de pesajes de una orden (o None).
+        Para órdenes que empezaron antes de la cobertura de la ingesta, 'primera', 'kg'
+        y 'cantidad' cuentan solo la historia local.
+        """
+        with self.lock:
+            if not self.cargado:
+                self._cargar()
+            entrada = self.ordenes.get((str(codigo), str(odp)))
+            return dict(entrada) if entrada else None
+
+
+INDICE_ACTIVIDAD = IndiceActividad()
+registrar_consumidor("actividad", INDICE_ACTIVIDAD.actualizar)
@@ -0,0 +1,612 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from database_connection import consultar_datos_tiempo_real
+from almacen_local import conectar_almacen_local, asegurar_esquema, leer_marca, guardar_marca, cargar_claves_temporales
+from calidad_datos import validar_registros, registrar_observaciones, condicion_calidad_sql
+
+logger = logging.getLogger(__name__)
+
+# Dias de historia a cargar en la primera sincronizacion
+DIAS_CARGA_INICIAL = int(os.environ.get("PESO_INGESTA_DIAS_INICIALES", "400"))
+# Minutos que se vuelven a leer en cada sincronizacion para captar pesajes tardios
+SOLAPE_MINUTOS = int(os.environ.get("PESO_INGESTA_SOLAPE_MINUTOS", "10"))
+# Segundos minimos entre sincronizaciones
+INTERVALO_SINCRONIZACION = int(os.environ.get("PESO_INGESTA_INTERVALO", "30"))
+# Modo de ingesta: "ventana" (marca de agua por FECHAINGRESO) o "cambios" (Change Tracking / rowversion)
+MODO_INGESTA = os.environ.get("PESO_INGESTA_MODO", "ventana")
+
+FORMATO_FECHA_LOCAL = "%Y-%m-%d %H:%M:%S.%f"
+COLUMNAS_PUNTO = ['FECHAINGRESO', 'CODIGO', 'ODP', '_kgEmbutidos', 'TotalEmbalajes', '_PesoSauciso']
+
+ESQUEMA_PUNTOS = """
+CREATE TABLE IF NOT EXISTS puntos_peso (
+    FECHAINGRESO TEXT NOT NULL,
+    CODIGO TEXT NOT NULL,
+    ODP TEXT NOT NULL,
+    kg_embutidos REAL NOT NULL,
+    total_embalajes REAL NOT NULL,
+    peso_sauciso REAL NOT NULL,
+    PRIMARY KEY (FECHAINGRESO, CODIGO, ODP)
+);
+CREATE INDEX IF NOT EXISTS ix_puntos_codigo_fecha ON puntos_peso (CODIGO, ODP, FECHAINGRESO);
+"""
+
+# Registros crudos recibidos por la fuente de cambios (para recalcular puntos afectados)
+ESQUEMA_REGISTROS = """
+CREATE TABLE IF NOT EXISTS registros_cambios (
+    ID TEXT PRIMARY KEY,
+    FECHAINGRESO TEXT,
+    CODIGO TEXT,
+    ODP TEXT,
+    PROCESO TEXT,
+    PESONETO REAL,
+    NUMEMBALAJE REAL
+);
+CREATE INDEX IF NOT EXISTS ix_registros_cambios_punto ON registros_cambios (FECHAINGRESO, CODIGO, ODP);
+"""
+
+# Consumidores de puntos nuevos: (nombre, funcion, transaccional, preparar)
+_consumidores = []
+# Módulos que registran consumidores al importarse; se cargan antes de aplicar cambios para que
+# el proceso que sincroniza notifique a todos los agregados
+MODULOS_CONSUMIDORES = [
+    'rollups_peso', 'turnos_peso', 'indice_actividad', 'sketches_peso', 'mapa_calor_peso', 'alarmas_peso'
+]
+_lock_sincronizacion = threading.Lock()
+_lock_carga_inicial = threading.Lock()
+_hilo_carga_inicial = None
+_ultima_sincronizacion = 0.0
+_version_datos = 0
+
+def registrar_consumidor(nombre, funcion, transaccional=False, preparar=None):
+    """
+    Registrar un agregado incremental que recibe los puntos nuevos de cada sincronizacion.
+    funcion(df_nuevos, df_reemplazados): df_reemplazados trae los valores anteriores
+    de puntos que cambiaron (para que el consumidor los retire o recalcule).
+    transaccional=True (agregados guardados en el almacen local): funcion recibe además
+    conn y escribe en la misma transacción que los puntos, sin commit; si falla no se
+    guarda nada y la sincronización se reintenta. preparar() (esquema, construcción
+    inicial) se ejecuta antes de abrir la transacción.
+    Los demás consumidores (estructuras en memoria) se notifican después del commit.
+    """
+    entrada = (nombre, funcion, transaccional, preparar)
+    for i, (nombre_existente, *_) in enumerate(_consumidores):
+        if nombre_existente == nombre:
+            _consumidores[i] = entrada
+            return
+    _consumidores.append(entrada)
+
+def cargar_consumidores():
+    """Importar los módulos consumidores que todavía no se cargaron en este proceso"""
+    for modulo in MODULOS_CONSUMIDORES:
+        importlib.import_module(modulo)
+
+def preparar_consumidores():
+    """
+    Cargar los consumidores y preparar los agregados persistentes antes de abrir la
+    transacción de escritura (usan su propia conexión y quedarían bloqueados dentro de ella)
+    """
+    cargar_consumidores()
+    for _, _, _, preparar in list(_consumidores):
+        if preparar is not None:
+            preparar()
+
+def version_datos():
+    """Contador que aumenta cada vez que la ingesta incorpora cambios"""
+    return _version_datos
+
+def fecha_sql(fecha):
+    """Literal de fecha ISO 8601 independiente del idioma de la sesión SQL"""
+    return pd.Timestamp(fecha).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+
+def fecha_local(fecha):
+    """Texto de fecha ordenable para el almacen local"""
+    return pd.Timestamp(fecha).strftime(FORMATO_FECHA_LOCAL)
+
+def query_puntos_desde(fecha_desde, fecha_hasta=None, incluir_desde=False):
+    """
+    Misma agregación por (FECHAINGRESO, CODIGO, ODP) del dashboard, posterior a una fecha
+    (o desde ella con incluir_desde) y opcionalmente anterior a fecha_hasta
+    """
+    operador_desde = ">=" if incluir_desde else ">"
+    condicion_hasta = f"AND FECHAINGRESO < '{fecha_sql(fecha_hasta)}'" if fecha_hasta is not None else ""
+    return f"""
+    WITH DatosEmbuticion AS (
+        SELECT
+            FECHAINGRESO,
+            PESONETO,
+            NUMEMBALAJE,
+            PROCESO,
+            CODIGO,
+            ODP
+        FROM vwRegistrosDetallados
+        WHERE FECHAINGRESO {operador_desde} '{fecha_sql(fecha_desde)}'
+            {condicion_hasta}
+            AND {condicion_calidad_sql()}
+    ),
+    KgEmbutidos AS (
+        SELECT
+            FECHAINGRESO,
+            CODIGO,
+            ODP,
+            SUM(CASE WHEN PROCESO = 'Embutición' THEN PESONETO ELSE 0 END) as _kgEmbutidos,
+            SUM(NUMEMBALAJE) as TotalEmbalajes
+        FROM DatosEmbuticion
+        GROUP BY FECHAINGRESO, CODIGO, ODP
+    )
+    SELECT
+        FECHAINGRESO,
+        CODIGO,
+        ODP,
+        _kgEmbutidos,
+        TotalEmbalajes,
+        CASE
+            WHEN TotalEmbalajes > 0 THEN _kgEmbutidos / TotalEmbalajes
+            ELSE 0
+        END as _PesoSauciso
+    FROM KgEmbutidos
+    WHERE _kgEmbutidos > 0
+    ORDER BY FECHAINGRESO ASC
+    """
+
+def query_registros_desde(fecha_desde, fecha_hasta=None, incluir_desde=False):
+    """
+    Registros crudos de vwRegistrosDetallados posteriores a una fecha (o desde ella con
+    incluir_desde) y opcionalmente anteriores a fecha_hasta, sin filtros de calidad:
+    la validación y la agregación a puntos se hacen en agregar_registros_a_puntos
+    """
+    operador_desde = ">=" if incluir_desde else ">"
+    condicion_hasta = f"AND FECHAINGRESO < '{fecha_sql(fecha_hasta)}'" if fecha_hasta is not None else ""
+    return f"""
+    SELECT
+        FECHAINGRESO,
+        CODIGO,
+        ODP,
+        PROCESO,
+        PESONETO,
+        NUMEMBALAJE
+    FROM vwRegistrosDetallados
+    WHERE FECHAINGRESO {operador_desde} '{fecha_sql(fecha_desde)}' {condicion_hasta}
+    ORDER BY FECHAINGRESO ASC
+    """
+
+def normalizar_puntos(df):
+    """Tipos y claves homogéneos para los puntos (ODP vacía en lugar de NULL)"""
+    df = df[COLUMNAS_PUNTO].copy()
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    df['CODIGO'] = df['CODIGO'].astype(str).str.strip()
+    df['ODP'] = df['ODP'].fillna('').astype(str).str.strip()
+    for col in ['_kgEmbutidos', 'TotalEmbalajes', '_PesoSauciso']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).astype(float)
+    return df
+
+def leer_puntos_locales(fecha_inicio=None, fecha_fin=None, codigo=None, odp=None, conn=None):
+    """
+    Leer puntos del almacen local con el mismo formato que las consultas SQL.
+    Con conn se lee en su transacción (incluye sus escrituras sin confirmar).
+    """
+    asegurar_esquema("puntos", ESQUEMA_PUNTOS)
+    condiciones, parametros = ["1=1"], []
+    if fecha_inicio is not None:
+        condiciones.append("FECHAINGRESO >= ?")
+        parametros.append(fecha_local(fecha_inicio))
+    if fecha_fin is not None:
+        condiciones.append("FECHAINGRESO < ?")
+        parametros.append(fecha_local(fecha_fin))
+    if codigo is not None:
+        condiciones.append("CODIGO = ?")
+        parametros.append(str(codigo))
+    if odp is not None:
+        condiciones.append("ODP = ?")
+        parametros.append(str(odp))
+    propia = conn is None
+    if propia:
+        conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(f"""
+            SELECT FECHAINGRESO, CODIGO, ODP,
+                   kg_embutidos as _kgEmbutidos,
+                   total_embalajes as TotalEmbalajes,
+                   peso_sauciso as _PesoSauciso
+            FROM puntos_peso
+            WHERE {' AND '.join(condiciones)}
+            ORDER BY FECHAINGRESO ASC
+        """, conn, params=parametros)
+    finally:
+        if propia:
+            conn.close()
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    return df
+
+def leer_snapshot_local(cantidad_ordenes, puntos_por_orden, fecha_desde=None):
+    """
+    Últimos puntos de las N órdenes más recientes del almacen local: misma forma que el
+    snapshot de tiempo real de SQL Server (respaldo cuando no hay conexión)
+    """
+    asegurar_esquema("puntos", ESQUEMA_PUNTOS)
+    condicion, parametros = "", []
+    if fecha_desde is not None:
+        condicion = "AND FECHAINGRESO >= ?"
+        parametros.append(fecha_local(fecha_desde))
+    conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(f"""
+            WITH Puntos AS (
+                SELECT * FROM puntos_peso
+                WHERE kg_embutidos > 0 AND ODP != '' {condicion}
+            ),
+            UltimasOrdenes AS (
+                SELECT CODIGO, ODP, MAX(FECHAINGRESO) as UltimaFecha
+                FROM Puntos
+                GROUP BY CODIGO, ODP
+                ORDER BY UltimaFecha DESC
+                LIMIT ?
+            ),
+            PuntosNumerados AS (
+                SELECT p.FECHAINGRESO, p.CODIGO, p.ODP, p.kg_embutidos, p.total_embalajes, p.peso_sauciso,
+                       ROW_NUMBER() OVER (PARTITION BY p.CODIGO, p.ODP ORDER BY p.FECHAINGRESO DESC) as Orden
+                FROM Puntos p
+                INNER JOIN UltimasOrdenes uo ON p.CODIGO = uo.CODIGO AND p.ODP = uo.ODP
+            )
+            SELECT FECHAINGRESO, CODIGO, ODP,
+                   kg_embutidos as _kgEmbutidos,
+                   total_embalajes as TotalEmbalajes,
+                   peso_sauciso as _PesoSauciso
+            FROM PuntosNumerados
+            WHERE Orden <= ?
+            ORDER BY FECHAINGRESO ASC
+        """, conn, params=parametros + [int(cantidad_ordenes), int(puntos_por_orden)])
+    finally:
+        conn.close()
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    return df
+
+def agregar_registros_a_puntos(df_registros, registrar_calidad=True):
+    """
+    Validar registros crudos de vwRegistrosDetallados (calidad_datos) y agregar los
+    válidos a puntos (FECHAINGRESO, CODIGO, ODP) con la misma lógica que las consultas
+    SQL del dashboard. registrar_calidad=False no guarda las observaciones (ej: grabaciones).
+    """
+    df_puntos, df_observaciones = _validar_y_agregar(df_registros)
+    if registrar_calidad:
+        _registrar_calidad(df_observaciones)
+    return df_puntos
+
+def _registrar_calidad(df_observaciones):
+    try:
+        registrar_observaciones(df_observaciones)
+    except Exception as e:
+        logger.warning("No se pudieron registrar observaciones de calidad: %s", e)
+
+def _validar_y_agregar(df_registros):
+    """Puntos de los registros válidos y observaciones de calidad (sin guardarlas)"""
+    if df_registros is None or df_registros.empty:
+        return pd.DataFrame(columns=COLUMNAS_PUNTO), None
+    df = df_registros.copy()
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    df['CODIGO'] = df['CODIGO'].fillna('').astype(str).str.strip()
+    df['ODP'] = df['ODP'].fillna('').astype(str).str.strip()
+    df['PESONETO'] = pd.to_numeric(df['PESONETO'], errors='coerce')
+    df['NUMEMBALAJE'] = pd.to_numeric(df['NUMEMBALAJE'], errors='coerce')
+    # Etapa de calidad: los registros inválidos quedan en cuarentena y no llegan a los puntos
+    df, df_observaciones = validar_registros(df)
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNAS_PUNTO), df_observaciones
+    df = df.assign(_kgEmbutidos=df['PESONETO'].where(df['PROCESO'] == 'Embutición', 0.0))
+    df_puntos = df.groupby(['FECHAINGRESO', 'CODIGO', 'ODP'], as_index=False).agg(
+        _kgEmbutidos=('_kgEmbutidos', 'sum'),
+        TotalEmbalajes=('NUMEMBALAJE', 'sum'),
+    )
+    df_puntos = df_puntos[df_puntos['_kgEmbutidos'] > 0]
+    df_puntos = df_puntos.assign(_PesoSauciso=df_puntos['_kgEmbutidos'] / df_puntos['TotalEmbalajes'])
+    return df_puntos[COLUMNAS_PUNTO], df_observaciones
+
+def aplicar_puntos(df_puntos, claves_afectadas=None, conn=None):
+    """
+    Guardar puntos en el almacen local y notificar a los consumidores solo lo que cambió.
+    claves_afectadas: DataFrame (FECHAINGRESO, CODIGO, ODP) recalculadas por la fuente de
+    cambios; las que ya no aparecen en df_puntos se eliminan del almacen.
+    Los puntos y los agregados persistentes se confirman en un solo commit (con conn,
+    junto con las escrituras pendientes del llamador, que debe preparar_consumidores()
+    antes de escribir); si algo falla se deshace todo y la excepción sube para reintentar.
+    Devuelve la cantidad de puntos nuevos, modificados o eliminados.
+    """
+    global _version_datos
+    if conn is None:
+        preparar_consumidores()
+    claves = ['FECHAINGRESO', 'CODIGO', 'ODP']
+    if df_puntos is None:
+        df_puntos = pd.DataFrame(columns=COLUMNAS_PUNTO)
+    if df_puntos.empty and (claves_afectadas is None or claves_afectadas.empty):
+        return 0
+    df_puntos = normalizar_puntos(df_puntos)
+    df_puntos = df_puntos.drop_duplicates(claves, keep='last')
+
+    df_claves = df_puntos[claves]
+    if claves_afectadas is not None and not claves_afectadas.empty:
+        df_claves = pd.concat([df_claves, normalizar_puntos(
+            claves_afectadas.assign(**{c: 0.0 for c in COLUMNAS_PUNTO if c not in claves})
+        )[claves]]).drop_duplicates()
+
+    # Comparar contra lo ya almacenado en el rango de fechas recibido
+    df_existentes = leer_puntos_locales(
+        df_claves['FECHAINGRESO'].min(),
+        df_claves['FECHAINGRESO'].max() + timedelta(microseconds=1)
+    )
+    df_cruce = df_puntos.merge(df_existentes, on=claves, how='left', suffixes=('', '_anterior'), indicator=True)
+    es_nuevo = df_cruce['_merge'] == 'left_only'
+    es_modificado = (df_cruce['_merge'] == 'both') & (
+        ((df_cruce['_kgEmbutidos'] - df_cruce['_kgEmbutidos_anterior']).abs() > 1e-9) |
+        ((df_cruce['TotalEmbalajes'] - df_cruce['TotalEmbalajes_anterior']).abs() > 1e-9)
+    )
+    df_cambios = df_cruce.loc[es_nuevo | es_modificado, COLUMNAS_PUNTO]
+    df_reemplazados = df_cruce.loc[es_modificado, claves + [
+        '_kgEmbutidos_anterior', 'TotalEmbalajes_anterior', '_PesoSauciso_anterior'
+    ]].rename(columns=lambda c: c.replace('_anterior', ''))
+
+    # Puntos afectados que ya no existen en la fuente (registros borrados o movidos)
+    df_eliminados = df_existentes.merge(df_claves, on=claves).merge(
+        df_puntos[claves], on=claves, how='left', indicator=True
+    )
+    df_eliminados = df_eliminados.loc[df_eliminados['_merge'] == 'left_only', COLUMNAS_PUNTO]
+    if not df_eliminados.empty:
+        df_reemplazados = pd.concat([df_reemplazados, df_eliminados], ignore_index=True)
+
+    if df_cambios.empty and df_eliminados.empty:
+        return 0
+
+    propia = conn is None
+    if propia:
+        conn = conectar_almacen_local()
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO puntos_peso "
+            "(FECHAINGRESO, CODIGO, ODP, kg_embutidos, total_embalajes, peso_sauciso) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (fecha_local(f), c, o, kg, emb, peso)
+                for f, c, o, kg, emb, peso in df_cambios.itertuples(index=False, name=None)
+            ]
+        )
+        conn.executemany(
+            "DELETE FROM puntos_peso WHERE FECHAINGRESO = ? AND CODIGO = ? AND ODP = ?",
+            [(fecha_local(f), c, o) for f, c, o in df_eliminados[claves].itertuples(index=False, name=None)]
+        )
+        consumidores = list(_consumidores)
+        for _, funcion, transaccional, _ in consumidores:
+            if transaccional:
+                funcion(df_cambios, df_reemplazados, conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if propia:
+            conn.close()
+
+    # Estructuras en memoria: se reconstruyen al reiniciar, un error no pierde datos guardados
+    for nombre, funcion, transaccional, _ in consumidores:
+        if transaccional:
+            continue
+        try:
+            funcion(df_cambios, df_reemplazados)
+        except Exception as e:
+            logger.exception("Error en consumidor de ingesta %s: %s", nombre, e)
+
+    _version_datos += 1
+    return len(df_cambios) + len(df_eliminados)
+
+def cobertura_desde():
+    """Fecha desde la que el almacen local tiene historia completa (o None)"""
+    valor = leer_marca("ingesta_desde")
+    return pd.Timestamp(valor) if valor else None
+
+def ultima_fecha_local():
+    """Pesaje más reciente del almacen local (o None): hasta dónde llegan los datos sin conexión"""
+    asegurar_esquema("puntos", ESQUEMA_PUNTOS)
+    conn = conectar_almacen_local()
+    try:
+        valor = conn.execute("SELECT MAX(FECHAINGRESO) FROM puntos_peso").fetchone()[0]
+    finally:
+        conn.close()
+    return pd.Timestamp(valor) if valor else None
+
+def _normalizar_registros(df):
+    """Claves de registro homogéneas (mismas reglas que normalizar_puntos)"""
+    df = df.copy()
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    df['CODIGO'] = df['CODIGO'].fillna('').astype(str).str.strip()
+    df['ODP'] = df['ODP'].fillna('').astype(str).str.strip()
+    df['ID'] = df['ID'].astype(str)
+    return df
+
+def _claves_de_registros(conn, ids):
+    """Claves de punto actuales en el almacen de los registros indicados"""
+    filas = []
+    ids = list(ids)
+    for inicio in range(0, len(ids), 500):
+        lote = ids[inicio:inicio + 500]
+        filas.extend(conn.execute(
+            f"SELECT FECHAINGRESO, CODIGO, ODP FROM registros_cambios WHERE ID IN ({', '.join('?' * len(lote))})",
+            lote
+        ).fetchall())
+    df = pd.DataFrame(filas, columns=['FECHAINGRESO', 'CODIGO', 'ODP'])
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    return df
+
+def aplicar_cambios_registros(df_cambios):
+    """
+    Aplicar cambios de registros crudos (OPERACION I/U/D) al almacen local y
+    recalcular solo los puntos (FECHAINGRESO, CODIGO, ODP) afectados
+    """
+    if df_cambios is None or df_cambios.empty:
+        return 0
+    asegurar_esquema("registros", ESQUEMA_REGISTROS)
+    asegurar_esquema("puntos", ESQUEMA_PUNTOS)
+    preparar_consumidores()
+    df_cambios = _normalizar_registros(df_cambios)
+    conn = conectar_almacen_local()
+    try:
+        # Claves anteriores (un registro actualizado puede cambiar de punto) y nuevas
+        df_claves = pd.concat([
+            _claves_de_registros(conn, df_cambios['ID']),
+            df_cambios.loc[df_cambios['OPERACION'] != 'D', ['FECHAINGRESO', 'CODIGO', 'ODP']]
+        ]).dropna(subset=['FECHAINGRESO']).drop_duplicates()
+
+        borrados = df_cambios[df_cambios['OPERACION'] == 'D']
+        conn.executemany("DELETE FROM registros_cambios WHERE ID = ?", [(i,) for i in borrados['ID']])
+        vigentes = df_cambios[df_cambios['OPERACION'] != 'D']
+        conn.executemany(
+            "INSERT OR REPLACE INTO registros_cambios (ID, FECHAINGRESO, CODIGO, ODP, PROCESO, PESONETO, NUMEMBALAJE) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (i, fecha_local(f), c, o, p, None if pd.isna(pn) else float(pn), None if pd.isna(n) else float(n))
+                for i, f, c, o, p, pn, n in vigentes[
+                    ['ID', 'FECHAINGRESO', 'CODIGO', 'ODP', 'PROCESO', 'PESONETO', 'NUMEMBALAJE']
+                ].itertuples(index=False, name=None)
+            ]
+        )
+
+        # Registros completos de los puntos afectados (claves en tabla temporal, un solo JOIN)
+        cargar_claves_temporales(conn, "claves_afectadas", ['FECHAINGRESO', 'CODIGO', 'ODP'], [
+            (fecha_local(f), c, o) for f, c, o in df_claves.itertuples(index=False, name=None)
+        ])
+        filas = conn.execute("""
+            SELECT r.ID, r.FECHAINGRESO, r.CODIGO, r.ODP, r.PROCESO, r.PESONETO, r.NUMEMBALAJE
+            FROM registros_cambios r
+            INNER JOIN temp.claves_afectadas k
+                ON r.FECHAINGRESO = k.FECHAINGRESO AND r.CODIGO = k.CODIGO AND r.ODP = k.ODP
+        """).fetchall()
+        df_registros = pd.DataFrame(filas, columns=['ID', 'FECHAINGRESO', 'CODIGO', 'ODP', 'PROCESO', 'PESONETO', 'NUMEMBALAJE'])
+        df_puntos, df_observaciones = _validar_y_agregar(df_registros)
+        # Registros, puntos y agregados persistentes en la misma transacción
+        cambios = aplicar_puntos(df_puntos, claves_afectadas=df_claves, conn=conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    # Las observaciones usan su propia conexión: fuera de la transacción
+    _registrar_calidad(df_observaciones)
+    return cambios
+
+def obtener_fuente_cambios():
+    """Fuente de cambios configurada para SQL Server"""
+    from database_connection import FuenteCambiosSQLServer
+    return FuenteCambiosSQLServer()
+
+def sincronizar_por_cambios(fuente, carga_inicial=True):
+    """
+    Ingesta por cambios: en la primera ejecución carga los registros crudos desde
+    DIAS_CARGA_INICIAL y guarda el token; después solo aplica lo cambiado desde el token.
+    Con carga_inicial=False un token vencido deja la recarga completa a un hilo aparte.
+    """
+    token = leer_marca("cambios_token")
+    if token is None:
+        fecha_desde = pd.Timestamp(datetime.now().date() - timedelta(days=DIAS_CARGA_INICIAL))
+        df_registros, nuevo_token = fuente.carga_inicial(fecha_desde)
+        cambios = aplicar_cambios_registros(
+            df_registros.assign(OPERACION='I') if df_registros is not None else None
+        )
+        guardar_marca("ingesta_desde", fecha_local(fecha_desde))
+        guardar_marca("cambios_token", nuevo_token)
+        return cambios
+
+    df_cambios, nuevo_token = fuente.cambios_desde(int(token))
+    if nuevo_token is None:
+        # Token vencido (retención de Change Tracking superada): recargar desde cero
+        logger.warning("Token de cambios vencido, se realizará una carga inicial completa")
+        guardar_marca("cambios_token", None)
+        guardar_marca("ingesta_desde", None)
+        if not carga_inicial:
+            iniciar_carga_inicial(fuente)
+            return 0
+        return sincronizar_por_cambios(fuente)
+    cambios = aplicar_cambios_registros(df_cambios)
+    guardar_marca("cambios_token", nuevo_token)
+    return cambios
+
+def _sincronizar_por_ventana():
+    """Ingesta por marca de agua de FECHAINGRESO con solape para pesajes tardíos"""
+    marca = leer_marca("ingesta_ultima_fecha")
+    if marca:
+        fecha_desde = pd.Timestamp(marca) - timedelta(minutes=SOLAPE_MINUTOS)
+    else:
+        fecha_desde = pd.Timestamp(datetime.now().date() - timedelta(days=DIAS_CARGA_INICIAL))
+
+    df_registros, error = consultar_datos_tiempo_real(query_registros_desde(fecha_desde))
+    if error:
+        raise ConnectionError(error)
+    cambios = 0
+    if df_registros is not None and not df_registros.empty:
+        cambios = aplicar_puntos(agregar_registros_a_puntos(df_registros))
+        fecha_maxima = pd.to_datetime(df_registros['FECHAINGRESO']).max()
+        if not marca or fecha_maxima > pd.Timestamp(marca):
+            guardar_marca("ingesta_ultima_fecha", fecha_local(fecha_maxima))
+    elif not marca:
+        guardar_marca("ingesta_ultima_fecha", fecha_local(fecha_desde))
+    if not marca:
+        # La cobertura se publica recién con la carga inicial completa
+        guardar_marca("ingesta_desde", fecha_local(fecha_desde))
+    return cambios
+
+def carga_inicial_pendiente():
+    """True mientras el almacen local no tiene la carga inicial (las vistas consultan SQL Server)"""
+    return cobertura_desde() is None
+
+def iniciar_carga_inicial(fuente=None):
+    """Carga inicial en un hilo propio (uno por proceso), fuera de la sesión que la pide"""
+    global _hilo_carga_inicial
+    with _lock_carga_inicial:
+        if _hilo_carga_inicial is not None and _hilo_carga_inicial.is_alive():
+            return
+        _hilo_carga_inicial = threading.Thread(
+            target=sincronizar_ingesta, kwargs={'forzar': True, 'fuente': fuente, 'carga_inicial': True},
+            name="carga_inicial_ingesta", daemon=True
+        )
+        _hilo_carga_inicial.start()
+
+def sincronizar_ingesta(forzar=False, fuente=None, carga_inicial=False):
+    """
+    Incorporar a los agregados locales solo lo nuevo desde la última sincronización.
+    Modo "ventana": marca de agua de FECHAINGRESO; modo "cambios" (o si se pasa una
+    fuente, ej. FuenteCambiosLocal): Change Tracking / rowversion.
+    Limitado a una ejecución cada INTERVALO_SINCRONIZACION segundos y a una sesión a la vez.
+    La carga inicial (DIAS_CARGA_INICIAL días) solo se hace con carga_inicial=True (hilo de
+    precalentamiento, línea de comandos); desde una sesión se lanza en un hilo aparte.
+    """
+    global _ultima_sincronizacion
+    if not forzar and time.time() - _ultima_sincronizacion < INTERVALO_SINCRONIZACION:
+        return 0
+    try:
+        pendiente = carga_inicial_pendiente()
+    except Exception as e:
+        logger.warning("Sincronizacion de ingesta fallida: %s", e)
+        return 0
+    if pendiente and not carga_inicial:
+        iniciar_carga_inicial(fuente)
+        return 0
+    # La carga inicial espera a la sincronización en curso; las sesiones no esperan
+    if not _lock_sincronizacion.acquire(blocking=carga_inicial):
+        return 0
+    try:
+        asegurar_esquema("puntos", ESQUEMA_PUNTOS)
+        if fuente is not None or MODO_INGESTA == "cambios":
+            cambios = sincronizar_por_cambios(fuente or obtener_fuente_cambios(), carga_inicial)
+        else:
+            cambios = _sincronizar_por_ventana()
+        _ultima_sincronizacion = time.time()
+        return cambios
+    except Exception as e:
+        logger.warning("Sincronizacion de ingesta fallida: %s", e)
+        return 0
+    finally:
+        _lock_sincronizacion.release()
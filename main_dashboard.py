@@ -3,7 +3,6 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-import time
 from database_connection import consultar_datos, consultar_datos_tiempo_real, verificar_conexion
 from dashboard_peso_embuticion import dashboard_peso_embuticion
 
@@ -80,17 +79,32 @@ st.markdown("""
 def main():
     """Función principal - ejecuta directamente el dashboard de tiempo real"""
     
-    # Verificar conexión a la base de datos
+    # Precalentamiento de consultas frías (una vez por proceso, y antes de cada cambio de turno)
+    from precalentamiento import iniciar_precalentamiento
+    iniciar_precalentamiento()
+    
+    # Vista según la URL (?vista=turnos|ordenes|calor|merma); por defecto el dashboard de tiempo real
+    from dashboard_peso_embuticion import (
+        dashboard_peso_embuticion_tiempo_real, dashboard_reporte_turnos, dashboard_tablero_ordenes,
+        dashboard_mapa_calor, dashboard_merma, leer_parametro_url, mostrar_aviso_sin_conexion
+    )
+    
+    # Sin conexión las vistas siguen con el almacen local; con el circuito abierto
+    # verificar_conexion responde de inmediato y el refresco de cada vista reintenta
     if not verificar_conexion():
-        st.error("❌ Error: No se puede conectar a la base de datos")
-        st.info("🔄 Reintentando conexión en 5 segundos...")
-        time.sleep(5)
-        st.rerun()
-        return
+        mostrar_aviso_sin_conexion()
     
-    # Ejecutar directamente el dashboard de tiempo real
-    from dashboard_peso_embuticion import dashboard_peso_embuticion_tiempo_real
-    dashboard_peso_embuticion_tiempo_real()
+    vista = leer_parametro_url('vista', 'tiempo_real')
+    if vista == 'turnos':
+        dashboard_reporte_turnos()
+    elif vista == 'ordenes':
+        dashboard_tablero_ordenes()
+    elif vista == 'calor':
+        dashboard_mapa_calor()
+    elif vista == 'merma':
+        dashboard_merma()
+    else:
+        dashboard_peso_embuticion_tiempo_real()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,185 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema, leer_marca, guardar_marca
+from ingesta_peso import registrar_consumidor, leer_puntos_locales
+from calendario import DIAS_SEMANA
+
+# Versión del formato de celdas; si cambia se reconstruyen desde los puntos locales
+VERSION_CELDAS = "1"
+
+# 168 celdas (día de semana x hora) por código y mes: un periodo de meses se suma en memoria
+ESQUEMA_CELDAS = """
+CREATE TABLE IF NOT EXISTS celdas_semana_peso (
+    CODIGO TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    dia_semana INTEGER NOT NULL,
+    hora INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL,
+    peso_suma REAL NOT NULL,
+    kg_embutidos REAL NOT NULL,
+    PRIMARY KEY (CODIGO, mes, dia_semana, hora)
+);
+"""
+
+# Matrices por código ya leídas: {CODIGO: (meses, cantidad, peso_suma, kg_embutidos)}
+_matrices = {}
+_lock_matrices = threading.Lock()
+# Se incrementa con cada invalidación: una lectura que empezó antes no se guarda en _matrices
+_generacion_matrices = 0
+
+def _invalidar_matrices(codigos=None):
+    """Descartar las matrices de los códigos indicados (y la de todos), o todas si codigos es None"""
+    global _generacion_matrices
+    with _lock_matrices:
+        _generacion_matrices += 1
+        if codigos is None:
+            _matrices.clear()
+            return
+        for codigo in codigos:
+            _matrices.pop(codigo, None)
+        _matrices.pop(None, None)
+
+def _agregar_por_celda(df_puntos, signo=1):
+    """Agregar puntos a (CODIGO, mes, dia_semana, hora); signo -1 para retirar puntos reemplazados"""
+    fechas = df_puntos['FECHAINGRESO']
+    df = df_puntos.assign(mes=fechas.dt.strftime('%Y-%m'), dia_semana=fechas.dt.dayofweek, hora=fechas.dt.hour)
+    df_agregado = df.groupby(['CODIGO', 'mes', 'dia_semana', 'hora'], as_index=False).agg(
+        cantidad=('_PesoSauciso', 'size'),
+        peso_suma=('_PesoSauciso', 'sum'),
+        kg_embutidos=('_kgEmbutidos', 'sum'),
+    )
+    columnas = ['cantidad', 'peso_suma', 'kg_embutidos']
+    df_agregado[columnas] = df_agregado[columnas] * signo
+    return df_agregado
+
+def _upsert_celdas(conn, df_agregado):
+    """Sumar deltas por celda y borrar las celdas que quedan sin pesajes"""
+    conn.executemany("""
+        INSERT INTO celdas_semana_peso (CODIGO, mes, dia_semana, hora, cantidad, peso_suma, kg_embutidos)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(CODIGO, mes, dia_semana, hora) DO UPDATE SET
+            cantidad = cantidad + excluded.cantidad,
+            peso_suma = peso_suma + excluded.peso_suma,
+            kg_embutidos = kg_embutidos + excluded.kg_embutidos
+    """, [
+        (c, m, int(d), int(h), int(n), float(psum), float(kg))
+        for c, m, d, h, n, psum, kg in df_agregado.itertuples(index=False, name=None)
+    ])
+    conn.execute("DELETE FROM celdas_semana_peso WHERE cantidad <= 0")
+
+def asegurar_celdas():
+    """Construir las celdas desde los puntos locales la primera vez (o si cambió su formato)"""
+    asegurar_esquema("celdas_semana", ESQUEMA_CELDAS)
+    if leer_marca("celdas_semana_version") == VERSION_CELDAS:
+        return
+    df_puntos = leer_puntos_locales()
+    conn = conectar_almacen_local()
+    try:
+        conn.execute("DELETE FROM celdas_semana_peso")
+        if not df_puntos.empty:
+            _upsert_celdas(conn, _agregar_por_celda(df_puntos))
+        guardar_marca("celdas_semana_version", VERSION_CELDAS, conn=conn)
+        conn.commit()
+    finally:
+        conn.close()
+    _invalidar_matrices()
+
+def _delta_celdas(df_nuevos, df_reemplazados):
+    """Deltas por celda de los puntos nuevos menos los reemplazados (o None)"""
+    partes = [_agregar_por_celda(df_nuevos)] if not df_nuevos.empty else []
+    if df_reemplazados is not None and not df_reemplazados.empty:
+        partes.append(_agregar_por_celda(df_reemplazados, signo=-1))
+    if not partes:
+        return None
+    return pd.concat(partes).groupby(['CODIGO', 'mes', 'dia_semana', 'hora'], as_index=False).sum()
+
+def actualizar_celdas(df_nuevos, df_reemplazados, conn):
+    """Consumidor de ingesta: sumar puntos nuevos a su celda y restar los valores reemplazados (en la transacción de conn)"""
+    df_delta = _delta_celdas(df_nuevos, df_reemplazados)
+    if df_delta is not None:
+        _upsert_celdas(conn, df_delta)
+
+def invalidar_matrices_cambiadas(df_nuevos, df_reemplazados):
+    """Consumidor de ingesta (después del commit): las matrices de los códigos afectados (y la de todos) se vuelven a leer"""
+    codigos = set(df_nuevos['CODIGO'])
+    if df_reemplazados is not None:
+        codigos |= set(df_reemplazados['CODIGO'])
+    if codigos:
+        _invalidar_matrices(codigos)
+
+registrar_consumidor("celdas_semana", actualizar_celdas, transaccional=True, preparar=asegurar_celdas)
+registrar_consumidor("celdas_matrices", invalidar_matrices_cambiadas)
+
+def _cargar_matrices(codigo):
+    """Celdas de un código (o de todos sumados con codigo=None) como arreglos [mes, día, hora]"""
+    asegurar_celdas()
+    condicion, parametros = ("WHERE CODIGO = ?", [str(codigo)]) if codigo is not None else ("", [])
+    conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(f"""
+            SELECT mes, dia_semana, hora,
+                   SUM(cantidad) as cantidad, SUM(peso_suma) as peso_suma, SUM(kg_embutidos) as kg_embutidos
+            FROM celdas_semana_peso
+            {condicion}
+            GROUP BY mes, dia_semana, hora
+        """, conn, params=parametros)
+    finally:
+        conn.close()
+    meses = np.array(sorted(df['mes'].unique()), dtype=object)
+    forma = (len(meses), len(DIAS_SEMANA), 24)
+    # astype(int): sin celdas (almacen vacío) pandas devuelve columnas object que no sirven de índice
+    indice = (np.searchsorted(meses, df['mes']), df['dia_semana'].to_numpy().astype(int), df['hora'].to_numpy().astype(int))
+    matrices = []
+    for columna in ['cantidad', 'peso_suma', 'kg_embutidos']:
+        matriz = np.zeros(forma)
+        matriz[indice] = df[columna].to_numpy()
+        matrices.append(matriz)
+    return (meses, *matrices)
+
+def _matrices_codigo(codigo):
+    with _lock_matrices:
+        if codigo in _matrices:
+            return _matrices[codigo]
+        generacion = _generacion_matrices
+    matrices = _cargar_matrices(codigo)
+    with _lock_matrices:
+        # Si las celdas cambiaron durante la lectura, la matriz puede estar vencida: no guardarla
+        if _generacion_matrices == generacion:
+            _matrices[codigo] = matrices
+    return matrices
+
+def codigos_disponibles():
+    """Códigos con celdas guardadas"""
+    asegurar_celdas()
+    conn = conectar_almacen_local()
+    try:
+        return [fila[0] for fila in conn.execute("SELECT DISTINCT CODIGO FROM celdas_semana_peso ORDER BY CODIGO")]
+    finally:
+        conn.close()
+
+def meses_disponibles(codigo=None):
+    """Meses ('YYYY-MM') con pesajes del código (o de todos)"""
+    return list(_matrices_codigo(codigo)[0])
+
+def mapa_calor(codigo=None, mes_inicio=None, mes_fin=None):
+    """
+    Matrices 7 x 24 (filas lunes..domingo, columnas 0..23 h) del periodo de meses
+    [mes_inicio, mes_fin] inclusive: peso_promedio, kg_embutidos y pesajes
+    """
+    meses, cantidad, peso_suma, kg_embutidos = _matrices_codigo(codigo)
+    seleccion = np.ones(len(meses), dtype=bool)
+    if mes_inicio is not None:
+        seleccion &= meses >= mes_inicio
+    if mes_fin is not None:
+        seleccion &= meses <= mes_fin
+    pesajes = cantidad[seleccion].sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        peso_promedio = np.where(pesajes > 0, peso_suma[seleccion].sum(axis=0) / pesajes, np.nan)
+    return {
+        'peso_promedio': peso_promedio,
+        'kg_embutidos': kg_embutidos[seleccion].sum(axis=0),
+        'pesajes': pesajes,
+    }
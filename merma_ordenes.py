@@ -0,0 +1,196 @@
+"""
+Análisis de merma por orden: masa esperada (PesoODP + merma YY06 planificada) contra lo
+realmente embutido, para órdenes cerradas. Los resultados quedan en el almacen local y
+cada ejecución solo calcula las órdenes cerradas que todavía no tienen resultado.
+
+Uso:
+    python merma_ordenes.py
+    python merma_ordenes.py --recalcular --hilos 8
+"""
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema
+from ingesta_peso import ESQUEMA_PUNTOS, fecha_local
+from perfil_base import HORAS_ORDEN_CERRADA
+from progreso_ordenes import calcular_progreso_lote, ORDENES_POR_CONSULTA
+
+logger = logging.getLogger(__name__)
+
+# Consultas de progreso por lote simultáneas contra SQL Server
+HILOS_MERMA = 4
+
+ESQUEMA_MERMA = """
+CREATE TABLE IF NOT EXISTS merma_ordenes (
+    CODIGO TEXT NOT NULL,
+    ODP TEXT NOT NULL,
+    inicio TEXT NOT NULL,
+    fin TEXT NOT NULL,
+    peso_odp REAL,
+    porcentaje_merma_plan REAL,
+    kg_deben_embutir REAL,
+    kg_embutidos REAL NOT NULL,
+    rendimiento REAL,
+    porcentaje_merma_real REAL,
+    calculado TEXT NOT NULL,
+    PRIMARY KEY (CODIGO, ODP)
+);
+CREATE INDEX IF NOT EXISTS ix_merma_ordenes_fin ON merma_ordenes (CODIGO, fin);
+"""
+
+COLUMNAS_MERMA = [
+    'CODIGO', 'ODP', 'inicio', 'fin', 'peso_odp', 'porcentaje_merma_plan', 'kg_deben_embutir',
+    'kg_embutidos', 'rendimiento', 'porcentaje_merma_real'
+]
+
+def ordenes_cerradas(pendientes=True, ahora=None):
+    """
+    Órdenes del almacen local sin pesajes en HORAS_ORDEN_CERRADA horas, con su primer
+    y último pesaje. pendientes=True excluye las que ya tienen resultado de merma con
+    ese mismo último pesaje (una orden que se reabrió vuelve a quedar pendiente).
+    """
+    asegurar_esquema("puntos", ESQUEMA_PUNTOS)
+    asegurar_esquema("merma", ESQUEMA_MERMA)
+    limite = (pd.Timestamp(ahora or datetime.now()) - timedelta(hours=HORAS_ORDEN_CERRADA)).strftime("%Y-%m-%d %H:%M:%S")
+    condicion_pendiente = """
+        AND MAX(p.FECHAINGRESO) != COALESCE(
+            (SELECT m.fin FROM merma_ordenes m WHERE m.CODIGO = p.CODIGO AND m.ODP = p.ODP), ''
+        )
+    """ if pendientes else ""
+    conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(f"""
+            SELECT p.CODIGO, p.ODP, MIN(p.FECHAINGRESO) as inicio, MAX(p.FECHAINGRESO) as fin
+            FROM puntos_peso p
+            WHERE p.ODP != ''
+            GROUP BY p.CODIGO, p.ODP
+            HAVING MAX(p.FECHAINGRESO) < ? {condicion_pendiente}
+        """, conn, params=[limite])
+    finally:
+        conn.close()
+    return df
+
+def calcular_merma(df_ordenes, hilos=HILOS_MERMA):
+    """
+    Merma de las órdenes indicadas (CODIGO, ODP, inicio, fin): un lote de progreso por
+    cada ORDENES_POR_CONSULTA órdenes, con varios lotes en paralelo.
+    rendimiento = kg embutidos / masa esperada (%); merma real = kg embutidos / PesoODP - 1 (%).
+    """
+    if df_ordenes.empty:
+        return pd.DataFrame(columns=COLUMNAS_MERMA)
+    ordenes = list(df_ordenes[['CODIGO', 'ODP']].itertuples(index=False, name=None))
+    lotes = [ordenes[i:i + ORDENES_POR_CONSULTA] for i in range(0, len(ordenes), ORDENES_POR_CONSULTA)]
+    partes = []
+    with ThreadPoolExecutor(max_workers=max(1, hilos)) as executor:
+        for df_progreso, error in executor.map(calcular_progreso_lote, lotes):
+            if error:
+                raise ConnectionError(error)
+            partes.append(df_progreso)
+    df = df_ordenes.merge(pd.concat(partes, ignore_index=True), on=['CODIGO', 'ODP'], how='left')
+
+    masa = df['kg_deben_embutir'].where(df['tiene_masa_inicial'].fillna(False).astype(bool) & (df['kg_deben_embutir'] > 0))
+    peso_odp = df['peso_odp'].where(df['peso_odp'] > 0)
+    return pd.DataFrame({
+        'CODIGO': df['CODIGO'],
+        'ODP': df['ODP'],
+        'inicio': df['inicio'],
+        'fin': df['fin'],
+        'peso_odp': peso_odp,
+        'porcentaje_merma_plan': df['porcentaje_merma'],
+        'kg_deben_embutir': masa,
+        'kg_embutidos': df['kg_embutidos'].fillna(0.0),
+        'rendimiento': df['kg_embutidos'] / masa * 100,
+        'porcentaje_merma_real': (df['kg_embutidos'] / peso_odp - 1) * 100,
+    })[COLUMNAS_MERMA]
+
+def _valor(v):
+    return None if pd.isna(v) else float(v)
+
+def guardar_merma(df_merma):
+    """Guardar (o reemplazar) resultados de merma por orden"""
+    asegurar_esquema("merma", ESQUEMA_MERMA)
+    calculado = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = conectar_almacen_local()
+    try:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO merma_ordenes ({', '.join(COLUMNAS_MERMA)}, calculado) "
+            f"VALUES ({', '.join('?' * (len(COLUMNAS_MERMA) + 1))})",
+            [
+                (c, o, fecha_local(i), fecha_local(f), _valor(p), _valor(mp), _valor(kd), float(ke), _valor(r), _valor(mr), calculado)
+                for c, o, i, f, p, mp, kd, ke, r, mr in df_merma[COLUMNAS_MERMA].itertuples(index=False, name=None)
+            ]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def actualizar_merma(recalcular=False, hilos=HILOS_MERMA):
+    """Calcular y guardar la merma de las órdenes cerradas pendientes (o de todas). Devuelve la cantidad de órdenes."""
+    df_ordenes = ordenes_cerradas(pendientes=not recalcular)
+    if df_ordenes.empty:
+        return 0
+    df_merma = calcular_merma(df_ordenes, hilos)
+    guardar_merma(df_merma)
+    return len(df_merma)
+
+def consultar_merma(codigo=None, fecha_inicio=None, fecha_fin=None):
+    """Resultados guardados por orden (filtrados por código y fecha de cierre)"""
+    asegurar_esquema("merma", ESQUEMA_MERMA)
+    condiciones, parametros = ["1=1"], []
+    if codigo is not None:
+        condiciones.append("CODIGO = ?")
+        parametros.append(str(codigo))
+    if fecha_inicio is not None:
+        condiciones.append("fin >= ?")
+        parametros.append(pd.Timestamp(fecha_inicio).strftime("%Y-%m-%d %H:%M:%S"))
+    if fecha_fin is not None:
+        condiciones.append("fin < ?")
+        parametros.append(pd.Timestamp(fecha_fin).strftime("%Y-%m-%d %H:%M:%S"))
+    conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(COLUMNAS_MERMA)} FROM merma_ordenes WHERE {' AND '.join(condiciones)} ORDER BY fin",
+            conn, params=parametros
+        )
+    finally:
+        conn.close()
+    df['inicio'] = pd.to_datetime(df['inicio'])
+    df['fin'] = pd.to_datetime(df['fin'])
+    return df
+
+def tendencia_merma(df_merma, frecuencia='M'):
+    """
+    Tendencia por código y periodo (por fecha de cierre): órdenes, kg embutidos,
+    rendimiento ponderado por masa esperada y merma real/planificada promedio
+    """
+    df = df_merma.dropna(subset=['kg_deben_embutir'])
+    if df.empty:
+        return pd.DataFrame(columns=['CODIGO', 'Periodo', 'Ordenes', 'KgEmbutidos', 'Rendimiento', 'MermaReal', 'MermaPlan'])
+    df = df.assign(Periodo=df['fin'].dt.to_period(frecuencia).dt.start_time)
+    df_tendencia = df.groupby(['CODIGO', 'Periodo'], as_index=False).agg(
+        Ordenes=('ODP', 'size'),
+        KgEmbutidos=('kg_embutidos', 'sum'),
+        KgDebenEmbutir=('kg_deben_embutir', 'sum'),
+        MermaReal=('porcentaje_merma_real', 'mean'),
+        MermaPlan=('porcentaje_merma_plan', 'mean'),
+    )
+    df_tendencia['Rendimiento'] = df_tendencia['KgEmbutidos'] / df_tendencia['KgDebenEmbutir'] * 100
+    return df_tendencia[['CODIGO', 'Periodo', 'Ordenes', 'KgEmbutidos', 'Rendimiento', 'MermaReal', 'MermaPlan']]
+
+def main():
+    parser = argparse.ArgumentParser(description="Análisis de merma por orden cerrada")
+    parser.add_argument("--recalcular", action="store_true", help="Recalcular también las órdenes con resultado guardado")
+    parser.add_argument("--hilos", type=int, default=HILOS_MERMA, help="Consultas por lote simultáneas")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Solo lectura del almacen local: la ingesta la hace el dashboard, que es quien
+    # mantiene los consumidores en memoria (índice, alarmas, mapa de calor)
+    cantidad = actualizar_merma(args.recalcular, args.hilos)
+    logger.info("Merma calculada para %d órdenes", cantidad)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Perfil de referencia de peso sauciso por código según el % de avance de la orden,
+construido fuera de línea desde la historia del almacen local.
+
+Uso:
+    python perfil_base.py                (órdenes cerradas de los últimos 180 días)
+    python perfil_base.py --dias 365 --minimo-ordenes 5
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema, leer_marca, guardar_marca
+from ingesta_peso import leer_puntos_locales
+from progreso_ordenes import calcular_progreso_lote
+
+logger = logging.getLogger(__name__)
+
+# Ancho de cada tramo de avance (%) y avance máximo considerado (órdenes con sobre-embutido)
+ANCHO_TRAMO = 5
+PORCENTAJE_MAXIMO = 120
+# Una orden sin pesajes en estas horas se considera cerrada
+HORAS_ORDEN_CERRADA = 12
+# Segundos entre revisiones de si hay perfiles nuevos (el gráfico de TV no consulta en cada cuadro)
+INTERVALO_RECARGA_PERFILES = 300
+
+ESQUEMA_PERFILES = """
+CREATE TABLE IF NOT EXISTS perfil_peso_codigo (
+    CODIGO TEXT NOT NULL,
+    tramo INTEGER NOT NULL,
+    porcentaje REAL NOT NULL,
+    mediana REAL NOT NULL,
+    inferior REAL NOT NULL,
+    superior REAL NOT NULL,
+    ordenes INTEGER NOT NULL,
+    PRIMARY KEY (CODIGO, tramo)
+);
+"""
+
+def calcular_perfiles(df_puntos, df_progreso=None, minimo_ordenes=3):
+    """
+    Perfil por (CODIGO, tramo de avance): mediana y banda P10-P90 del peso sauciso
+    entre órdenes (cada orden pesa lo mismo: primero la mediana de la orden en el tramo).
+    El avance de cada pesaje es el kg acumulado sobre la masa inicial de la orden, o sobre
+    su total embutido si no tiene masa inicial.
+    """
+    df = df_puntos[df_puntos['ODP'] != ''].sort_values(['CODIGO', 'ODP', 'FECHAINGRESO'])
+    if df.empty:
+        return pd.DataFrame(columns=['CODIGO', 'tramo', 'porcentaje', 'mediana', 'inferior', 'superior', 'ordenes'])
+    acumulado = df.groupby(['CODIGO', 'ODP'])['_kgEmbutidos'].cumsum()
+    denominador = df.groupby(['CODIGO', 'ODP'])['_kgEmbutidos'].transform('sum')
+    if df_progreso is not None and not df_progreso.empty:
+        masa = df_progreso.loc[df_progreso['tiene_masa_inicial'] & (df_progreso['kg_deben_embutir'] > 0)]
+        masa = df[['CODIGO', 'ODP']].merge(
+            masa[['CODIGO', 'ODP', 'kg_deben_embutir']], on=['CODIGO', 'ODP'], how='left'
+        )['kg_deben_embutir'].to_numpy()
+        denominador = pd.Series(np.where(np.isnan(masa), denominador, masa), index=df.index)
+    porcentaje = acumulado / denominador * 100
+    df = df.assign(tramo=(porcentaje // ANCHO_TRAMO).clip(0, PORCENTAJE_MAXIMO // ANCHO_TRAMO - 1).astype(int))
+
+    df_orden = df.groupby(['CODIGO', 'ODP', 'tramo'], as_index=False)['_PesoSauciso'].median()
+    df_perfil = df_orden.groupby(['CODIGO', 'tramo'])['_PesoSauciso'].agg(
+        mediana='median',
+        inferior=lambda s: s.quantile(0.10),
+        superior=lambda s: s.quantile(0.90),
+        ordenes='size',
+    ).reset_index()
+    df_perfil = df_perfil[df_perfil['ordenes'] >= minimo_ordenes]
+    df_perfil.insert(2, 'porcentaje', (df_perfil['tramo'] + 0.5) * ANCHO_TRAMO)
+    return df_perfil.reset_index(drop=True)
+
+def construir_perfiles(dias=180, minimo_ordenes=3, ahora=None):
+    """Recalcular y guardar los perfiles con las órdenes cerradas de los últimos días. Devuelve los códigos con perfil."""
+    asegurar_esquema("perfiles", ESQUEMA_PERFILES)
+    ahora = pd.Timestamp(ahora or datetime.now())
+    df_puntos = leer_puntos_locales(ahora - timedelta(days=dias))
+    df_puntos = df_puntos[df_puntos['ODP'] != '']
+    ultimos = df_puntos.groupby(['CODIGO', 'ODP'])['FECHAINGRESO'].transform('max')
+    df_puntos = df_puntos[ultimos < ahora - timedelta(hours=HORAS_ORDEN_CERRADA)]
+
+    ordenes = df_puntos[['CODIGO', 'ODP']].drop_duplicates().itertuples(index=False, name=None)
+    df_progreso, error = calcular_progreso_lote(ordenes)
+    if error:
+        logger.warning("Sin masa inicial (%s): el avance se calcula sobre el total embutido", error)
+        df_progreso = None
+    df_perfiles = calcular_perfiles(df_puntos, df_progreso, minimo_ordenes)
+
+    conn = conectar_almacen_local()
+    try:
+        conn.execute("DELETE FROM perfil_peso_codigo")
+        conn.executemany(
+            "INSERT INTO perfil_peso_codigo (CODIGO, tramo, porcentaje, mediana, inferior, superior, ordenes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (c, int(t), float(p), float(m), float(i), float(s), int(n))
+                for c, t, p, m, i, s, n in df_perfiles.itertuples(index=False, name=None)
+            ]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    # Marca de construcción: las cachés de los servidores recargan los perfiles al verla cambiar
+    guardar_marca("perfiles_construidos", ahora.strftime("%Y-%m-%d %H:%M:%S"))
+    return sorted(df_perfiles['CODIGO'].unique())
+
+
+class CachePerfiles:
+    """
+    Perfiles en memoria por código. Solo revisa si hay una construcción nueva cada
+    INTERVALO_RECARGA_PERFILES segundos, así consultar un perfil no toca el almacen.
+    """
+
+    def __init__(self):
+        self.perfiles = {}  # CODIGO -> (porcentaje, mediana, inferior, superior) como arreglos
+        self.construccion = None
+        self.revisado = None
+        self.lock = threading.Lock()
+
+    def _recargar(self):
+        asegurar_esquema("perfiles", ESQUEMA_PERFILES)
+        construccion = leer_marca("perfiles_construidos")
+        if construccion == self.construccion:
+            return
+        conn = conectar_almacen_local()
+        try:
+            df = pd.read_sql_query(
+                "SELECT CODIGO, porcentaje, mediana, inferior, superior FROM perfil_peso_codigo ORDER BY CODIGO, tramo",
+                conn
+            )
+        finally:
+            conn.close()
+        self.perfiles = {
+            codigo: tuple(df_codigo[col].to_numpy() for col in ['porcentaje', 'mediana', 'inferior', 'superior'])
+            for codigo, df_codigo in df.groupby('CODIGO')
+        }
+        self.construccion = construccion
+
+    def perfil(self, codigo):
+        """(porcentaje, mediana, inferior, superior) del código o None si no tiene perfil"""
+        with self.lock:
+            if self.revisado is None or time.monotonic() - self.revisado >= INTERVALO_RECARGA_PERFILES:
+                self.revisado = time.monotonic()
+                try:
+                    self._recargar()
+                except Exception as e:
+                    logger.warning("No se pudieron recargar los perfiles: %s", e)
+            return self.perfiles.get(str(codigo))
+
+    def banda(self, codigo, porcentajes):
+        """Mediana e intervalo de referencia interpolados en los porcentajes de avance indicados (o None)"""
+        perfil = self.perfil(codigo)
+        if perfil is None:
+            return None
+        porcentaje, mediana, inferior, superior = perfil
+        x = np.asarray(porcentajes, dtype=float)
+        return np.interp(x, porcentaje, mediana), np.interp(x, porcentaje, inferior), np.interp(x, porcentaje, superior)
+
+
+CACHE_PERFILES = CachePerfiles()
+
+def main():
+    parser = argparse.ArgumentParser(description="Construir perfiles de referencia de peso sauciso por código")
+    parser.add_argument("--dias", type=int, default=180, help="Días de historia a considerar")
+    parser.add_argument("--minimo-ordenes", type=int, default=3, help="Órdenes mínimas por tramo de avance")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Solo lectura del almacen local: la ingesta la hace el dashboard, que es quien
+    # mantiene los consumidores en memoria (índice, alarmas, mapa de calor)
+    codigos = construir_perfiles(args.dias, args.minimo_ordenes)
+    logger.info("Perfiles construidos para %d códigos", len(codigos))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from database_connection import consultar_datos
+from ingesta_peso import sincronizar_ingesta
+from programador_refresco import PROGRAMADOR_REFRESCO
+from progreso_ordenes import calcular_progreso_lote
+from tablero_ordenes import obtener_tablero_ordenes, inicio_periodo
+from turnos_peso import proximo_cambio_turno
+from dashboard_peso_embuticion import (
+    QUERY_ANOS, ANO_POR_DEFECTO, query_codigos_disponibles, query_odps_disponibles, resolver_rangos_filtro,
+    obtener_fechas_con_datos, obtener_snapshot_tiempo_real, obtener_ultimas_ordenes_embuticion,
+    WHERE_TIEMPO_REAL, WHERE_PROGRESO_TIEMPO_REAL, PANELES_POR_DEFECTO, ORDENES_EN_ROTACION
+)
+
+logger = logging.getLogger(__name__)
+
+# Precalentamiento: consultas frías (listas de filtros, órdenes, snapshot) en paralelo al iniciar
+# el proceso y alrededor de cada cambio de turno, cuando se reconectan las pantallas
+PRECALENTAR = os.environ.get("PESO_PRECALENTAR", "1") != "0"
+HILOS_PRECALENTAMIENTO = 4
+# Ventana alrededor del cambio de turno en la que se mantiene la caché caliente; las consultas
+# cacheadas vencen cada ttl_cache segundos, así que en la ventana se repite una vez por vencimiento
+MINUTOS_ANTES_CAMBIO_TURNO = int(os.environ.get("PESO_PRECALENTAR_MINUTOS_ANTES", "2"))
+MINUTOS_DESPUES_CAMBIO_TURNO = int(os.environ.get("PESO_PRECALENTAR_MINUTOS_DESPUES", "5"))
+
+def _error_consulta(resultado):
+    _, error = resultado
+    return error
+
+def _sin_error(funcion, *args):
+    """Para funciones que muestran sus propios errores y devuelven solo el resultado"""
+    return lambda: funcion(*args) and None
+
+def _precalentar_snapshot():
+    """Snapshot de tiempo real y progreso de las órdenes en rotación y en la grilla por defecto"""
+    ordenes, _ = obtener_snapshot_tiempo_real()
+    if not ordenes:
+        return None
+    for cantidad in sorted({ORDENES_EN_ROTACION, PANELES_POR_DEFECTO}):
+        error = _error_consulta(calcular_progreso_lote(ordenes[:cantidad], WHERE_PROGRESO_TIEMPO_REAL))
+        if error:
+            return error
+    return None
+
+def tareas_precalentamiento():
+    """{nombre: función} de cada consulta a precalentar; cada función devuelve un error o None"""
+    rangos_defecto = resolver_rangos_filtro(ANO_POR_DEFECTO, 'Todas', 'Todas', [ANO_POR_DEFECTO])
+    return {
+        'años': lambda: _error_consulta(consultar_datos(QUERY_ANOS)),
+        'fechas': _sin_error(obtener_fechas_con_datos, ANO_POR_DEFECTO),
+        'códigos': lambda: _error_consulta(consultar_datos(query_codigos_disponibles(rangos_defecto))),
+        'odps': lambda: _error_consulta(consultar_datos(query_odps_disponibles(rangos_defecto))),
+        'tablero': lambda: _error_consulta(obtener_tablero_ordenes().actualizar(inicio_periodo('dia'))),
+        'últimas órdenes': _sin_error(obtener_ultimas_ordenes_embuticion, WHERE_TIEMPO_REAL, ORDENES_EN_ROTACION),
+        'snapshot': _precalentar_snapshot,
+    }
+
+def _ejecutar_tarea(nombre, funcion):
+    inicio = time.perf_counter()
+    try:
+        error = funcion()
+    except Exception as e:
+        error = str(e)
+    return nombre, time.perf_counter() - inicio, error
+
+def precalentar(hilos=HILOS_PRECALENTAMIENTO):
+    """
+    Ejecutar todas las tareas en paralelo. Antes se sincroniza la ingesta para que el
+    snapshot quede cacheado con la misma versión de datos que pedirán las pantallas.
+    Devuelve {nombre: (segundos, error)}.
+    """
+    inicio = time.perf_counter()
+    sincronizar_ingesta(forzar=True, carga_inicial=True)
+    tareas = tareas_precalentamiento()
+    with ThreadPoolExecutor(max_workers=max(1, hilos)) as executor:
+        resultados = list(executor.map(lambda item: _ejecutar_tarea(*item), tareas.items()))
+    for nombre, segundos, error in resultados:
+        if error:
+            logger.warning("Precalentamiento de %s con error (%.1f s): %s", nombre, segundos, error)
+    logger.info("Precalentamiento completo en %.1f s", time.perf_counter() - inicio)
+    return {nombre: (segundos, error) for nombre, segundos, error in resultados}
+
+def proximo_precalentamiento(ahora=None):
+    """Inicio y fin de la próxima ventana de precalentamiento alrededor de un cambio de turno"""
+    ahora = datetime.now() if ahora is None else ahora
+    antes, despues = timedelta(minutes=MINUTOS_ANTES_CAMBIO_TURNO), timedelta(minutes=MINUTOS_DESPUES_CAMBIO_TURNO)
+    cambio = proximo_cambio_turno(ahora - despues)
+    return cambio - antes, cambio + despues
+
+def _ciclo_precalentamiento():
+    try:
+        precalentar()
+    except Exception as e:
+        logger.warning("Precalentamiento inicial fallido: %s", e)
+    while True:
+        inicio, fin = proximo_precalentamiento()
+        time.sleep(max(0.0, (inicio - datetime.now()).total_seconds()))
+        while datetime.now() < fin:
+            try:
+                precalentar()
+            except Exception as e:
+                logger.warning("Precalentamiento de cambio de turno fallido: %s", e)
+            time.sleep(PROGRAMADOR_REFRESCO.politica('tiempo_real')['ttl_cache'])
+
+@st.cache_resource
+def iniciar_precalentamiento():
+    """
+    Un hilo de precalentamiento por proceso. Streamlit no ejecuta la aplicación hasta
+    la primera sesión: el precalentamiento inicial corre en paralelo con esa sesión y
+    las siguientes (y las de cada cambio de turno) encuentran la caché llena.
+    """
+    if not PRECALENTAR:
+        return None
+    hilo = threading.Thread(target=_ciclo_precalentamiento, name="precalentamiento", daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+
+# Políticas de refresco por vista (segundos):
+# - intervalo_datos: cada cuánto se revisa si hay datos nuevos
+# - intervalo_rotacion: cada cuánto rota la orden mostrada (0 = sin rotar)
+# - intervalo_maximo: refrescar aunque no haya datos nuevos pasado este tiempo (0 = nunca)
+# - ttl_cache: vigencia de las consultas cacheadas de la vista
+POLITICAS_POR_DEFECTO = {
+    'defecto': {'intervalo_datos': 30, 'intervalo_rotacion': 0, 'intervalo_maximo': 300, 'ttl_cache': 30},
+    'tiempo_real': {'intervalo_datos': 1, 'intervalo_rotacion': 30, 'intervalo_maximo': 60, 'ttl_cache': 30},
+    'pantalla_completa': {'intervalo_datos': 1, 'intervalo_rotacion': 30, 'intervalo_maximo': 60, 'ttl_cache': 30},
+    'normal': {'intervalo_datos': 60, 'intervalo_rotacion': 0, 'intervalo_maximo': 600, 'ttl_cache': 30},
+    'ordenes': {'intervalo_datos': 30, 'intervalo_rotacion': 0, 'intervalo_maximo': 300, 'ttl_cache': 30},
+}
+
+# Archivo JSON opcional con políticas por vista; se relee cuando cambia (sin reiniciar el servidor)
+RUTA_POLITICAS_REFRESCO = os.environ.get(
+    "PESO_REFRESCO_ARCHIVO",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "refresco.json")
+)
+
+
+class ProgramadorRefresco:
+    """
+    Punto único de decisión de cuándo refrescar cada vista.
+
+    Las políticas salen de los valores por defecto, del archivo de políticas
+    (releído si cambia su fecha de modificación) y de ajustes en tiempo de
+    ejecución con ajustar(), en ese orden de prioridad creciente.
+    """
+
+    def __init__(self, ruta_politicas=RUTA_POLITICAS_REFRESCO):
+        self.ruta_politicas = ruta_politicas
+        self.politicas_archivo = {}
+        self.fecha_archivo = None
+        self.ajustes = {}
+        self.lock = threading.Lock()
+
+    def _leer_archivo(self):
+        try:
+            fecha = os.path.getmtime(self.ruta_politicas)
+        except OSError:
+            self.politicas_archivo, self.fecha_archivo = {}, None
+            return
+        if fecha == self.fecha_archivo:
+            return
+        try:
+            with open(self.ruta_politicas, encoding="utf-8") as archivo:
+                self.politicas_archivo = json.load(archivo)
+        except (OSError, ValueError):
+            # Archivo a medio escribir o inválido: mantener las políticas anteriores
+            return
+        self.fecha_archivo = fecha
+
+    def politica(self, vista=None):
+        """Política efectiva de una vista"""
+        vista = vista or 'defecto'
+        with self.lock:
+            self._leer_archivo()
+            capas = (POLITICAS_POR_DEFECTO, self.politicas_archivo, self.ajustes)
+            politica = {}
+            # En cada capa, 'defecto' aplica a todas las vistas y la vista puede redefinirlo
+            for capa in capas:
+                politica.update(capa.get('defecto', {}))
+                if vista != 'defecto':
+                    politica.update(capa.get(vista, {}))
+            return politica
+
+    def ajustar(self, vista, **valores):
+        """Cambiar la política de una vista en tiempo de ejecución (ej: ajustar('tiempo_real', intervalo_rotacion=20))"""
+        with self.lock:
+            self.ajustes.setdefault(vista, {}).update(valores)
+
+    def clave_cache(self, vista=None, version=None):
+        """
+        Clave que cambia cada ttl_cache segundos (y con la versión de datos si se indica):
+        las consultas cacheadas con esta clave vencen según la política de la vista
+        """
+        ttl = self.politica(vista)['ttl_cache']
+        intervalo = int(time.time() // ttl) if ttl > 0 else time.time()
+        return (vista or 'defecto', version, intervalo)
+
+    def intervalo_revision(self, vista, limite=None, intervalo=None):
+        """Segundos hasta la próxima revisión: intervalo_datos (o intervalo) acotado por limite"""
+        espera = intervalo or self.politica(vista)['intervalo_datos']
+        if limite is not None:
+            espera = min(espera, max(0.0, limite - time.time()))
+        return espera
+
+    def motivo_refresco(self, vista, inicio, version_inicial=None, version=None, limite=None, intervalo=None):
+        """
+        Revisión sin bloquear: motivo para refrescar ahora (ver esperar_refresco) o None.
+        inicio es el time.monotonic() y version_inicial el version() del último refresco.
+        """
+        politica = self.politica(vista)
+        if limite is not None and time.time() >= limite:
+            return 'rotacion'
+        if version is None:
+            return 'intervalo' if time.monotonic() - inicio >= (intervalo or politica['intervalo_datos']) else None
+        if version() != version_inicial:
+            return 'datos'
+        if politica['intervalo_maximo'] and time.monotonic() - inicio >= politica['intervalo_maximo']:
+            return 'maximo'
+        return None
+
+    def esperar_refresco(self, vista, version=None, limite=None, intervalo=None):
+        """
+        Bloquear hasta que haga falta refrescar la vista. Devuelve el motivo:
+        'rotacion' (se alcanzó limite, time.time()), 'datos' (cambió version()),
+        'maximo' (pasó intervalo_maximo sin cambios) o 'intervalo' (sin función de versión).
+        """
+        version_inicial = version() if version else None
+        inicio = time.monotonic()
+        while True:
+            time.sleep(self.intervalo_revision(vista, limite, intervalo))
+            motivo = self.motivo_refresco(vista, inicio, version_inicial, version, limite, intervalo)
+            if motivo:
+                return motivo
+
+
+PROGRAMADOR_REFRESCO = ProgramadorRefresco()
@@ -0,0 +1,158 @@
+import math
+
+import pandas as pd
+
+from database_connection import consultar_datos, consultar_datos_tiempo_real
+from calidad_datos import condicion_calidad_sql
+
+# SQL Server admite hasta 1000 filas por constructor VALUES
+ORDENES_POR_CONSULTA = 900
+
+COLUMNAS_PROGRESO = ['CODIGO', 'ODP', 'kg_deben_embutir', 'kg_embutidos', 'porcentaje',
+                     'promedio_saucisso', 'saucissos_faltantes', 'tiene_masa_inicial',
+                     'peso_odp', 'porcentaje_merma']
+PROGRESO_VACIO = {'kg_deben_embutir': 0, 'kg_embutidos': 0, 'porcentaje': 0, 'saucissos_faltantes': 0}
+
+def _literal(valor):
+    return "'" + str(valor).replace("'", "''") + "'"
+
+def _query_progreso_lote(ordenes, where_clause):
+    """
+    Misma lógica que calcular_progreso_embuticion_bi con orden específica, para
+    muchas órdenes a la vez: las órdenes entran como tabla VALUES y se unen a
+    vwOrdenDocumento / vwProductoFormula (masa inicial) y vwRegistrosDetallados (embutido)
+    """
+    valores = ",\n            ".join(f"({_literal(codigo)}, {_literal(odp)})" for codigo, odp in ordenes)
+    return f"""
+    WITH
+    Ordenes AS (
+        SELECT CodigoProducto, CodigoOrden
+        FROM (VALUES
+            {valores}
+        ) AS o (CodigoProducto, CodigoOrden)
+    ),
+    -- 1. Ordenes con merma de MASA unicamente (CodigoMp que empiece con 'YY06')
+    OrdenesConMerma AS (
+        SELECT DISTINCT
+            od.CodigoProducto,
+            od.CodigoOrden,
+            od.PesoODP,
+            od.FechaCreacion,
+            ISNULL(pf.PorcentajeMermaMP, 0) as PorcentajeMermaMP,
+            pf.CodigoMp
+        FROM vwOrdenDocumento od
+        INNER JOIN Ordenes o ON od.CodigoProducto = o.CodigoProducto AND od.CodigoOrden = o.CodigoOrden
+        LEFT JOIN vwProductoFormula pf ON od.CodigoProducto = pf.CodigoProducto
+        WHERE pf.CodigoMp LIKE 'YY06%'
+            AND ISNULL(pf.PorcentajeMermaMP, 0) > 0
+    ),
+    -- 2. MasaInicial = PesoODP*1+(PesoODP*(PorcentajeMermaMP/100)) por orden
+    MasaInicial AS (
+        SELECT
+            CodigoProducto,
+            CodigoOrden,
+            SUM(PesoODP * 1 + (PesoODP * (PorcentajeMermaMP / 100.0))) as KgDebenEmbutir,
+            MAX(PesoODP) as PesoODP,
+            SUM(PorcentajeMermaMP) as PorcentajeMerma
+        FROM OrdenesConMerma
+        GROUP BY CodigoProducto, CodigoOrden
+    ),
+    -- 3. Pesajes de embutición por (FECHAINGRESO, orden) para kg y peso sauciso promedio
+    PesajesEmbuticion AS (
+        SELECT
+            rd.CODIGO,
+            rd.ODP,
+            rd.FECHAINGRESO,
+            SUM(rd.PESONETO) as _kgEmbutidos,
+            SUM(rd.NUMEMBALAJE) as TotalEmbalajes
+        FROM vwRegistrosDetallados rd
+        INNER JOIN Ordenes o ON rd.CODIGO = o.CodigoProducto AND rd.ODP = o.CodigoOrden
+        WHERE rd.PROCESO = 'Embutición'
+            AND {condicion_calidad_sql('rd')}
+            AND {where_clause}
+        GROUP BY rd.CODIGO, rd.ODP, rd.FECHAINGRESO
+    ),
+    EmbutidoOrden AS (
+        SELECT
+            CODIGO,
+            ODP,
+            SUM(_kgEmbutidos) as KgEmbutidos,
+            AVG(CASE WHEN _kgEmbutidos > 0 AND TotalEmbalajes > 0 THEN _kgEmbutidos / TotalEmbalajes END) as PromedioSaucisso
+        FROM PesajesEmbuticion
+        GROUP BY CODIGO, ODP
+    )
+    SELECT
+        o.CodigoProducto as CODIGO,
+        o.CodigoOrden as ODP,
+        mi.KgDebenEmbutir,
+        mi.PesoODP,
+        mi.PorcentajeMerma,
+        ISNULL(eo.KgEmbutidos, 0) as KgEmbutidos,
+        eo.PromedioSaucisso
+    FROM Ordenes o
+    LEFT JOIN MasaInicial mi ON mi.CodigoProducto = o.CodigoProducto AND mi.CodigoOrden = o.CodigoOrden
+    LEFT JOIN EmbutidoOrden eo ON eo.CODIGO = o.CodigoProducto AND eo.ODP = o.CodigoOrden
+    """
+
+def calcular_progreso_lote(ordenes, where_clause="1=1", tiempo_real=False):
+    """
+    Progreso de embutición de muchas órdenes (CODIGO, ODP) con una consulta por
+    cada ORDENES_POR_CONSULTA órdenes y el cálculo final en pandas.
+    Con tiempo_real=True la consulta no pasa por la caché (para quien ya sabe que
+    las órdenes tienen pesajes nuevos y no puede aceptar un resultado anterior).
+    Devuelve (DataFrame, error) con CODIGO, ODP, kg_deben_embutir, kg_embutidos,
+    porcentaje, promedio_saucisso, saucissos_faltantes, tiene_masa_inicial,
+    peso_odp y porcentaje_merma (merma YY06 planificada).
+    """
+    ordenes = list(dict.fromkeys((str(c), str(o)) for c, o in ordenes if c and o))
+    if not ordenes:
+        return pd.DataFrame(columns=COLUMNAS_PROGRESO), None
+
+    consultar = consultar_datos_tiempo_real if tiempo_real else consultar_datos
+    partes = []
+    for inicio in range(0, len(ordenes), ORDENES_POR_CONSULTA):
+        df_parte, error = consultar(_query_progreso_lote(ordenes[inicio:inicio + ORDENES_POR_CONSULTA], where_clause))
+        if error:
+            return None, error
+        partes.append(df_parte)
+    return completar_progreso(pd.concat(partes, ignore_index=True)), None
+
+def completar_progreso(df):
+    """
+    Columnas de progreso a partir de las de la consulta por lote (CODIGO, ODP, KgDebenEmbutir,
+    PesoODP, PorcentajeMerma, KgEmbutidos, PromedioSaucisso); también la usa la reproducción
+    para calcular el progreso con los puntos grabados
+    """
+    df = df.copy()
+    df['tiene_masa_inicial'] = df['KgDebenEmbutir'].notna()
+    df['kg_deben_embutir'] = pd.to_numeric(df['KgDebenEmbutir'], errors='coerce').fillna(0.0)
+    df['kg_embutidos'] = pd.to_numeric(df['KgEmbutidos'], errors='coerce').fillna(0.0)
+    df['promedio_saucisso'] = pd.to_numeric(df['PromedioSaucisso'], errors='coerce')
+    df['peso_odp'] = pd.to_numeric(df['PesoODP'], errors='coerce')
+    df['porcentaje_merma'] = pd.to_numeric(df['PorcentajeMerma'], errors='coerce')
+    df['porcentaje'] = (df['kg_embutidos'] / df['kg_deben_embutir'].where(df['kg_deben_embutir'] > 0) * 100).fillna(0.0)
+
+    # Saucissos faltantes = ceil(kg faltantes / peso sauciso promedio)
+    kg_faltantes = (df['kg_deben_embutir'] - df['kg_embutidos']).clip(lower=0)
+    faltantes = (kg_faltantes / df['promedio_saucisso'].where(df['promedio_saucisso'] > 0))
+    df['saucissos_faltantes'] = faltantes.apply(lambda v: math.ceil(v) if pd.notna(v) and v > 0 else 0).astype(int)
+    return df[COLUMNAS_PROGRESO]
+
+def progreso_de_orden(df_progreso, codigo, odp):
+    """
+    Progreso de una orden en el formato de calcular_progreso_embuticion_bi.
+    Órdenes sin masa inicial (sin merma YY06) devuelven ceros, igual que la consulta individual.
+    """
+    if df_progreso is None or df_progreso.empty:
+        return dict(PROGRESO_VACIO)
+    fila = df_progreso[(df_progreso['CODIGO'] == str(codigo)) & (df_progreso['ODP'] == str(odp))]
+    if fila.empty or not fila.iloc[0]['tiene_masa_inicial']:
+        return dict(PROGRESO_VACIO)
+    fila = fila.iloc[0]
+    return {
+        'kg_deben_embutir': float(fila['kg_deben_embutir']),
+        'kg_embutidos': float(fila['kg_embutidos']),
+        'porcentaje': float(fila['porcentaje']),
+        'saucissos_faltantes': int(fila['saucissos_faltantes']),
+        'codigo_orden': str(odp),
+    }
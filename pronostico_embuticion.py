@@ -0,0 +1,110 @@
+import threading
+from datetime import datetime, timedelta
+import math
+
+import streamlit as st
+
+
+class EstimadorThroughput:
+    """
+    Estimador de ritmo de embutición (kg/min) por ODP con media exponencial.
+
+    Cada pesaje nuevo aporta kg / minutos desde el pesaje anterior.
+    Las pausas largas (cambios de turno, paros) no se cuentan como ritmo.
+    """
+
+    def __init__(self, alfa=0.3, pausa_maxima_min=45):
+        self.alfa = alfa
+        self.pausa_maxima_min = pausa_maxima_min
+        self.kg_por_minuto = None
+        self.ultima_fecha = None
+
+    def agregar(self, fecha, kg):
+        """Incorporar un pesaje (O(1))"""
+        if self.ultima_fecha is not None and fecha > self.ultima_fecha:
+            minutos = (fecha - self.ultima_fecha).total_seconds() / 60.0
+            if 0 < minutos <= self.pausa_maxima_min and kg > 0:
+                ritmo = kg / minutos
+                if self.kg_por_minuto is None:
+                    self.kg_por_minuto = ritmo
+                else:
+                    self.kg_por_minuto = self.alfa * ritmo + (1 - self.alfa) * self.kg_por_minuto
+        if self.ultima_fecha is None or fecha > self.ultima_fecha:
+            self.ultima_fecha = fecha
+
+    def proyectar_fin(self, kg_faltantes):
+        """Fecha estimada de fin de la orden o None si aún no hay ritmo"""
+        if kg_faltantes <= 0:
+            return self.ultima_fecha
+        if not self.kg_por_minuto or self.ultima_fecha is None:
+            return None
+        return self.ultima_fecha + timedelta(minutes=kg_faltantes / self.kg_por_minuto)
+
+
+class RegistroEstimadores:
+    """Estimadores por ODP compartidos entre reruns y sesiones"""
+
+    def __init__(self):
+        self.estimadores = {}
+        self.lock = threading.Lock()
+
+    def actualizar(self, odp, df_serie):
+        """Alimentar con los pesajes posteriores al último visto de la ODP"""
+        with self.lock:
+            estimador = self.estimadores.setdefault(str(odp), EstimadorThroughput())
+            if df_serie is None or df_serie.empty:
+                return estimador
+            df_serie = df_serie.sort_values('FECHAINGRESO')
+            if estimador.ultima_fecha is not None:
+                df_serie = df_serie[df_serie['FECHAINGRESO'] > estimador.ultima_fecha]
+            for fecha, kg in zip(df_serie['FECHAINGRESO'], df_serie['_kgEmbutidos']):
+                if kg is not None and not (isinstance(kg, float) and math.isnan(kg)):
+                    estimador.agregar(fecha, float(kg))
+            return estimador
+
+
+@st.cache_resource
+def obtener_registro_estimadores():
+    """Registro único de estimadores por proceso"""
+    return RegistroEstimadores()
+
+
+def pronosticar_fin_orden(odp, df_serie, progreso, registro=None, ahora=None):
+    """
+    Proyectar la hora de fin de la ODP con la serie ya cargada y el progreso calculado.
+    registro y ahora permiten usar estimadores y reloj propios (reproducción) en lugar
+    de los compartidos y la hora actual.
+    Devuelve {'fecha_fin', 'kg_por_minuto', 'minutos_restantes'} o None
+    """
+    estimador = (registro or obtener_registro_estimadores()).actualizar(odp, df_serie)
+    # Sin masa inicial (progreso vacío o con error) no hay kg faltantes que proyectar
+    if progreso.get('kg_deben_embutir', 0) <= 0:
+        return None
+    kg_faltantes = progreso['kg_deben_embutir'] - progreso.get('kg_embutidos', 0)
+    fecha_fin = estimador.proyectar_fin(kg_faltantes)
+    if fecha_fin is None:
+        return None
+    if kg_faltantes <= 0:
+        minutos_restantes = 0.0
+    else:
+        # Lo que falta se cuenta desde ahora; si la línea lleva parada más de lo que
+        # faltaba, la proyección ya quedó en el pasado y no se muestra
+        minutos_restantes = (fecha_fin - (ahora or datetime.now())).total_seconds() / 60.0
+        if minutos_restantes < 0:
+            return None
+    return {
+        'fecha_fin': fecha_fin,
+        'kg_por_minuto': estimador.kg_por_minuto or 0,
+        'minutos_restantes': minutos_restantes
+    }
+
+
+def formatear_pronostico(pronostico):
+    """Texto corto para mostrar junto a la barra de progreso"""
+    if not pronostico:
+        return "Fin estimado: --:--"
+    minutos = int(round(pronostico['minutos_restantes']))
+    horas, minutos = divmod(minutos, 60)
+    restante = f"{horas}h {minutos:02d}m" if horas else f"{minutos}m"
+    return (f"Fin estimado: {pronostico['fecha_fin']:%H:%M} (~{restante}) | "
+            f"{pronostico['kg_por_minuto']:.1f} kg/min")
@@ -0,0 +1,202 @@
+import argparse
+import os
+import time
+from collections import deque
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from alarmas_peso import MotorAlarmas
+from control_estadistico import MotorSPC
+from ingesta_peso import leer_puntos_locales, normalizar_puntos, agregar_registros_a_puntos
+from merma_ordenes import consultar_merma
+from progreso_ordenes import completar_progreso
+from pronostico_embuticion import RegistroEstimadores
+
+VELOCIDAD_MINIMA = 1
+VELOCIDAD_MAXIMA = 100
+# Misma ventana que WHERE_TIEMPO_REAL del dashboard
+VENTANA_SNAPSHOT = timedelta(weeks=2)
+# Cuadros recientes guardados para las estadísticas de tiempos
+CUADROS_REGISTRADOS = 1000
+
+def cargar_grabacion(origen="local", fecha_inicio=None, fecha_fin=None):
+    """
+    Puntos grabados para reproducir: "local" lee el almacen local de la ingesta; una
+    ruta .csv/.parquet puede traer registros crudos de vwRegistrosDetallados (con
+    PESONETO/NUMEMBALAJE/PROCESO) o puntos ya agregados (_kgEmbutidos/TotalEmbalajes).
+    """
+    if origen == "local":
+        return leer_puntos_locales(fecha_inicio, fecha_fin)
+    if not os.path.exists(origen):
+        raise FileNotFoundError(f"No existe la grabación {origen}")
+    if origen.lower().endswith(".parquet"):
+        df = pd.read_parquet(origen)
+    else:
+        df = pd.read_csv(origen)
+    if 'PESONETO' in df.columns:
+        df = agregar_registros_a_puntos(df, registrar_calidad=False)
+    df = normalizar_puntos(df)
+    if fecha_inicio is not None:
+        df = df[df['FECHAINGRESO'] >= pd.Timestamp(fecha_inicio)]
+    if fecha_fin is not None:
+        df = df[df['FECHAINGRESO'] < pd.Timestamp(fecha_fin)]
+    return df.sort_values('FECHAINGRESO').reset_index(drop=True)
+
+def cargar_masas_iniciales():
+    """
+    Masa inicial de cada orden para el progreso de la reproducción, tomada de los resultados
+    de merma guardados (órdenes cerradas): columnas CODIGO, ODP, KgDebenEmbutir, PesoODP y
+    PorcentajeMerma, como las de la consulta de progreso por lote
+    """
+    df = consultar_merma()
+    return pd.DataFrame({
+        'CODIGO': df['CODIGO'].astype(str),
+        'ODP': df['ODP'].astype(str),
+        'KgDebenEmbutir': df['kg_deben_embutir'],
+        'PesoODP': df['peso_odp'],
+        'PorcentajeMerma': df['porcentaje_merma_plan'],
+    }).drop_duplicates(['CODIGO', 'ODP'], keep='last')
+
+class SesionReplay:
+    """
+    Reproduce una grabación de puntos con un reloj simulado a 1x-100x.
+    snapshot() devuelve los mismos puntos que la consulta del snapshot de tiempo
+    real habría devuelto en el instante simulado.
+
+    Con paso_fijo el reloj solo avanza con avanzar() (ejecución determinística
+    para pruebas de rendimiento); sin él avanza con el tiempo real.
+
+    El progreso sale de la grabación y de las masas iniciales, sin consultar SQL Server,
+    y la sesión tiene su propio motor SPC, estimadores de fin y motor de alarmas para no
+    mezclar los puntos reproducidos con el estado de las pantallas en vivo.
+    """
+
+    def __init__(self, df_puntos, velocidad=1, inicio=None, paso_fijo=False, masas=None):
+        if df_puntos is None or df_puntos.empty:
+            raise ValueError("La grabación no tiene puntos")
+        self.df_puntos = df_puntos.sort_values('FECHAINGRESO').reset_index(drop=True)
+        self.fechas = self.df_puntos['FECHAINGRESO'].to_numpy()
+        self.velocidad = max(VELOCIDAD_MINIMA, min(VELOCIDAD_MAXIMA, float(velocidad)))
+        self.inicio = pd.Timestamp(inicio) if inicio is not None else self.df_puntos['FECHAINGRESO'].iloc[0]
+        self.fin = self.df_puntos['FECHAINGRESO'].iloc[-1]
+        self.paso_fijo = paso_fijo
+        self.segundos_simulados = 0.0
+        self.reloj_inicio = time.monotonic()
+        self.tiempos_cuadro = deque(maxlen=CUADROS_REGISTRADOS)
+        self.masas = masas if masas is not None else pd.DataFrame(
+            columns=['CODIGO', 'ODP', 'KgDebenEmbutir', 'PesoODP', 'PorcentajeMerma'])
+        self.motor_spc = MotorSPC()
+        self.estimadores = RegistroEstimadores()
+        # Sin sumideros ni restauración desde el almacen: las alarmas reproducidas no se registran
+        self.motor_alarmas = MotorAlarmas()
+        self.motor_alarmas.restaurado = True
+        self.puntos_evaluados = 0
+
+    def tiempo_simulado(self):
+        """Instante de la grabación que se está reproduciendo"""
+        if not self.paso_fijo:
+            self.segundos_simulados = (time.monotonic() - self.reloj_inicio) * self.velocidad
+        return self.inicio + timedelta(seconds=self.segundos_simulados)
+
+    def avanzar(self, segundos_reales):
+        """Avanzar el reloj simulado (modo paso fijo) los segundos reales indicados por la velocidad"""
+        self.segundos_simulados += segundos_reales * self.velocidad
+
+    def terminado(self):
+        return self.tiempo_simulado() > self.fin
+
+    def puntos_visibles(self, ventana=VENTANA_SNAPSHOT):
+        """Puntos de la ventana que termina en el instante simulado (búsqueda binaria sobre las fechas)"""
+        ahora = self.tiempo_simulado()
+        desde = np.searchsorted(self.fechas, np.datetime64(ahora - ventana), side='left')
+        hasta = np.searchsorted(self.fechas, np.datetime64(ahora), side='right')
+        return self.df_puntos.iloc[desde:hasta]
+
+    def snapshot(self, cantidad_ordenes, puntos_por_orden):
+        """Últimos puntos de las N órdenes más recientes (misma lógica que la consulta SQL del snapshot)"""
+        df = self.puntos_visibles()
+        df = df[df['ODP'] != '']
+        if df.empty:
+            return df
+        ultima_fecha = df.groupby(['CODIGO', 'ODP'])['FECHAINGRESO'].max().nlargest(cantidad_ordenes)
+        df = df.merge(ultima_fecha.index.to_frame(index=False), on=['CODIGO', 'ODP'])
+        df = df.sort_values('FECHAINGRESO').groupby(['CODIGO', 'ODP'], sort=False).tail(puntos_por_orden)
+        return df.reset_index(drop=True)
+
+    def progreso(self, ordenes):
+        """Progreso de las órdenes en el instante simulado, en el formato de calcular_progreso_lote"""
+        df_ordenes = pd.DataFrame(
+            list(dict.fromkeys((str(c), str(o)) for c, o in ordenes if c and o)), columns=['CODIGO', 'ODP'])
+        df = self.puntos_visibles()
+        df = df[df['ODP'] != ''].merge(df_ordenes, on=['CODIGO', 'ODP'])
+        df_embutido = df.groupby(['CODIGO', 'ODP'], as_index=False).agg(
+            KgEmbutidos=('_kgEmbutidos', 'sum'),
+            PromedioSaucisso=('_PesoSauciso', lambda v: v[np.isfinite(v)].mean()),
+        )
+        df_ordenes = df_ordenes.merge(df_embutido, on=['CODIGO', 'ODP'], how='left')
+        df_ordenes = df_ordenes.merge(self.masas, on=['CODIGO', 'ODP'], how='left')
+        return completar_progreso(df_ordenes)
+
+    def alarmas_activas(self):
+        """Evaluar los puntos reproducidos desde el último cuadro y devolver las alarmas vigentes"""
+        ahora = self.tiempo_simulado()
+        hasta = int(np.searchsorted(self.fechas, np.datetime64(ahora), side='right'))
+        if hasta > self.puntos_evaluados:
+            self.motor_alarmas.procesar(self.df_puntos.iloc[self.puntos_evaluados:hasta], ahora=ahora)
+            self.puntos_evaluados = hasta
+        return self.motor_alarmas.alarmas_activas()
+
+    def registrar_cuadro(self, segundos):
+        """Registrar la duración de un cuadro del dashboard"""
+        self.tiempos_cuadro.append(segundos)
+
+    def resumen_tiempos(self):
+        """Cantidad de cuadros y percentiles de duración en milisegundos"""
+        if not self.tiempos_cuadro:
+            return {'cuadros': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+        tiempos = np.array(self.tiempos_cuadro) * 1000
+        return {
+            'cuadros': len(tiempos),
+            'p50_ms': float(np.percentile(tiempos, 50)),
+            'p95_ms': float(np.percentile(tiempos, 95)),
+            'max_ms': float(tiempos.max()),
+        }
+
+def ejecutar_prueba(sesion, construir_snapshot, cantidad_ordenes, puntos_por_orden, intervalo=1.0, max_cuadros=None):
+    """
+    Prueba de rendimiento determinística: avanza el reloj simulado de a un intervalo
+    de refresco y mide snapshot + separación por orden en cada cuadro hasta el final
+    de la grabación. Devuelve el resumen de tiempos.
+    """
+    cuadros = 0
+    while not sesion.terminado() and (max_cuadros is None or cuadros < max_cuadros):
+        inicio = time.perf_counter()
+        construir_snapshot(sesion.snapshot(cantidad_ordenes, puntos_por_orden))
+        sesion.registrar_cuadro(time.perf_counter() - inicio)
+        sesion.avanzar(intervalo)
+        cuadros += 1
+    return sesion.resumen_tiempos()
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducir una grabación de pesajes contra el snapshot de tiempo real")
+    parser.add_argument("--origen", default="local", help="'local' (almacen de la ingesta) o ruta .csv/.parquet")
+    parser.add_argument("--desde", help="Fecha inicial de la grabación")
+    parser.add_argument("--hasta", help="Fecha final de la grabación")
+    parser.add_argument("--velocidad", type=float, default=VELOCIDAD_MAXIMA, help="Velocidad de reproducción (1-100)")
+    parser.add_argument("--cuadros", type=int, help="Cantidad máxima de cuadros")
+    args = parser.parse_args()
+
+    from dashboard_peso_embuticion import construir_snapshot, MAX_ORDENES_SNAPSHOT, PUNTOS_POR_ORDEN_SNAPSHOT
+    sesion = SesionReplay(
+        cargar_grabacion(args.origen, args.desde, args.hasta),
+        velocidad=args.velocidad, paso_fijo=True
+    )
+    resumen = ejecutar_prueba(sesion, construir_snapshot, MAX_ORDENES_SNAPSHOT, PUNTOS_POR_ORDEN_SNAPSHOT,
+                              max_cuadros=args.cuadros)
+    print(f"Cuadros: {resumen['cuadros']}  p50: {resumen['p50_ms']:.1f} ms  "
+          f"p95: {resumen['p95_ms']:.1f} ms  máx: {resumen['max_ms']:.1f} ms")
+
+if __name__ == "__main__":
+    main()
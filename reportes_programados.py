@@ -0,0 +1,244 @@
+"""
+Reportes programados de peso sauciso (diario / semanal) fuera del servidor interactivo.
+
+Uso:
+    python reportes_programados.py --periodo diario
+    python reportes_programados.py --desde 2025-03-01 --hasta 2025-03-08 --formatos html,parquet
+    python reportes_programados.py --periodo diario --programar 06:15   (queda en ejecución, un reporte por día)
+"""
+import argparse
+import html
+import importlib.util
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from database_connection import consultar_datos_tiempo_real
+from progreso_ordenes import calcular_progreso_lote
+from ingesta_peso import (
+    query_registros_desde, agregar_registros_a_puntos, leer_puntos_locales,
+    cobertura_desde, ultima_fecha_local, normalizar_puntos, fecha_sql
+)
+
+logger = logging.getLogger(__name__)
+
+CARPETA_REPORTES = os.environ.get(
+    "PESO_REPORTES_CARPETA",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reportes")
+)
+FORMATOS_REPORTE = ['html', 'parquet', 'pdf']
+
+def rango_periodo(periodo, fecha_referencia=None):
+    """
+    Rango [inicio, fin) del periodo cerrado anterior a la fecha de referencia:
+    diario = día anterior; semanal = semana lunes-domingo anterior
+    """
+    hoy = pd.Timestamp(fecha_referencia or datetime.now()).normalize()
+    if periodo == 'diario':
+        return hoy - timedelta(days=1), hoy
+    if periodo == 'semanal':
+        lunes = hoy - timedelta(days=hoy.dayofweek)
+        return lunes - timedelta(days=7), lunes
+    raise ValueError(f"Periodo no soportado: {periodo}")
+
+def cargar_puntos_periodo(fecha_inicio, fecha_fin):
+    """
+    Puntos del periodo desde el almacen local si lo cubre completo, si no desde SQL Server.
+    El almacen lo alimenta solo el dashboard (los reportes no sincronizan la ingesta) y cubre
+    el final del periodo si ya tiene pesajes posteriores.
+    Los registros de SQL Server pasan por la misma etapa de calidad que la ingesta.
+    """
+    cobertura, ultima_fecha = cobertura_desde(), ultima_fecha_local()
+    if (cobertura is not None and cobertura <= pd.Timestamp(fecha_inicio)
+            and ultima_fecha is not None and ultima_fecha >= pd.Timestamp(fecha_fin)):
+        return leer_puntos_locales(fecha_inicio, fecha_fin)
+    df, error = consultar_datos_tiempo_real(query_registros_desde(fecha_inicio, fecha_fin, incluir_desde=True))
+    if error:
+        raise ConnectionError(error)
+    # Las observaciones de calidad ya las registra la ingesta para estos mismos registros
+    df = agregar_registros_a_puntos(df, registrar_calidad=False)
+    return normalizar_puntos(df) if not df.empty else pd.DataFrame()
+
+def cargar_masa_inicial(df_puntos, fecha_inicio, fecha_fin):
+    """KgDebenEmbutir por (CODIGO, ODP) de todas las órdenes del periodo con la consulta de progreso por lote"""
+    ordenes = df_puntos[['CODIGO', 'ODP']].drop_duplicates().itertuples(index=False, name=None)
+    df_progreso, error = calcular_progreso_lote(
+        ordenes, f"FECHAINGRESO >= '{fecha_sql(fecha_inicio)}' AND FECHAINGRESO < '{fecha_sql(fecha_fin)}'"
+    )
+    if error:
+        raise ConnectionError(error)
+    return df_progreso.loc[df_progreso['tiene_masa_inicial'], ['CODIGO', 'ODP', 'kg_deben_embutir']].rename(
+        columns={'kg_deben_embutir': 'KgDebenEmbutir'}
+    )
+
+def calcular_kpis_codigo(datos):
+    """
+    KPIs por ODP de un código (se ejecuta en un proceso del pool).
+    datos: (codigo, DataFrame de puntos del código, DataFrame ODP/KgDebenEmbutir del código)
+    """
+    codigo, df_puntos, df_masa = datos
+    df_odp = df_puntos.groupby('ODP', as_index=False).agg(
+        Inicio=('FECHAINGRESO', 'min'),
+        Fin=('FECHAINGRESO', 'max'),
+        KgEmbutidos=('_kgEmbutidos', 'sum'),
+        Saucissos=('TotalEmbalajes', 'sum'),
+        PesoPromedio=('_PesoSauciso', 'mean'),
+        PesoDesviacion=('_PesoSauciso', 'std'),
+        Pesajes=('_PesoSauciso', 'size'),
+    )
+    df_odp = df_odp.merge(df_masa, on='ODP', how='left')
+    df_odp['KgDebenEmbutir'] = df_odp['KgDebenEmbutir'].fillna(0.0)
+    df_odp['PorcentajeProgreso'] = (
+        df_odp['KgEmbutidos'] / df_odp['KgDebenEmbutir'].where(df_odp['KgDebenEmbutir'] > 0) * 100
+    ).fillna(0.0)
+    kg_faltantes = (df_odp['KgDebenEmbutir'] - df_odp['KgEmbutidos']).clip(lower=0)
+    df_odp['SaucissosFaltantes'] = [
+        math.ceil(kg / peso) if peso > 0 and kg > 0 else 0
+        for kg, peso in zip(kg_faltantes, df_odp['PesoPromedio'])
+    ]
+    df_odp.insert(0, 'CODIGO', codigo)
+
+    resumen = {
+        'CODIGO': codigo,
+        'Ordenes': int(df_odp['ODP'].nunique()),
+        'KgEmbutidos': float(df_puntos['_kgEmbutidos'].sum()),
+        'KgDebenEmbutir': float(df_odp['KgDebenEmbutir'].sum()),
+        'Saucissos': float(df_puntos['TotalEmbalajes'].sum()),
+        'PesoPromedio': float(df_puntos['_PesoSauciso'].mean()),
+        'PesoDesviacion': float(df_puntos['_PesoSauciso'].std()) if len(df_puntos) > 1 else 0.0,
+        'Pesajes': int(len(df_puntos)),
+        'SaucissosFaltantes': int(df_odp['SaucissosFaltantes'].sum()),
+    }
+    return df_odp, resumen
+
+def calcular_kpis(df_puntos, df_masa, procesos=None):
+    """KPIs por código y por ODP, repartiendo los códigos en un pool de procesos"""
+    tareas = [
+        (codigo, df_codigo, df_masa.loc[df_masa['CODIGO'] == codigo, ['ODP', 'KgDebenEmbutir']])
+        for codigo, df_codigo in df_puntos.groupby('CODIGO')
+    ]
+    if procesos == 1 or len(tareas) <= 1:
+        resultados = [calcular_kpis_codigo(t) for t in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            resultados = list(pool.map(calcular_kpis_codigo, tareas))
+    df_odp = pd.concat([r[0] for r in resultados], ignore_index=True) if resultados else pd.DataFrame()
+    df_codigo = pd.DataFrame([r[1] for r in resultados])
+    if not df_codigo.empty:
+        df_codigo['PorcentajeProgreso'] = (
+            df_codigo['KgEmbutidos'] / df_codigo['KgDebenEmbutir'].where(df_codigo['KgDebenEmbutir'] > 0) * 100
+        ).fillna(0.0)
+    return df_codigo, df_odp
+
+def _tabla_html(df):
+    return df.to_html(index=False, float_format=lambda v: f"{v:,.2f}", border=0, classes="tabla")
+
+def generar_html(df_codigo, df_odp, fecha_inicio, fecha_fin):
+    titulo = f"Peso sauciso {fecha_inicio:%d/%m/%Y} - {(fecha_fin - timedelta(days=1)):%d/%m/%Y}"
+    return f"""<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>{html.escape(titulo)}</title>
+<style>
+    body {{ font-family: Arial, sans-serif; margin: 20px; }}
+    h1 {{ color: #1f77b4; }}
+    .tabla {{ border-collapse: collapse; font-size: 12px; margin-bottom: 30px; }}
+    .tabla th {{ background: #1f77b4; color: white; padding: 6px; }}
+    .tabla td {{ border-bottom: 1px solid #e0e0e0; padding: 4px 8px; text-align: right; }}
+</style></head><body>
+<h1>{html.escape(titulo)}</h1>
+<p>Generado: {datetime.now():%d/%m/%Y %H:%M}</p>
+<h2>Resumen por código</h2>
+{_tabla_html(df_codigo)}
+<h2>Detalle por orden (ODP)</h2>
+{_tabla_html(df_odp)}
+</body></html>
+"""
+
+def escribir_reporte(df_codigo, df_odp, fecha_inicio, fecha_fin, formatos, carpeta=CARPETA_REPORTES):
+    """Escribir el reporte en los formatos pedidos; devuelve las rutas generadas"""
+    os.makedirs(carpeta, exist_ok=True)
+    base = os.path.join(carpeta, f"peso_sauciso_{fecha_inicio:%Y%m%d}_{(fecha_fin - timedelta(days=1)):%Y%m%d}")
+    rutas = []
+    contenido_html = generar_html(df_codigo, df_odp, fecha_inicio, fecha_fin)
+    if 'html' in formatos:
+        with open(base + ".html", "w", encoding="utf-8") as archivo:
+            archivo.write(contenido_html)
+        rutas.append(base + ".html")
+    if 'parquet' in formatos:
+        if importlib.util.find_spec("pyarrow") is None:
+            logger.warning("pyarrow no está instalado, se omite la salida Parquet")
+        else:
+            df_codigo.to_parquet(base + "_codigos.parquet", index=False)
+            df_odp.to_parquet(base + "_ordenes.parquet", index=False)
+            rutas.extend([base + "_codigos.parquet", base + "_ordenes.parquet"])
+    if 'pdf' in formatos:
+        if importlib.util.find_spec("weasyprint") is None:
+            logger.warning("weasyprint no está instalado, se omite la salida PDF")
+        else:
+            from weasyprint import HTML
+            HTML(string=contenido_html).write_pdf(base + ".pdf")
+            rutas.append(base + ".pdf")
+    return rutas
+
+def generar_reporte(fecha_inicio, fecha_fin, formatos=('html', 'parquet'), procesos=None, carpeta=CARPETA_REPORTES):
+    """Calcular KPIs del periodo y escribir los archivos del reporte"""
+    fecha_inicio, fecha_fin = pd.Timestamp(fecha_inicio), pd.Timestamp(fecha_fin)
+    df_puntos = cargar_puntos_periodo(fecha_inicio, fecha_fin)
+    if df_puntos.empty:
+        logger.warning("Sin pesajes entre %s y %s", fecha_sql(fecha_inicio), fecha_sql(fecha_fin))
+        return []
+    df_masa = cargar_masa_inicial(df_puntos, fecha_inicio, fecha_fin)
+    df_codigo, df_odp = calcular_kpis(df_puntos, df_masa, procesos)
+    return escribir_reporte(df_codigo, df_odp, fecha_inicio, fecha_fin, formatos, carpeta)
+
+def _segundos_hasta(hora_texto):
+    """Segundos hasta la próxima ocurrencia de una hora HH:MM"""
+    ahora = datetime.now()
+    horas, minutos = (int(v) for v in hora_texto.split(":"))
+    proxima = ahora.replace(hour=horas, minute=minutos, second=0, microsecond=0)
+    if proxima <= ahora:
+        proxima += timedelta(days=1)
+    return (proxima - ahora).total_seconds()
+
+def main():
+    parser = argparse.ArgumentParser(description="Reportes programados de peso sauciso")
+    parser.add_argument("--periodo", choices=['diario', 'semanal'], default='diario',
+                        help="Periodo cerrado anterior a hoy (si no se indica --desde/--hasta)")
+    parser.add_argument("--desde", help="Fecha inicial (inclusive)")
+    parser.add_argument("--hasta", help="Fecha final (exclusiva)")
+    parser.add_argument("--formatos", default="html,parquet", help=f"Lista separada por comas de {', '.join(FORMATOS_REPORTE)}")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto, uno por CPU)")
+    parser.add_argument("--carpeta", default=CARPETA_REPORTES, help="Carpeta de salida")
+    parser.add_argument("--programar", metavar="HH:MM", help="Quedar en ejecución y generar el reporte todos los días a esa hora")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    formatos = [f.strip() for f in args.formatos.split(",") if f.strip() in FORMATOS_REPORTE]
+
+    def ejecutar():
+        if args.desde and args.hasta:
+            fecha_inicio, fecha_fin = pd.Timestamp(args.desde), pd.Timestamp(args.hasta)
+        else:
+            fecha_inicio, fecha_fin = rango_periodo(args.periodo)
+        try:
+            for ruta in generar_reporte(fecha_inicio, fecha_fin, formatos, args.procesos, args.carpeta):
+                logger.info("Reporte generado: %s", ruta)
+        except Exception as e:
+            logger.error("Error generando reporte: %s", e)
+
+    if not args.programar:
+        ejecutar()
+        return
+    while True:
+        time.sleep(_segundos_hasta(args.programar))
+        # El reporte semanal solo se genera al empezar la semana
+        if args.periodo == 'semanal' and not (args.desde and args.hasta) and datetime.now().weekday() != 0:
+            continue
+        ejecutar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema
+from ingesta_peso import registrar_consumidor, leer_puntos_locales, fecha_local, FORMATO_FECHA_LOCAL
+
+# Granularidades disponibles de la más fina a la más gruesa
+GRANULARIDADES = {
+    'hora': {'tabla': 'rollup_hora', 'frecuencia': 'h', 'duracion': timedelta(hours=1)},
+    'dia': {'tabla': 'rollup_dia', 'frecuencia': 'D', 'duracion': timedelta(days=1)},
+}
+# Cantidad de puntos que se busca mostrar en el grafico como maximo
+PUNTOS_OBJETIVO = 200
+
+ESQUEMA_ROLLUPS = "".join(f"""
+CREATE TABLE IF NOT EXISTS {config['tabla']} (
+    CODIGO TEXT NOT NULL,
+    ODP TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    kg_embutidos REAL NOT NULL,
+    total_embalajes REAL NOT NULL,
+    cantidad INTEGER NOT NULL,
+    peso_min REAL NOT NULL,
+    peso_max REAL NOT NULL,
+    peso_suma REAL NOT NULL,
+    PRIMARY KEY (CODIGO, ODP, periodo)
+);
+CREATE INDEX IF NOT EXISTS ix_{config['tabla']}_periodo ON {config['tabla']} (periodo);
+""" for config in GRANULARIDADES.values())
+
+def _agregar_por_periodo(df_puntos, frecuencia):
+    """Agregar puntos a (CODIGO, ODP, periodo) en pandas"""
+    df = df_puntos.assign(periodo=df_puntos['FECHAINGRESO'].dt.floor(frecuencia))
+    return df.groupby(['CODIGO', 'ODP', 'periodo'], as_index=False).agg(
+        kg_embutidos=('_kgEmbutidos', 'sum'),
+        total_embalajes=('TotalEmbalajes', 'sum'),
+        cantidad=('_PesoSauciso', 'size'),
+        peso_min=('_PesoSauciso', 'min'),
+        peso_max=('_PesoSauciso', 'max'),
+        peso_suma=('_PesoSauciso', 'sum'),
+    )
+
+def _recalcular_periodos(conn, tabla, frecuencia, duracion, df_periodos):
+    """Recalcular desde los puntos locales (ya actualizados en conn) los periodos afectados por puntos modificados"""
+    for codigo, odp, periodo in df_periodos[['CODIGO', 'ODP', 'periodo']].drop_duplicates().itertuples(index=False, name=None):
+        df_puntos = leer_puntos_locales(periodo, periodo + duracion, codigo, odp, conn=conn)
+        conn.execute(f"DELETE FROM {tabla} WHERE CODIGO = ? AND ODP = ? AND periodo = ?",
+                     (codigo, odp, fecha_local(periodo)))
+        if not df_puntos.empty:
+            _upsert(conn, tabla, _agregar_por_periodo(df_puntos, frecuencia))
+
+def _upsert(conn, tabla, df_agregado):
+    """Sumar agregados nuevos a los existentes (min/max combinados)"""
+    conn.executemany(f"""
+        INSERT INTO {tabla} (CODIGO, ODP, periodo, kg_embutidos, total_embalajes, cantidad, peso_min, peso_max, peso_suma)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(CODIGO, ODP, periodo) DO UPDATE SET
+            kg_embutidos = kg_embutidos + excluded.kg_embutidos,
+            total_embalajes = total_embalajes + excluded.total_embalajes,
+            cantidad = cantidad + excluded.cantidad,
+            peso_min = MIN(peso_min, excluded.peso_min),
+            peso_max = MAX(peso_max, excluded.peso_max),
+            peso_suma = peso_suma + excluded.peso_suma
+    """, [
+        (c, o, p.strftime(FORMATO_FECHA_LOCAL), float(kg), float(emb), int(n), float(pmin), float(pmax), float(psum))
+        for c, o, p, kg, emb, n, pmin, pmax, psum in df_agregado.itertuples(index=False, name=None)
+    ])
+
+def asegurar_rollups():
+    """Crear las tablas de rollups (antes de la transacción de la ingesta)"""
+    asegurar_esquema("rollups", ESQUEMA_ROLLUPS)
+
+def actualizar_rollups(df_nuevos, df_reemplazados, conn):
+    """Consumidor de ingesta: mantener rollups por hora y por día de forma incremental (en la transacción de conn)"""
+    for config in GRANULARIDADES.values():
+        frecuencia, tabla = config['frecuencia'], config['tabla']
+        if df_reemplazados is not None and not df_reemplazados.empty:
+            # Puntos modificados: recalcular sus periodos completos (min/max no se pueden restar)
+            df_afectados = df_reemplazados.assign(periodo=df_reemplazados['FECHAINGRESO'].dt.floor(frecuencia))
+            clave_afectada = df_afectados[['CODIGO', 'ODP', 'periodo']].drop_duplicates()
+            _recalcular_periodos(conn, tabla, frecuencia, config['duracion'], clave_afectada)
+            df_periodo = df_nuevos.assign(periodo=df_nuevos['FECHAINGRESO'].dt.floor(frecuencia))
+            df_periodo = df_periodo.merge(clave_afectada, on=['CODIGO', 'ODP', 'periodo'], how='left', indicator=True)
+            df_incremental = df_periodo.loc[df_periodo['_merge'] == 'left_only', df_nuevos.columns]
+        else:
+            df_incremental = df_nuevos
+        if not df_incremental.empty:
+            _upsert(conn, tabla, _agregar_por_periodo(df_incremental, frecuencia))
+
+registrar_consumidor("rollups", actualizar_rollups, transaccional=True, preparar=asegurar_rollups)
+
+def elegir_granularidad(fecha_inicio, fecha_fin):
+    """
+    Elegir el rollup más grueso cuyo periodo no supera la resolución del rango pedido.
+    Devuelve 'dia', 'hora' o None (usar datos crudos).
+    """
+    resolucion = (pd.Timestamp(fecha_fin) - pd.Timestamp(fecha_inicio)) / PUNTOS_OBJETIVO
+    elegida = None
+    for nombre, config in GRANULARIDADES.items():
+        if config['duracion'] <= resolucion:
+            elegida = nombre
+    return elegida
+
+def consultar_rollup(fecha_inicio, fecha_fin, codigo=None, odp=None, granularidad=None, incluir_odp=False):
+    """
+    Serie de peso sauciso desde los rollups locales con las mismas columnas que
+    la consulta SQL del dashboard (FECHAINGRESO = inicio del periodo).
+    """
+    granularidad = granularidad or elegir_granularidad(fecha_inicio, fecha_fin)
+    if granularidad is None:
+        return None
+    asegurar_esquema("rollups", ESQUEMA_ROLLUPS)
+    tabla = GRANULARIDADES[granularidad]['tabla']
+    columnas_grupo = "CODIGO, ODP" if incluir_odp else "CODIGO"
+
+    condiciones = ["periodo >= ?", "periodo < ?"]
+    parametros = [fecha_local(fecha_inicio), fecha_local(fecha_fin)]
+    if codigo is not None:
+        condiciones.append("CODIGO = ?")
+        parametros.append(str(codigo))
+    if odp is not None:
+        condiciones.append("ODP = ?")
+        parametros.append(str(odp))
+
+    conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(f"""
+            SELECT periodo as FECHAINGRESO,
+                   {columnas_grupo},
+                   SUM(kg_embutidos) as _kgEmbutidos,
+                   SUM(total_embalajes) as TotalEmbalajes,
+                   SUM(peso_suma) / SUM(cantidad) as _PesoSauciso,
+                   MIN(peso_min) as _PesoMin,
+                   MAX(peso_max) as _PesoMax,
+                   SUM(cantidad) as Registros
+            FROM {tabla}
+            WHERE {' AND '.join(condiciones)}
+            GROUP BY periodo, {columnas_grupo}
+            ORDER BY periodo ASC
+        """, conn, params=parametros)
+    finally:
+        conn.close()
+    df['FECHAINGRESO'] = pd.to_datetime(df['FECHAINGRESO'])
+    df.attrs['granularidad'] = granularidad
+    return df
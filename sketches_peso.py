@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema, leer_marca, guardar_marca, cargar_claves_temporales
+from ingesta_peso import registrar_consumidor, leer_puntos_locales, fecha_local, FORMATO_FECHA_LOCAL
+
+# Compresión del t-digest: más alta = más centroides y cuantiles más precisos
+COMPRESION_SKETCH = 200
+# Versión del formato guardado; si cambia se reconstruyen los sketches desde los puntos locales
+VERSION_SKETCHES = "1"
+
+ESQUEMA_SKETCHES = """
+CREATE TABLE IF NOT EXISTS rollup_sketch_dia (
+    CODIGO TEXT NOT NULL,
+    ODP TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    cantidad INTEGER NOT NULL,
+    peso_min REAL NOT NULL,
+    peso_max REAL NOT NULL,
+    centroides BLOB NOT NULL,
+    PRIMARY KEY (CODIGO, ODP, periodo)
+);
+CREATE INDEX IF NOT EXISTS ix_rollup_sketch_dia_periodo ON rollup_sketch_dia (periodo);
+"""
+
+CLAVES_SKETCH = ['CODIGO', 'ODP', 'periodo']
+
+def _comprimir(df, claves):
+    """
+    Comprimir centroides (media, peso) por grupo con la escala k1 del t-digest:
+    cada centroide junta los valores de un tramo de ancho 1 en k(q), así las colas
+    quedan con centroides chicos (cuantiles extremos precisos) y el centro con grandes
+    """
+    df = df.sort_values(claves + ['media'])
+    grupos = df.groupby(claves, sort=False)['peso']
+    total = grupos.transform('sum')
+    q = ((grupos.cumsum() - df['peso'] / 2) / total).clip(0, 1)
+    k = np.floor(COMPRESION_SKETCH / (2 * np.pi) * np.arcsin(2 * q - 1))
+    df = df.assign(_k=k, _suma=df['media'] * df['peso'])
+    df_centroides = df.groupby(claves + ['_k'], as_index=False).agg(peso=('peso', 'sum'), _suma=('_suma', 'sum'))
+    df_centroides['media'] = df_centroides['_suma'] / df_centroides['peso']
+    return df_centroides.sort_values(claves + ['media'])[claves + ['media', 'peso']]
+
+def _a_bytes(df_centroides):
+    return np.column_stack([df_centroides['media'], df_centroides['peso']]).astype('<f8').tobytes()
+
+def _desde_bytes(blob):
+    valores = np.frombuffer(blob, dtype='<f8').reshape(-1, 2)
+    return valores[:, 0], valores[:, 1]
+
+
+class SketchPeso:
+    """
+    Distribución aproximada de peso sauciso (t-digest) resultante de fusionar
+    sketches diarios: cuantiles e histograma sin leer los pesajes
+    """
+
+    def __init__(self, medias, pesos, minimo, maximo):
+        self.medias = np.asarray(medias, dtype=float)
+        self.pesos = np.asarray(pesos, dtype=float)
+        self.minimo = float(minimo)
+        self.maximo = float(maximo)
+        self.cantidad = float(self.pesos.sum())
+
+    def _curva_acumulada(self):
+        """Puntos (valor, pesajes acumulados) con cada centroide en el centro de su peso"""
+        centros = np.cumsum(self.pesos) - self.pesos / 2
+        valores = np.concatenate([[self.minimo], self.medias, [self.maximo]])
+        acumulados = np.concatenate([[0.0], centros, [self.cantidad]])
+        return valores, acumulados
+
+    def cuantiles(self, qs):
+        """Cuantiles (0..1) por interpolación entre centroides"""
+        valores, acumulados = self._curva_acumulada()
+        return np.interp(np.asarray(qs, dtype=float) * self.cantidad, acumulados, valores)
+
+    def histograma(self, intervalos=30):
+        """Cantidad aproximada de pesajes por intervalo: (bordes, cantidades)"""
+        valores, acumulados = self._curva_acumulada()
+        bordes = np.linspace(self.minimo, self.maximo, intervalos + 1)
+        return bordes, np.diff(np.interp(bordes, valores, acumulados))
+
+
+def _sketches_de_puntos(df_puntos, df_existentes=None):
+    """
+    Sketches por (CODIGO, ODP, día) de puntos nuevos, fusionados con los sketches
+    existentes de esos días si se pasan (filas de rollup_sketch_dia)
+    """
+    df = df_puntos.assign(periodo=df_puntos['FECHAINGRESO'].dt.floor('D'))
+    df_valores = df[CLAVES_SKETCH].assign(media=df['_PesoSauciso'].astype(float), peso=1.0)
+    df_limites = df.groupby(CLAVES_SKETCH, as_index=False).agg(
+        peso_min=('_PesoSauciso', 'min'), peso_max=('_PesoSauciso', 'max')
+    )
+    if df_existentes is not None and not df_existentes.empty:
+        partes = [df_valores]
+        for codigo, odp, periodo, _, _, _, blob in df_existentes.itertuples(index=False, name=None):
+            medias, pesos = _desde_bytes(blob)
+            partes.append(pd.DataFrame({'CODIGO': codigo, 'ODP': odp, 'periodo': periodo, 'media': medias, 'peso': pesos}))
+        df_valores = pd.concat(partes, ignore_index=True)
+        df_limites = pd.concat([df_limites, df_existentes[CLAVES_SKETCH + ['peso_min', 'peso_max']]]).groupby(
+            CLAVES_SKETCH, as_index=False
+        ).agg(peso_min=('peso_min', 'min'), peso_max=('peso_max', 'max'))
+
+    df_centroides = _comprimir(df_valores, CLAVES_SKETCH)
+    filas = []
+    limites = df_limites.set_index(CLAVES_SKETCH)
+    for clave, df_grupo in df_centroides.groupby(CLAVES_SKETCH, sort=False):
+        filas.append((*clave, int(round(df_grupo['peso'].sum())),
+                      float(limites.at[clave, 'peso_min']), float(limites.at[clave, 'peso_max']), _a_bytes(df_grupo)))
+    return filas
+
+def _guardar(conn, filas):
+    conn.executemany(
+        "INSERT OR REPLACE INTO rollup_sketch_dia (CODIGO, ODP, periodo, cantidad, peso_min, peso_max, centroides) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(c, o, p.strftime(FORMATO_FECHA_LOCAL), n, pmin, pmax, blob) for c, o, p, n, pmin, pmax, blob in filas]
+    )
+
+def _leer_existentes(conn, claves):
+    """Sketches guardados de las claves (CODIGO, ODP, periodo) indicadas, con un solo JOIN"""
+    cargar_claves_temporales(conn, "sketches_afectados", CLAVES_SKETCH, [
+        (codigo, odp, fecha_local(periodo)) for codigo, odp, periodo in claves
+    ])
+    filas = conn.execute("""
+        SELECT r.CODIGO, r.ODP, r.periodo, r.cantidad, r.peso_min, r.peso_max, r.centroides
+        FROM rollup_sketch_dia r
+        INNER JOIN temp.sketches_afectados k ON r.CODIGO = k.CODIGO AND r.ODP = k.ODP AND r.periodo = k.periodo
+    """).fetchall()
+    return pd.DataFrame(
+        [(c, o, pd.Timestamp(p), n, pmin, pmax, blob) for c, o, p, n, pmin, pmax, blob in filas],
+        columns=CLAVES_SKETCH + ['cantidad', 'peso_min', 'peso_max', 'centroides']
+    )
+
+def asegurar_sketches():
+    """Construir los sketches desde los puntos locales la primera vez (o si cambió su formato)"""
+    asegurar_esquema("sketches", ESQUEMA_SKETCHES)
+    if leer_marca("sketches_version") == VERSION_SKETCHES:
+        return
+    df_puntos = leer_puntos_locales()
+    conn = conectar_almacen_local()
+    try:
+        conn.execute("DELETE FROM rollup_sketch_dia")
+        if not df_puntos.empty:
+            _guardar(conn, _sketches_de_puntos(df_puntos))
+        guardar_marca("sketches_version", VERSION_SKETCHES, conn=conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def actualizar_sketches(df_nuevos, df_reemplazados, conn):
+    """
+    Consumidor de ingesta: fusionar puntos nuevos en el sketch de su día; recalcular días con
+    puntos modificados (en la transacción de conn; asegurar_sketches ya construyó los anteriores)
+    """
+    df_incremental = df_nuevos
+    if df_reemplazados is not None and not df_reemplazados.empty:
+        # Los centroides no se pueden restar: recalcular los días afectados completos
+        df_afectados = df_reemplazados.assign(periodo=df_reemplazados['FECHAINGRESO'].dt.floor('D'))
+        claves_afectadas = df_afectados[CLAVES_SKETCH].drop_duplicates()
+        for codigo, odp, periodo in claves_afectadas.itertuples(index=False, name=None):
+            df_puntos = leer_puntos_locales(periodo, periodo + pd.Timedelta(days=1), codigo, odp, conn=conn)
+            conn.execute("DELETE FROM rollup_sketch_dia WHERE CODIGO = ? AND ODP = ? AND periodo = ?",
+                         (codigo, odp, fecha_local(periodo)))
+            if not df_puntos.empty:
+                _guardar(conn, _sketches_de_puntos(df_puntos))
+        df_periodo = df_nuevos.assign(periodo=df_nuevos['FECHAINGRESO'].dt.floor('D'))
+        df_periodo = df_periodo.merge(claves_afectadas, on=CLAVES_SKETCH, how='left', indicator=True)
+        df_incremental = df_periodo.loc[df_periodo['_merge'] == 'left_only', df_nuevos.columns]
+    if not df_incremental.empty:
+        claves = df_incremental.assign(periodo=df_incremental['FECHAINGRESO'].dt.floor('D'))[CLAVES_SKETCH].drop_duplicates()
+        df_existentes = _leer_existentes(conn, claves.itertuples(index=False, name=None))
+        _guardar(conn, _sketches_de_puntos(df_incremental, df_existentes))
+
+registrar_consumidor("sketches", actualizar_sketches, transaccional=True, preparar=asegurar_sketches)
+
+def consultar_distribucion(rangos=None, codigo=None, odp=None):
+    """
+    Fusionar los sketches diarios de los rangos [inicio, fin) indicados (None = toda
+    la historia local) en un SketchPeso. Los rangos se toman por días completos.
+    Devuelve None si no hay pesajes.
+    """
+    asegurar_sketches()
+    condiciones, parametros = [], []
+    if rangos is not None:
+        if not rangos:
+            return None
+        condiciones.append("(" + " OR ".join("(periodo >= ? AND periodo < ?)" for _ in rangos) + ")")
+        for inicio, fin in rangos:
+            parametros.extend([fecha_local(pd.Timestamp(inicio).floor('D')), fecha_local(fin)])
+    if codigo is not None:
+        condiciones.append("CODIGO = ?")
+        parametros.append(str(codigo))
+    if odp is not None:
+        condiciones.append("ODP = ?")
+        parametros.append(str(odp))
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    conn = conectar_almacen_local()
+    try:
+        filas = conn.execute(
+            f"SELECT peso_min, peso_max, centroides FROM rollup_sketch_dia {where}", parametros
+        ).fetchall()
+    finally:
+        conn.close()
+    if not filas:
+        return None
+    medias, pesos = zip(*(_desde_bytes(blob) for _, _, blob in filas))
+    df_valores = pd.DataFrame({'grupo': 0, 'media': np.concatenate(medias), 'peso': np.concatenate(pesos)})
+    df_centroides = _comprimir(df_valores, ['grupo'])
+    return SketchPeso(
+        df_centroides['media'].to_numpy(), df_centroides['peso'].to_numpy(),
+        min(f[0] for f in filas), max(f[1] for f in filas)
+    )
@@ -0,0 +1,108 @@
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+
+from calendario import PRIMER_DIA_SEMANA_SQL
+from ingesta_peso import leer_puntos_locales
+from progreso_ordenes import calcular_progreso_lote
+from pronostico_embuticion import pronosticar_fin_orden
+
+# Mismo periodo que usa la vista de tiempo real para el progreso de cada orden
+WHERE_PROGRESO_TABLERO = "FECHAINGRESO >= DATEADD(week, -2, GETDATE())"
+
+COLUMNAS_TABLERO = [
+    'CODIGO', 'ODP', 'Inicio', 'UltimoPesaje', 'Pesajes', 'KgEmbutidos', 'KgDebenEmbutir',
+    'Porcentaje', 'SaucissosFaltantes', 'KgPorMinuto', 'FinEstimado', 'MinutosRestantes'
+]
+
+def inicio_periodo(periodo, ahora=None):
+    """Inicio del día o de la semana actual (la semana empieza en el mismo día que DATEPART(week))"""
+    hoy = pd.Timestamp(ahora or datetime.now()).normalize()
+    if periodo == 'semana':
+        return hoy - timedelta(days=(hoy.dayofweek - (PRIMER_DIA_SEMANA_SQL - 1)) % 7)
+    return hoy
+
+
+class TableroOrdenes:
+    """
+    Tablero de todas las órdenes con actividad de embutición en el periodo.
+
+    La actividad sale del almacen local de la ingesta (sin consultas a SQL Server)
+    y el progreso se consulta por lote solo para las órdenes que tuvieron pesajes
+    nuevos desde la actualización anterior; el resto se reutiliza.
+    """
+
+    def __init__(self):
+        self.progreso = {}  # (CODIGO, ODP) -> fila de calcular_progreso_lote
+        self.firmas = {}    # (CODIGO, ODP) -> (último pesaje, cantidad de pesajes)
+        self.lock = threading.Lock()
+
+    def actualizar(self, fecha_inicio, where_progreso=WHERE_PROGRESO_TABLERO):
+        """Devuelve (DataFrame del tablero, error)"""
+        df_puntos = leer_puntos_locales(fecha_inicio)
+        df_puntos = df_puntos[df_puntos['ODP'] != '']
+        if df_puntos.empty:
+            return pd.DataFrame(columns=COLUMNAS_TABLERO), None
+
+        df_actividad = df_puntos.groupby(['CODIGO', 'ODP']).agg(
+            Inicio=('FECHAINGRESO', 'min'),
+            UltimoPesaje=('FECHAINGRESO', 'max'),
+            Pesajes=('FECHAINGRESO', 'size'),
+        )
+        with self.lock:
+            cambiadas = [
+                clave for clave, fila in df_actividad.iterrows()
+                if self.firmas.get(clave) != (fila['UltimoPesaje'], fila['Pesajes'])
+            ]
+            if cambiadas:
+                # Sin caché: dos cambios de la misma orden dentro del mismo ttl devolverían
+                # el progreso anterior y la firma quedaría actualizada igual
+                df_progreso, error = calcular_progreso_lote(cambiadas, where_progreso, tiempo_real=True)
+                if error:
+                    return None, error
+                for fila in df_progreso.to_dict('records'):
+                    self.progreso[(fila['CODIGO'], fila['ODP'])] = fila
+                for clave in cambiadas:
+                    self.firmas[clave] = (df_actividad.at[clave, 'UltimoPesaje'], df_actividad.at[clave, 'Pesajes'])
+            # Olvidar órdenes que salieron del periodo
+            for clave in set(self.firmas) - set(df_actividad.index):
+                self.firmas.pop(clave, None)
+                self.progreso.pop(clave, None)
+            progreso = {clave: self.progreso.get(clave) for clave in df_actividad.index}
+
+        series = dict(tuple(df_puntos.groupby(['CODIGO', 'ODP'])))
+        filas = []
+        for (codigo, odp), actividad in df_actividad.iterrows():
+            fila_progreso = progreso.get((codigo, odp)) or {}
+            datos_progreso = {
+                'kg_deben_embutir': fila_progreso.get('kg_deben_embutir', 0.0),
+                'kg_embutidos': fila_progreso.get('kg_embutidos', 0.0),
+            }
+            pronostico = pronosticar_fin_orden(odp, series[(codigo, odp)], datos_progreso) if datos_progreso['kg_deben_embutir'] > 0 else None
+            filas.append({
+                'CODIGO': codigo,
+                'ODP': odp,
+                'Inicio': actividad['Inicio'],
+                'UltimoPesaje': actividad['UltimoPesaje'],
+                'Pesajes': int(actividad['Pesajes']),
+                'KgEmbutidos': datos_progreso['kg_embutidos'],
+                'KgDebenEmbutir': datos_progreso['kg_deben_embutir'],
+                'Porcentaje': fila_progreso.get('porcentaje', 0.0),
+                'SaucissosFaltantes': fila_progreso.get('saucissos_faltantes', 0),
+                'KgPorMinuto': pronostico['kg_por_minuto'] if pronostico else None,
+                'FinEstimado': pronostico['fecha_fin'] if pronostico else None,
+                'MinutosRestantes': pronostico['minutos_restantes'] if pronostico else None,
+            })
+        df_tablero = pd.DataFrame(filas, columns=COLUMNAS_TABLERO)
+        df_tablero['FinEstimado'] = pd.to_datetime(df_tablero['FinEstimado'])
+        # Más avanzadas primero; a igual avance, la que termina antes
+        df_tablero = df_tablero.sort_values(['Porcentaje', 'FinEstimado'], ascending=[False, True], na_position='last')
+        return df_tablero.reset_index(drop=True), None
+
+
+@st.cache_resource
+def obtener_tablero_ordenes():
+    """Tablero único por proceso (compartido entre sesiones)"""
+    return TableroOrdenes()
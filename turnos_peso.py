@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from almacen_local import conectar_almacen_local, asegurar_esquema, leer_marca, guardar_marca
+from ingesta_peso import registrar_consumidor, leer_puntos_locales, SOLAPE_MINUTOS
+from calendario import construir_calendario
+
+# Turnos por defecto (hora de inicio y fin, el turno noche cruza la medianoche)
+TURNOS_POR_DEFECTO = [
+    {"nombre": "Mañana", "inicio": "06:00", "fin": "14:00"},
+    {"nombre": "Tarde", "inicio": "14:00", "fin": "22:00"},
+    {"nombre": "Noche", "inicio": "22:00", "fin": "06:00"},
+]
+
+ESQUEMA_TURNOS = """
+CREATE TABLE IF NOT EXISTS turnos_peso (
+    fecha_turno TEXT NOT NULL,
+    turno TEXT NOT NULL,
+    CODIGO TEXT NOT NULL,
+    kg_embutidos REAL NOT NULL,
+    total_embalajes REAL NOT NULL,
+    cantidad INTEGER NOT NULL,
+    peso_suma REAL NOT NULL,
+    PRIMARY KEY (fecha_turno, turno, CODIGO)
+);
+"""
+
+MINUTOS_DIA = 24 * 60
+
+def _minuto(hora_texto):
+    horas, minutos = hora_texto.split(":")
+    return (int(horas) * 60 + int(minutos)) % MINUTOS_DIA
+
+class CalendarioTurnos:
+    """
+    Calendario de turnos configurable. Se precalcula un mapa de los 1440 minutos del
+    dia a (turno, pertenece al turno iniciado el dia anterior) para asignar turnos
+    a una serie completa con indexación de arrays.
+    """
+
+    def __init__(self, turnos):
+        if not turnos:
+            raise ValueError("El calendario de turnos está vacío")
+        self.turnos = [dict(t) for t in turnos]
+        self.nombres = [t["nombre"] for t in self.turnos]
+        self.indice_turno = np.full(MINUTOS_DIA, -1, dtype=np.int16)
+        self.dia_anterior = np.zeros(MINUTOS_DIA, dtype=bool)
+        for i, turno in enumerate(self.turnos):
+            inicio, fin = _minuto(turno["inicio"]), _minuto(turno["fin"])
+            duracion = (fin - inicio) % MINUTOS_DIA or MINUTOS_DIA
+            minutos = (inicio + np.arange(duracion)) % MINUTOS_DIA
+            if (self.indice_turno[minutos] >= 0).any():
+                raise ValueError(f"El turno {turno['nombre']} se superpone con otro turno")
+            self.indice_turno[minutos] = i
+            # Minutos después de la medianoche de un turno que empezó el dia anterior
+            self.dia_anterior[minutos] = minutos < inicio
+        self.firma = hashlib.sha1(json.dumps(self.turnos, sort_keys=True).encode()).hexdigest()
+
+    def asignar(self, fechas):
+        """
+        Asignar turno a una serie de fechas. Devuelve DataFrame con fecha_turno
+        (dia en que empezó el turno) y turno (None fuera de los turnos configurados).
+        """
+        fechas = pd.to_datetime(pd.Series(fechas)).reset_index(drop=True)
+        minutos = (fechas.dt.hour * 60 + fechas.dt.minute).to_numpy()
+        indices = self.indice_turno[minutos]
+        fecha_turno = fechas.dt.normalize() - pd.to_timedelta(self.dia_anterior[minutos].astype(int), unit='D')
+        turnos = np.array(self.nombres + [None], dtype=object)[indices]
+        return pd.DataFrame({'fecha_turno': fecha_turno, 'turno': turnos})
+
+    def limites(self, fecha_turno, turno):
+        """Inicio y fin (datetime) de un turno de una fecha"""
+        config = self.turnos[self.nombres.index(turno)]
+        inicio = pd.Timestamp(fecha_turno).normalize() + timedelta(minutes=_minuto(config["inicio"]))
+        duracion = (_minuto(config["fin"]) - _minuto(config["inicio"])) % MINUTOS_DIA or MINUTOS_DIA
+        return inicio, inicio + timedelta(minutes=duracion)
+
+    def turno_de(self, fecha):
+        """(fecha_turno, turno) de un instante"""
+        fila = self.asignar([fecha]).iloc[0]
+        return fila['fecha_turno'], fila['turno']
+
+def cargar_calendario_turnos():
+    """
+    Turnos desde PESO_TURNOS (JSON) o PESO_TURNOS_ARCHIVO (ruta a un JSON), con el
+    formato [{"nombre": "Mañana", "inicio": "06:00", "fin": "14:00"}, ...]
+    """
+    texto = os.environ.get("PESO_TURNOS")
+    ruta = os.environ.get("PESO_TURNOS_ARCHIVO")
+    if not texto and ruta and os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as archivo:
+            texto = archivo.read()
+    return CalendarioTurnos(json.loads(texto) if texto else TURNOS_POR_DEFECTO)
+
+CALENDARIO_TURNOS = cargar_calendario_turnos()
+
+# Reportes de turnos cerrados ya calculados: {(fecha_turno, turno): DataFrame}
+_reportes_cerrados = {}
+_lock_reportes = threading.Lock()
+
+def _agregar_por_turno(df_puntos, signo=1):
+    """Agregar puntos a (fecha_turno, turno, CODIGO); signo -1 para retirar puntos reemplazados"""
+    df = pd.concat([
+        df_puntos.reset_index(drop=True),
+        CALENDARIO_TURNOS.asignar(df_puntos['FECHAINGRESO'])
+    ], axis=1).dropna(subset=['turno'])
+    df_agregado = df.groupby(['fecha_turno', 'turno', 'CODIGO'], as_index=False).agg(
+        kg_embutidos=('_kgEmbutidos', 'sum'),
+        total_embalajes=('TotalEmbalajes', 'sum'),
+        cantidad=('_PesoSauciso', 'size'),
+        peso_suma=('_PesoSauciso', 'sum'),
+    )
+    columnas = ['kg_embutidos', 'total_embalajes', 'cantidad', 'peso_suma']
+    df_agregado[columnas] = df_agregado[columnas] * signo
+    return df_agregado
+
+def _upsert_turnos(conn, df_agregado):
+    """Sumar deltas por turno y borrar los turnos/códigos que quedan sin pesajes"""
+    conn.executemany("""
+        INSERT INTO turnos_peso (fecha_turno, turno, CODIGO, kg_embutidos, total_embalajes, cantidad, peso_suma)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(fecha_turno, turno, CODIGO) DO UPDATE SET
+            kg_embutidos = kg_embutidos + excluded.kg_embutidos,
+            total_embalajes = total_embalajes + excluded.total_embalajes,
+            cantidad = cantidad + excluded.cantidad,
+            peso_suma = peso_suma + excluded.peso_suma
+    """, [
+        (f.strftime('%Y-%m-%d'), t, c, float(kg), float(emb), int(n), float(psum))
+        for f, t, c, kg, emb, n, psum in df_agregado.itertuples(index=False, name=None)
+    ])
+    conn.execute("DELETE FROM turnos_peso WHERE cantidad <= 0")
+
+def _delta_turnos(df_nuevos, df_reemplazados):
+    """Deltas por (fecha_turno, turno, CODIGO) de los puntos nuevos menos los reemplazados (o None)"""
+    partes = [_agregar_por_turno(df_nuevos)] if not df_nuevos.empty else []
+    if df_reemplazados is not None and not df_reemplazados.empty:
+        partes.append(_agregar_por_turno(df_reemplazados, signo=-1))
+    if not partes:
+        return None
+    return pd.concat(partes).groupby(['fecha_turno', 'turno', 'CODIGO'], as_index=False).sum()
+
+def actualizar_turnos(df_nuevos, df_reemplazados, conn):
+    """Consumidor de ingesta: sumar puntos nuevos a su turno y restar los valores reemplazados (en la transacción de conn)"""
+    df_delta = _delta_turnos(df_nuevos, df_reemplazados)
+    if df_delta is not None:
+        _upsert_turnos(conn, df_delta)
+
+def descartar_reportes_turnos(df_nuevos, df_reemplazados):
+    """Consumidor de ingesta (después del commit): pesajes tardíos en turnos ya cerrados descartan su reporte calculado"""
+    df_delta = _delta_turnos(df_nuevos, df_reemplazados)
+    if df_delta is None:
+        return
+    with _lock_reportes:
+        for clave in df_delta[['fecha_turno', 'turno']].drop_duplicates().itertuples(index=False, name=None):
+            _reportes_cerrados.pop((pd.Timestamp(clave[0]), clave[1]), None)
+
+def asegurar_turnos():
+    """
+    Reconstruir los agregados por turno desde los puntos locales si cambió la
+    configuración de turnos (los agregados guardados quedarían con otros límites)
+    """
+    asegurar_esquema("turnos", ESQUEMA_TURNOS)
+    if leer_marca("turnos_firma") == CALENDARIO_TURNOS.firma:
+        return
+    df_puntos = leer_puntos_locales()
+    conn = conectar_almacen_local()
+    try:
+        conn.execute("DELETE FROM turnos_peso")
+        if not df_puntos.empty:
+            _upsert_turnos(conn, _agregar_por_turno(df_puntos))
+        guardar_marca("turnos_firma", CALENDARIO_TURNOS.firma, conn=conn)
+        conn.commit()
+    finally:
+        conn.close()
+    with _lock_reportes:
+        _reportes_cerrados.clear()
+
+registrar_consumidor("turnos", actualizar_turnos, transaccional=True, preparar=asegurar_turnos)
+registrar_consumidor("turnos_reportes", descartar_reportes_turnos)
+
+def turno_cerrado(fecha_turno, turno, ahora=None):
+    """Un turno se considera cerrado pasado su fin más el solape de ingesta para pesajes tardíos"""
+    _, fin = CALENDARIO_TURNOS.limites(fecha_turno, turno)
+    return (ahora or datetime.now()) >= fin + timedelta(minutes=SOLAPE_MINUTOS)
+
+def consultar_turnos(fecha_inicio, fecha_fin, codigo=None):
+    """
+    Agregados por turno y código para fechas de turno en [fecha_inicio, fecha_fin):
+    Fecha, Dia, Turno, CODIGO, KgEmbutidos, Saucissos, PesoPromedio, Pesajes
+    """
+    asegurar_turnos()
+    condiciones = ["fecha_turno >= ?", "fecha_turno < ?"]
+    parametros = [pd.Timestamp(fecha_inicio).strftime('%Y-%m-%d'), pd.Timestamp(fecha_fin).strftime('%Y-%m-%d')]
+    if codigo is not None:
+        condiciones.append("CODIGO = ?")
+        parametros.append(str(codigo))
+    conn = conectar_almacen_local()
+    try:
+        df = pd.read_sql_query(f"""
+            SELECT fecha_turno, turno, CODIGO, kg_embutidos, total_embalajes, cantidad, peso_suma
+            FROM turnos_peso
+            WHERE {' AND '.join(condiciones)}
+            ORDER BY fecha_turno, turno, CODIGO
+        """, conn, params=parametros)
+    finally:
+        conn.close()
+    return _formatear_reporte(df)
+
+def _formatear_reporte(df):
+    """Columnas del reporte de turnos a partir de las sumas guardadas"""
+    df = df.assign(fecha_turno=pd.to_datetime(df['fecha_turno']))
+    if not df.empty:
+        calendario = construir_calendario(int(df['fecha_turno'].dt.year.min()), int(df['fecha_turno'].dt.year.max()))
+        df = df.merge(calendario[['fecha', 'nombre_dia']], left_on='fecha_turno', right_on='fecha', how='left')
+    else:
+        df = df.assign(nombre_dia=pd.Series(dtype=object))
+    # Orden de turnos según la configuración, no alfabético
+    df['orden_turno'] = df['turno'].map({nombre: i for i, nombre in enumerate(CALENDARIO_TURNOS.nombres)})
+    df = df.sort_values(['fecha_turno', 'orden_turno', 'CODIGO'])
+    return pd.DataFrame({
+        'Fecha': df['fecha_turno'].dt.date,
+        'Dia': df['nombre_dia'].astype(str),
+        'Turno': df['turno'],
+        'CODIGO': df['CODIGO'],
+        'KgEmbutidos': df['kg_embutidos'].round(2),
+        'Saucissos': df['total_embalajes'].round(0),
+        'PesoPromedio': (df['peso_suma'] / df['cantidad']).round(2),
+        'Pesajes': df['cantidad'].astype(int),
+    }).reset_index(drop=True)
+
+def reporte_turno(fecha_turno, turno):
+    """
+    Reporte por código de un turno. Los turnos cerrados se guardan calculados y solo
+    se recalculan si la ingesta incorpora pesajes tardíos de ese turno.
+    """
+    clave = (pd.Timestamp(fecha_turno).normalize(), turno)
+    with _lock_reportes:
+        if clave in _reportes_cerrados:
+            return _reportes_cerrados[clave]
+    df = consultar_turnos(clave[0], clave[0] + timedelta(days=1))
+    df = df[df['Turno'] == turno].reset_index(drop=True)
+    if turno_cerrado(clave[0], turno):
+        with _lock_reportes:
+            _reportes_cerrados[clave] = df
+    return df
+
+def turno_actual(ahora=None):
+    """(fecha_turno, turno) en curso"""
+    return CALENDARIO_TURNOS.turno_de(ahora or datetime.now())
+
+def turno_anterior(fecha_turno, turno):
+    """(fecha_turno, turno) del turno que termina cuando empieza el indicado"""
+    inicio, _ = CALENDARIO_TURNOS.limites(fecha_turno, turno)
+    return CALENDARIO_TURNOS.turno_de(inicio - timedelta(minutes=1))
+
+def proximo_cambio_turno(ahora=None):
+    """Próximo inicio de turno posterior a ahora"""
+    ahora = pd.Timestamp(ahora or datetime.now())
+    inicios = [
+        ahora.normalize() + timedelta(days=dias, minutes=_minuto(turno["inicio"]))
+        for dias in (0, 1) for turno in CALENDARIO_TURNOS.turnos
+    ]
+    return min(inicio for inicio in inicios if inicio > ahora)